@@ -0,0 +1,102 @@
+"""
+Caches of the pages and reports that are computed from the certified runs
+"""
+import hashlib
+
+from django.core.cache import caches
+
+
+class ReportCache:
+    """
+    Caches rendered reports (e.g. the panels of the shift leader page) per filter
+    signature in the Django cache framework.
+
+    Every key contains the current version of the certifications, which is
+    incremented whenever a certification, type, reference run or problem
+    category changes (see ReportCache.invalidate), so outdated reports are never
+    served. The version is stored in the database (see ReportVersion), so it is
+    shared by all processes even if the cache itself is not (e.g. LocMemCache).
+
+    Example:
+    >>> cache = ReportCache("shiftleader-panel")
+    >>> cache.get_or_set(["summary", filter_signature(request.GET)], render)
+    '<h3>Summary</h3>...'
+
+    :param prefix: namespace of the cached values, e.g. "summary"
+    :param timeout: timeout in seconds, limits how long values that depend on
+    something else than the certifications (e.g. the Run Registry) are cached
+    :param cache_alias: alias of the Django cache in the CACHES setting
+    """
+
+    KEY_PREFIX = "certhelper"
+
+    def __init__(self, prefix, timeout=600, cache_alias="default"):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def version():
+        """
+        :return: current version of the certifications
+        """
+        from certhelper.models import ReportVersion
+
+        return str(ReportVersion.objects.current())
+
+    @staticmethod
+    def invalidate():
+        """
+        Invalidates all cached reports of all processes by incrementing the
+        version of the certifications
+        """
+        from certhelper.models import ReportVersion
+
+        ReportVersion.objects.increment()
+
+    def make_key(self, parts):
+        digest = hashlib.md5(repr(list(parts)).encode("utf-8")).hexdigest()
+        return "{}:{}:{}:{}".format(
+            self.KEY_PREFIX, self.prefix, self.version(), digest
+        )
+
+    def get(self, parts):
+        """
+        :param parts: list of the values that the report depends on
+        :return: cached report or None
+        """
+        return self.cache.get(self.make_key(parts))
+
+    def set(self, parts, value):
+        self.cache.set(self.make_key(parts), value, self.timeout)
+
+    def get_or_set(self, parts, compute):
+        """
+        :param parts: list of the values that the report depends on
+        :param compute: function without arguments that computes the report
+        :return: cached or newly computed report
+        """
+        value = self.get(parts)
+        if value is None:
+            value = compute()
+            self.set(parts, value)
+        return value
+
+
+def filter_signature(query_dict, ignore=("page", "sort", "per_page")):
+    """
+    Signature of the filter parameters of a request, which does not depend on
+    the order of the parameters and ignores the pagination and sorting of tables
+
+    >>> filter_signature(QueryDict("date__lte=2018-06-17&date__gte=2018-06-11"))
+    (('date__gte', ('2018-06-11',)), ('date__lte', ('2018-06-17',)))
+    """
+    return tuple(
+        (key, tuple(sorted(value for value in values if value)))
+        for key, values in sorted(query_dict.lists())
+        if key not in ignore and any(values)
+    )
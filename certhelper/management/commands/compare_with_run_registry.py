@@ -0,0 +1,45 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from certhelper.models import RunInfo, RunRegistryComparison
+from runregistry.client import TrackerRunRegistryClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the certified runs with the Run Registry and stores the results, "
+        "which are shown on the list of certified runs. Compares the runs that "
+        "have not been compared yet and the runs whose comparison is older than "
+        "--max-age minutes, e.g. as a cron job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=60,
+            help="compare runs again if their comparison is older (in minutes)",
+        )
+        parser.add_argument(
+            "--all", action="store_true", help="compare all certified runs"
+        )
+
+    def handle(self, *args, **options):
+        if not TrackerRunRegistryClient().is_available():
+            raise CommandError("Run Registry is unavailable.")
+
+        runs = RunInfo.objects.all()
+        if not options["all"]:
+            since = timezone.now() - datetime.timedelta(minutes=options["max_age"])
+            runs = runs.not_compared_with_run_registry(since=since)
+
+        compared = RunRegistryComparison.objects.refresh(runs)
+        mismatches = RunInfo.objects.all().run_registry_mismatches().count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Compared {} certified runs, {} runs do not match the Run "
+                "Registry".format(compared, mismatches)
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from certhelper.models import FlagChangedRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the index of runs whose certifications have different flags "
+        "(e.g. good in Express and bad in Prompt) from all certified runs."
+    )
+
+    def handle(self, *args, **options):
+        number_of_runs = FlagChangedRun.objects.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Indexed {} runs with changed flags".format(number_of_runs)
+            )
+        )
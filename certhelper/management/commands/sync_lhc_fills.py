@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from certhelper.models import RunInfo, LHCFill
+from runregistry.client import TrackerRunRegistryClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores the LHC fills of the certified runs whose fill is not known yet, "
+        "which are shown in the shift leader report, e.g. as a cron job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recheck",
+            action="store_true",
+            help="also ask again for the runs that have been stored without fill",
+        )
+
+    def handle(self, *args, **options):
+        if not TrackerRunRegistryClient().is_available():
+            raise CommandError("Run Registry is unavailable.")
+
+        stored = LHCFill.objects.sync(RunInfo.objects.all(), options["recheck"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Stored the fills of {} runs, {} fills are known".format(
+                    stored, LHCFill.objects.count()
+                )
+            )
+        )
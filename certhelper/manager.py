@@ -1,9 +1,13 @@
 from decimal import Decimal
 
-from django.db import models
+import threading
 
+from django.db import models, transaction, connections
+from django.utils import timezone
+
+from certhelper.cache import ReportCache
 from certhelper.query import SoftDeletionQuerySet, RunInfoQuerySet
-from certhelper.utilities.utilities import uniquely_sorted
+from certhelper.utilities.utilities import uniquely_sorted, chunks
 
 
 class SoftDeletionManager(models.Manager):
@@ -43,6 +47,9 @@ class RunInfoManager(SoftDeletionManager):
             return RunInfoQuerySet(self.model).filter(deleted_at=None)
         return RunInfoQuerySet(self.model)
 
+    def with_relations(self):
+        return self.get_queryset().with_relations()
+
     def good(self):
         return RunInfoQuerySet(self.model).good()
 
@@ -50,78 +57,64 @@ class RunInfoManager(SoftDeletionManager):
         return RunInfoQuerySet(self.model).bad()
 
     def check_if_certified(self, list_of_run_numbers):
+        """
+        Checks the certification of the given runs in Express and Prompt
+
+        All certifications are fetched with a single query, the classification
+        is done with set operations.
+
+        :param list_of_run_numbers: list of run numbers (ints or strings)
+        :return: dictionary with the sorted run numbers that are "missing" and
+        the run numbers per run type ("collisions", "cosmics"), which are
+        "good", "bad", "prompt_missing", "changed_good" and "changed_bad"
+        """
         list_of_run_numbers = uniquely_sorted(list_of_run_numbers)
 
         # TODO use self.get_queryset() instead of RunInfoQuerySet(self.model).filter
         runs = RunInfoQuerySet(self.model).filter(deleted_at=None)
-        runs = runs.filter(run_number__in=list_of_run_numbers).annotate_status()
-
-        def do_check(runs):
-            flags = {
-                "good": [],
-                "bad": [],
-                "missing": [],
-                "prompt_missing": [],
-                "changed_good": [],  # Express Bad -> Prompt Good
-                "changed_bad": [],  # Express Good -> Prompt Bad
-            }
-
-            prompt_runs = runs.prompt()
-            good_runs = prompt_runs.good()
-            bad_runs = prompt_runs.bad()
-
-            flags["good"] = good_runs.run_numbers()
-            flags["bad"] = bad_runs.run_numbers()
-
-            non_missing_prompt_run_numbers = [
-                run["run_number"] for run in prompt_runs
-                    .order_by("run_number")
-                    .values("run_number")
-                    .distinct()
-            ]
-
-            non_missing_run_numbers = [
-                run["run_number"] for run in runs
-                    .order_by("run_number")
-                    .values("run_number")
-                    .distinct()
-            ]
-
-            flags["prompt_missing"] = list(
-                set(non_missing_run_numbers) - set(non_missing_prompt_run_numbers))
+        rows = (
+            runs.filter(run_number__in=list_of_run_numbers)
+            .annotate_status()
+            .order_by()
+            .values_list("run_number", "runtype", "reco", "status")
+        )
 
-            express_runs = runs.express().filter(run_number__in=non_missing_run_numbers)
-            good_express = express_runs.good().run_numbers()
-            bad_express = express_runs.bad().run_numbers()
+        run_numbers = {}
+        for run_number, runtype, reco, status in rows:
+            run_numbers.setdefault((runtype, reco, status), set()).add(run_number)
+            run_numbers.setdefault(runtype, set()).add(run_number)
 
-            for run in good_express:
-                if run in flags["bad"]:
-                    flags["bad"].remove(run)
-                    flags["changed_bad"].append(run)
+        def do_check(runtype):
+            def get(reco, status):
+                return run_numbers.get((runtype, reco, status), set())
 
-            for run in bad_express:
-                if run in flags["good"]:
-                    flags["good"].remove(run)
-                    flags["changed_good"].append(run)
+            prompt_good = get("Prompt", "good")
+            prompt_bad = get("Prompt", "bad")
+            changed_good = prompt_good & get("Express", "bad")  # Express Bad -> Prompt Good
+            changed_bad = prompt_bad & get("Express", "good")  # Express Good -> Prompt Bad
 
-            for d in flags.values():
-                d.sort()
-            return flags
+            flags = {
+                "good": prompt_good - changed_good,
+                "bad": prompt_bad - changed_bad,
+                "missing": set(),
+                "prompt_missing": run_numbers.get(runtype, set())
+                - prompt_good
+                - prompt_bad,
+                "changed_good": changed_good,
+                "changed_bad": changed_bad,
+            }
+            return {key: sorted(value) for key, value in flags.items()}
 
         check_dictionary = {
-            "collisions": do_check(runs.collisions()),
-            "cosmics": do_check(runs.cosmics())
+            "collisions": do_check("Collisions"),
+            "cosmics": do_check("Cosmics"),
         }
 
-        non_missing_run_numbers = []
-
-        for key, dic in check_dictionary.items():
-            for key, value in dic.items():
-                for run_number in value:
-                    non_missing_run_numbers.append(run_number)
-
-        check_dictionary["missing"] = list(
-            (set(list_of_run_numbers) - set(non_missing_run_numbers))
+        non_missing_run_numbers = run_numbers.get("Collisions", set()) | run_numbers.get(
+            "Cosmics", set()
+        )
+        check_dictionary["missing"] = sorted(
+            set(list_of_run_numbers) - non_missing_run_numbers
         )
 
         return check_dictionary
@@ -207,3 +200,288 @@ class RunInfoManager(SoftDeletionManager):
         except RunInfo.DoesNotExist:
             # No counterpart means no mismatch
             return {}
+
+
+class FlagChangedRunManager(models.Manager):
+    # number of run numbers that are refreshed with one query
+    REFRESH_CHUNK_SIZE = 500
+
+    @staticmethod
+    def _find_flag_changes(runs):
+        """
+        :param runs: RunInfoQuerySet of the certifications to be considered
+        :return: dictionary run number -> date from which on the run has
+        certifications with different statuses
+        """
+        rows = (
+            runs.annotate_status()
+            .order_by("run_number", "date")
+            .values_list("run_number", "date", "status")
+        )
+        return FlagChangedRunManager.find_flag_changes_in_rows(rows)
+
+    @staticmethod
+    def find_flag_changes_in_rows(rows):
+        """
+        Also used by the migration that creates the index
+
+        :param rows: (run number, date, status) ordered by run number and date
+        :return: dictionary run number -> date from which on the run has
+        certifications with different statuses
+        """
+        changed_on = {}
+        statuses = {}
+        for run_number, date, status in rows:
+            run_statuses = statuses.setdefault(run_number, set())
+            run_statuses.add(status)
+            if len(run_statuses) > 1 and run_number not in changed_on:
+                changed_on[run_number] = date
+        return changed_on
+
+    def refresh(self, run_numbers):
+        """
+        Recomputes the index entries of the given run numbers from all
+        certifications that are not deleted
+        """
+        from .models import RunInfo
+
+        for chunk in chunks(sorted(set(run_numbers)), self.REFRESH_CHUNK_SIZE):
+            changed_on = self._find_flag_changes(
+                RunInfo.objects.filter(run_number__in=chunk)
+            )
+            with transaction.atomic():
+                self.filter(run_number__in=chunk).delete()
+                self.bulk_create(
+                    self.model(run_number=run_number, changed_on=date)
+                    for run_number, date in changed_on.items()
+                )
+
+    @transaction.atomic
+    def rebuild(self):
+        """
+        Recomputes the whole index from all certifications that are not deleted
+
+        :return: number of runs where the flag changed
+        """
+        from .models import RunInfo
+
+        changed_on = self._find_flag_changes(RunInfo.objects.all())
+        self.all().delete()
+        self.bulk_create(
+            self.model(run_number=run_number, changed_on=date)
+            for run_number, date in changed_on.items()
+        )
+        return len(changed_on)
+
+
+class RunRegistryComparisonManager(models.Manager):
+    # only one comparison is run in the background at a time
+    _background_lock = threading.Lock()
+
+    def refresh(self, runs):
+        """
+        Compares the certifications with the Run Registry and stores the results.
+        Certifications that could not be compared (Run Registry unavailable)
+        keep their previous result.
+
+        :param runs: RunInfoQuerySet of the certifications to be compared
+        :return: number of compared certifications
+        """
+        keys = runs.RUN_REGISTRY_COMPARISON_KEYS
+        diff, failed_run_numbers = runs.diff_with_run_registry()
+        deviating = {run for run, corresponding in diff}
+
+        checked_at = timezone.now()
+        comparisons = [
+            self.model(
+                run_info_id=row[0],
+                matches=tuple(row[1:]) not in deviating,
+                checked_at=checked_at,
+            )
+            for row in runs.values_list("pk", *keys)
+            if row[1] not in failed_run_numbers
+        ]
+
+        with transaction.atomic():
+            self.filter(
+                run_info_id__in=[comparison.run_info_id for comparison in comparisons]
+            ).delete()
+            self.bulk_create(comparisons)
+        return len(comparisons)
+
+    def refresh_in_background(self, runs):
+        """
+        Runs refresh in a background thread, unless another comparison is
+        still running
+
+        :return: True if the comparison has been started
+        """
+        from .models import RunInfo
+
+        # evaluated before the lock is taken, a failing query must not keep it
+        pks = list(runs.values_list("pk", flat=True))
+
+        if not self._background_lock.acquire(blocking=False):
+            return False
+
+        def refresh():
+            try:
+                self.refresh(RunInfo.objects.filter(pk__in=pks))
+            finally:
+                # database connections are per thread and would stay open
+                connections.close_all()
+                self._background_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+        return True
+
+
+class RunFillNumberManager(models.Manager):
+    # number of run numbers that are asked from the Run Registry at once
+    FETCH_CHUNK_SIZE = 500
+
+    def fetch(self, run_numbers):
+        """
+        Asks the Run Registry for the fill numbers of the given runs and
+        stores them. Runs that are unknown to the Run Registry are stored
+        without fill, like runs without beam, so they are not asked again
+        (see LHCFill.objects.sync to check them again). Nothing is stored for
+        the runs that could not be asked because the Run Registry is
+        unavailable.
+
+        :return: number of runs whose fill has been stored
+        """
+        from runregistry.client import (
+            TrackerRunRegistryClient,
+            RunRegistryUnavailableError,
+        )
+
+        from .models import LHCFill
+
+        client = TrackerRunRegistryClient()
+        stored = 0
+        for chunk in chunks(uniquely_sorted(run_numbers), self.FETCH_CHUNK_SIZE):
+            try:
+                fills = client.get_fill_number_by_run_number(chunk)
+            except RunRegistryUnavailableError:
+                break
+            with transaction.atomic():
+                for fill_number in {fill["fill_number"] for fill in fills}:
+                    if fill_number is not None:
+                        LHCFill.objects.get_or_create(fill_number=fill_number)
+                # the same runs might have been stored by another request meanwhile
+                self.filter(run_number__in=chunk).delete()
+                fill_numbers = {
+                    fill["run_number"]: fill["fill_number"] for fill in fills
+                }
+                self.bulk_create(
+                    self.model(
+                        run_number=run_number, fill_id=fill_numbers.get(run_number)
+                    )
+                    for run_number in chunk
+                )
+            stored += sum(
+                fill_number is not None for fill_number in fill_numbers.values()
+            )
+        return stored
+
+    def _stored(self, run_numbers):
+        fills = {}
+        for chunk in chunks(run_numbers, self.FETCH_CHUNK_SIZE):
+            fills.update(
+                self.filter(run_number__in=chunk).values_list("run_number", "fill")
+            )
+        return fills
+
+    def resolve(self, run_numbers):
+        """
+        Looks up the fill numbers of the given runs. Only runs that have not
+        been stored yet are asked from the Run Registry.
+
+        :return: dictionary run number -> fill number, which is None for runs
+        without fill or unknown to the Run Registry
+        """
+        run_numbers = uniquely_sorted(run_numbers)
+        fills = self._stored(run_numbers)
+        missing = [run_number for run_number in run_numbers if run_number not in fills]
+        if missing and self.fetch(missing):
+            fills.update(self._stored(missing))
+        return {run_number: fills.get(run_number) for run_number in run_numbers}
+
+
+class LHCFillManager(models.Manager):
+    # only one sync is run in the background at a time
+    _background_lock = threading.Lock()
+
+    def sync(self, runs, recheck=False):
+        """
+        Stores the fills of the certified runs whose fill is not known yet.
+        Cached reports are invalidated if new fills have been stored.
+
+        :param runs: RunInfoQuerySet
+        :param recheck: also ask again for the runs that have been stored
+        without fill, e.g. because they were unknown to the Run Registry
+        :return: number of runs whose fill has been stored
+        """
+        return self._sync_run_numbers(self._run_numbers_to_sync(runs, recheck))
+
+    @staticmethod
+    def _run_numbers_to_sync(runs, recheck=False):
+        from .models import RunFillNumber
+
+        run_numbers = runs.without_fill_number().run_numbers()
+        if recheck:
+            without_fill = RunFillNumber.objects.filter(fill=None).values("run_number")
+            run_numbers += runs.filter(run_number__in=without_fill).run_numbers()
+        return run_numbers
+
+    def _sync_run_numbers(self, run_numbers):
+        from .models import RunFillNumber
+
+        stored = RunFillNumber.objects.fetch(run_numbers)
+        if stored:
+            ReportCache.invalidate()
+        return stored
+
+    def sync_in_background(self, runs):
+        """
+        Runs sync in a background thread, unless another sync is still running
+
+        :return: True if the sync has been started
+        """
+        # evaluated before the lock is taken, a failing query must not keep it
+        run_numbers = self._run_numbers_to_sync(runs)
+
+        if not self._background_lock.acquire(blocking=False):
+            return False
+
+        def sync():
+            try:
+                self._sync_run_numbers(run_numbers)
+            finally:
+                # database connections are per thread and would stay open
+                connections.close_all()
+                self._background_lock.release()
+
+        threading.Thread(target=sync, daemon=True).start()
+        return True
+
+
+class ReportVersionManager(models.Manager):
+    # primary key of the single row that holds the version
+    PK = 1
+
+    def current(self):
+        """
+        :return: current version of the certifications
+        """
+        version = self.filter(pk=self.PK).values_list("version", flat=True).first()
+        return version or 0
+
+    def increment(self):
+        """
+        Increments the version with a single update, the row is created by
+        the migration or the first time it is missing
+        """
+        if not self.filter(pk=self.PK).update(version=models.F("version") + 1):
+            self.get_or_create(pk=self.PK, defaults={"version": 1})
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 09:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, Q, QuerySet, Value, When
+
+
+def build_index(apps, schema_editor):
+    """
+    Indexes the runs whose certifications have different flags like
+    FlagChangedRun.objects.rebuild(), the status is not stored yet
+
+    The logic is copied here, the migration must not depend on the current
+    application code.
+    """
+    RunInfo = apps.get_model("certhelper", "RunInfo")
+    FlagChangedRun = apps.get_model("certhelper", "FlagChangedRun")
+
+    good_criteria = ("Good", "Lowstat")
+    good = (
+        (Q(type__runtype="Cosmics") | Q(pixel__in=good_criteria))
+        & Q(sistrip__in=good_criteria)
+        & Q(tracking__in=good_criteria)
+    )
+    rows = (
+        QuerySet(RunInfo)
+        .filter(deleted_at=None)
+        .annotate(
+            status=Case(
+                When(good, then=Value("good")),
+                default=Value("bad"),
+                output_field=CharField(),
+            )
+        )
+        .order_by("run_number", "date")
+        .values_list("run_number", "date", "status")
+    )
+    # date of the first certification whose status differs from the others
+    changed_on = {}
+    statuses = {}
+    for run_number, date, status in rows.iterator():
+        run_statuses = statuses.setdefault(run_number, set())
+        run_statuses.add(status)
+        if len(run_statuses) > 1 and run_number not in changed_on:
+            changed_on[run_number] = date
+
+    QuerySet(FlagChangedRun).bulk_create(
+        FlagChangedRun(run_number=run_number, changed_on=date)
+        for run_number, date in changed_on.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0019_auto_20181114_1120'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlagChangedRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_number', models.PositiveIntegerField(unique=True)),
+                ('changed_on', models.DateField(db_index=True)),
+            ],
+            options={
+                'ordering': ('run_number',),
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 09:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Q, QuerySet
+
+
+def backfill_status(apps, schema_editor):
+    """
+    Copies runtype and reco from the Type and computes the status of all runs,
+    including the deleted ones
+
+    Plain querysets are used, so that neither deleted runs are skipped nor the
+    side effects of the RunInfoQuerySet (e.g. the report cache) are triggered.
+    """
+    RunInfo = apps.get_model("certhelper", "RunInfo")
+    Type = apps.get_model("certhelper", "Type")
+
+    for run_type in QuerySet(Type):
+        QuerySet(RunInfo).filter(type=run_type).update(
+            runtype=run_type.runtype, reco=run_type.reco
+        )
+
+    good_criteria = ("Good", "Lowstat")
+    good = (
+        (Q(runtype="Cosmics") | Q(pixel__in=good_criteria))
+        & Q(sistrip__in=good_criteria)
+        & Q(tracking__in=good_criteria)
+    )
+    QuerySet(RunInfo).filter(good).update(status="good")
+    QuerySet(RunInfo).exclude(good).update(status="bad")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0020_flagchangedrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runinfo',
+            name='reco',
+            field=models.CharField(choices=[('Express', 'Express'), ('Prompt', 'Prompt'), ('reReco', 'reReco')], db_index=True, default='', editable=False, max_length=30),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='runinfo',
+            name='runtype',
+            field=models.CharField(choices=[('Cosmics', 'Cosmics'), ('Collisions', 'Collisions')], db_index=True, default='', editable=False, max_length=30),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='runinfo',
+            name='status',
+            field=models.CharField(choices=[('good', 'good'), ('bad', 'bad')], db_index=True, default='', editable=False, max_length=4),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
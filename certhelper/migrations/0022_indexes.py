@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# Partial indexes on the objects that are not deleted, which is what the
+# SoftDeletionManager filters for. Django 1.11 can not declare partial
+# indexes in Meta.indexes, so they are created with raw SQL for PostgreSQL.
+PARTIAL_INDEXES = [
+    (
+        "runinfo_alive_run_number_idx",
+        "certhelper_runinfo",
+        "run_number",
+        "deleted_at IS NULL",
+    ),
+    (
+        "runinfo_alive_date_idx",
+        "certhelper_runinfo",
+        "date, run_number",
+        "deleted_at IS NULL",
+    ),
+    (
+        "runinfo_alive_userid_date_idx",
+        "certhelper_runinfo",
+        "userid_id, date",
+        "deleted_at IS NULL",
+    ),
+    (
+        "runinfo_dead_idx",
+        "certhelper_runinfo",
+        "deleted_at",
+        "deleted_at IS NOT NULL",
+    ),
+    (
+        "type_alive_runtype_reco_idx",
+        "certhelper_type",
+        "runtype, reco",
+        "deleted_at IS NULL",
+    ),
+    (
+        "referencerun_alive_idx",
+        "certhelper_referencerun",
+        "runtype, reco",
+        "deleted_at IS NULL",
+    ),
+]
+
+
+def create_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, table, columns, condition in PARTIAL_INDEXES:
+        schema_editor.execute(
+            "CREATE INDEX {} ON {} ({}) WHERE {}".format(name, table, columns, condition)
+        )
+
+
+def drop_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, table, columns, condition in PARTIAL_INDEXES:
+        schema_editor.execute("DROP INDEX IF EXISTS {}".format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0021_runinfo_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='referencerun',
+            index=models.Index(fields=['runtype', 'reco'], name='referencerun_runtype_reco_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runinfo',
+            index=models.Index(fields=['run_number'], name='runinfo_run_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runinfo',
+            index=models.Index(fields=['date', 'run_number'], name='runinfo_date_run_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runinfo',
+            index=models.Index(fields=['userid', 'date'], name='runinfo_userid_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runinfo',
+            index=models.Index(fields=['type', 'run_number'], name='runinfo_type_run_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='type',
+            index=models.Index(fields=['runtype', 'reco'], name='type_runtype_reco_idx'),
+        ),
+        migrations.RunPython(create_partial_indexes, drop_partial_indexes),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 09:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0022_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunRegistryComparison',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matches', models.BooleanField()),
+                ('checked_at', models.DateTimeField(db_index=True)),
+                ('run_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='run_registry_comparison', to='certhelper.RunInfo')),
+            ],
+        ),
+    ]
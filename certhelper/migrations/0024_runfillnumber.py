@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 10:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0023_runregistrycomparison'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunFillNumber',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_number', models.PositiveIntegerField(unique=True)),
+                ('fill_number', models.PositiveIntegerField(db_index=True, null=True)),
+            ],
+            options={
+                'ordering': ('run_number',),
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fills(apps, schema_editor):
+    """
+    Creates the LHCFill of every fill number that is already stored
+    """
+    LHCFill = apps.get_model("certhelper", "LHCFill")
+    RunFillNumber = apps.get_model("certhelper", "RunFillNumber")
+    fill_numbers = (
+        RunFillNumber.objects.exclude(fill_number=None)
+        .order_by("fill_number")
+        .values_list("fill_number", flat=True)
+        .distinct()
+    )
+    LHCFill.objects.bulk_create(
+        LHCFill(fill_number=fill_number) for fill_number in fill_numbers
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0024_runfillnumber'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LHCFill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fill_number', models.PositiveIntegerField(unique=True)),
+            ],
+            options={
+                'ordering': ('fill_number',),
+            },
+        ),
+        migrations.RunPython(create_fills, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='runfillnumber',
+            old_name='fill_number',
+            new_name='fill',
+        ),
+        migrations.AlterField(
+            model_name='runfillnumber',
+            name='fill',
+            field=models.ForeignKey(db_column='fill_number', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='certhelper.LHCFill', to_field='fill_number'),
+        ),
+    ]
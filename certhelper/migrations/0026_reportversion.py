@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 10:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    """
+    Creates the single row that holds the version of the certifications
+    """
+    ReportVersion = apps.get_model("certhelper", "ReportVersion")
+    ReportVersion.objects.create(pk=1, version=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certhelper', '0025_lhcfill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
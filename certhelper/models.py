@@ -22,11 +22,21 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
-from certhelper.manager import SoftDeletionManager, RunInfoManager
+from certhelper.manager import (
+    SoftDeletionManager,
+    RunInfoManager,
+    FlagChangedRunManager,
+    RunRegistryComparisonManager,
+    RunFillNumberManager,
+    LHCFillManager,
+    ReportVersionManager,
+)
+from certhelper.query import RunInfoQuerySet
 from certhelper.utilities.logger import get_configured_logger
 from certhelper.utilities.utilities import (
     get_full_name,
     get_highest_privilege_from_egroup_list,
+    get_run_status,
     extract_egroups,
     get_or_create_shift_leader_group,
 )
@@ -236,6 +246,9 @@ class Type(SoftDeletionModel):
             "beamenergy",
             "dataset",
         ]
+        indexes = [
+            models.Index(fields=["runtype", "reco"], name="type_runtype_reco_idx")
+        ]
 
     def __str__(self):
         return (
@@ -252,6 +265,13 @@ class Type(SoftDeletionModel):
             + str(self.dataset)
         )
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(Type, self).save(*args, **kwargs)
+        if not created:
+            # runtype and reco are also stored in the RunInfo
+            RunInfo.all_objects.filter(type=self).refresh_status()
+
 
 # ReferenceRun that should only be added by shift-leaders / staff
 class ReferenceRun(SoftDeletionModel):
@@ -273,6 +293,11 @@ class ReferenceRun(SoftDeletionModel):
             "beamenergy",
             "dataset",
         ]
+        indexes = [
+            models.Index(
+                fields=["runtype", "reco"], name="referencerun_runtype_reco_idx"
+            )
+        ]
         ordering = ("-reference_run", "runtype", "reco")
 
     def __str__(self):
@@ -322,8 +347,33 @@ class RunInfo(SoftDeletionModel):
     date = models.DateField()
     problem_categories = models.ManyToManyField("categories.Category", blank=True)
 
+    STATUS_CHOICES = (("good", "good"), ("bad", "bad"))
+    # copies of type.runtype and type.reco and the status computed from the
+    # flags, stored to avoid joins and CASE expressions (see denormalize)
+    runtype = models.CharField(
+        max_length=30, choices=RUNTYPE_CHOICES, db_index=True, editable=False
+    )
+    reco = models.CharField(
+        max_length=30, choices=RECO_CHOICES, db_index=True, editable=False
+    )
+    status = models.CharField(
+        max_length=4, choices=STATUS_CHOICES, db_index=True, editable=False
+    )
+
     class Meta:
         ordering = ("-run_number",)
+        # partial indexes on the runs that are not deleted (deleted_at IS NULL)
+        # are added for PostgreSQL in migration 0022
+        indexes = [
+            models.Index(fields=["run_number"], name="runinfo_run_number_idx"),
+            models.Index(
+                fields=["date", "run_number"], name="runinfo_date_run_number_idx"
+            ),
+            models.Index(fields=["userid", "date"], name="runinfo_userid_date_idx"),
+            models.Index(
+                fields=["type", "run_number"], name="runinfo_type_run_number_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -358,13 +408,15 @@ class RunInfo(SoftDeletionModel):
     def is_bad(self):
         return not self.is_good
 
-    @property
-    def runtype(self):
-        return self.type.runtype
-
-    @property
-    def reco(self):
-        return self.type.reco
+    def denormalize(self):
+        """
+        Updates the stored runtype, reco and status from the type and the flags
+        """
+        self.runtype = self.type.runtype
+        self.reco = self.type.reco
+        self.status = get_run_status(
+            self.runtype, self.pixel, self.sistrip, self.tracking
+        )
 
     def validate_unique(self, exclude=None):
         if not self.type_id:
@@ -394,8 +446,35 @@ class RunInfo(SoftDeletionModel):
 
     def save(self):
         self.validate_unique()
+        # fields that are compared with the Run Registry, run_number comes first
+        compared_fields = ["run_number"] + sorted(
+            RunInfoQuerySet.RUN_REGISTRY_FIELDS - {"run_number", "type"}
+        )
+        previous = None
+        if self.pk:
+            previous = (
+                RunInfo.all_objects.filter(pk=self.pk)
+                .values_list(*compared_fields)
+                .first()
+            )
+        self.denormalize()
         super(RunInfo, self).save()
 
+        # the run number might have been edited
+        run_numbers = {self.run_number}
+        if previous:
+            run_numbers.add(previous[0])
+        FlagChangedRun.objects.refresh(run_numbers)
+
+        current = tuple(getattr(self, field) for field in compared_fields)
+        if previous and previous != current:
+            # the stored comparison is outdated
+            RunRegistryComparison.objects.filter(run_info=self).delete()
+
+    def hard_delete(self):
+        super(RunInfo, self).hard_delete()
+        FlagChangedRun.objects.refresh([self.run_number])
+
     def print(self):
         print("Run number: {}".format(self.run_number))
         print("Type: {}".format(self.type))
@@ -408,6 +487,114 @@ class RunInfo(SoftDeletionModel):
         print("Tracking: {} {}".format(self.tracking, self.tracking_lowstat))
 
 
+class FlagChangedRun(models.Model):
+    """
+    Index of the run numbers whose certifications have different statuses,
+    e.g. good in Express and bad in Prompt (see filter_flag_changed)
+
+    Kept up to date when a RunInfo is saved, deleted or restored.
+    Rebuild it with: python manage.py rebuild_flag_changed_index
+    """
+
+    objects = FlagChangedRunManager()
+
+    run_number = models.PositiveIntegerField(unique=True)
+    # date of the first certification that differs from an earlier one
+    changed_on = models.DateField(db_index=True)
+
+    class Meta:
+        ordering = ("run_number",)
+
+    def __str__(self):
+        return "{} (changed on {})".format(self.run_number, self.changed_on)
+
+
+class ReportVersion(models.Model):
+    """
+    Version of the certifications that the cached reports depend on (see
+    ReportCache). It is kept in the database, so that a change in one process
+    invalidates the cached reports of all processes.
+    """
+
+    objects = ReportVersionManager()
+
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.version)
+
+
+class RunRegistryComparison(models.Model):
+    """
+    Result of the last comparison of a certification with the Run Registry,
+    so that pages can show mismatching runs without waiting for the Run Registry.
+
+    Removed when the compared fields of the certification change.
+    Refresh it with: python manage.py compare_with_run_registry
+    """
+
+    objects = RunRegistryComparisonManager()
+
+    run_info = models.OneToOneField(
+        RunInfo, on_delete=models.CASCADE, related_name="run_registry_comparison"
+    )
+    matches = models.BooleanField()
+    checked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "{} {} the Run Registry (checked at {})".format(
+            self.run_info_id,
+            "matches" if self.matches else "does not match",
+            self.checked_at,
+        )
+
+
+class LHCFill(models.Model):
+    """
+    LHC fill that certified runs belong to, see RunFillNumber
+    """
+
+    objects = LHCFillManager()
+
+    fill_number = models.PositiveIntegerField(unique=True)
+
+    class Meta:
+        ordering = ("fill_number",)
+
+    def __str__(self):
+        return str(self.fill_number)
+
+
+class RunFillNumber(models.Model):
+    """
+    LHC fill of a run as given by the Run Registry, which does not change
+    anymore once the run is known. Stored so that the Run Registry is only
+    asked once per run (see RunInfoQuerySet.annotate_fill_number).
+
+    Synced in the background with LHCFill.objects.sync_in_background or with:
+    python manage.py sync_lhc_fills
+    """
+
+    objects = RunFillNumberManager()
+
+    run_number = models.PositiveIntegerField(unique=True)
+    # runs without beam have no fill
+    fill = models.ForeignKey(
+        LHCFill,
+        to_field="fill_number",
+        db_column="fill_number",
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="runs",
+    )
+
+    class Meta:
+        ordering = ("run_number",)
+
+    def __str__(self):
+        return "{} (fill {})".format(self.run_number, self.fill_id)
+
+
 class Checklist(models.Model):
     title = models.CharField(max_length=50, unique=True)
     description = RichTextField(
@@ -1,25 +1,36 @@
 import collections
+from itertools import chain
 
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.db.models import (
     QuerySet,
     Q,
-    Count,
     Sum,
-    FloatField,
     When,
     Case,
     Value,
     CharField,
+    Count,
     Min,
     Max,
+    OuterRef,
+    Subquery,
 )
-from django.db.models.functions import ExtractWeekDay
+from django.dispatch import Signal
 from django.utils import timezone
 
-from certhelper.utilities.utilities import convert_run_registry_to_runinfo, chunks
-from runregistry.client import TrackerRunRegistryClient
+from certhelper.utilities.RunSnapshot import RunSnapshot
+from certhelper.utilities.utilities import (
+    convert_run_registry_to_runinfo,
+    diff_with_run_registry,
+    fetch_in_chunks,
+    chunks,
+)
+from runregistry.client import TrackerRunRegistryClient, RunRegistryUnavailableError
+
+# sent after runs were changed by a queryset write, which bypasses the
+# post_save and post_delete signals
+runs_changed = Signal()
 
 
 class SoftDeletionQuerySet(QuerySet):
@@ -60,162 +71,341 @@ class SoftDeletionQuerySet(QuerySet):
 
 
 class RunInfoQuerySet(SoftDeletionQuerySet):
+    # the resthub api cannot handle more than 1000 elements in the SQL query
+    RUN_REGISTRY_CHUNK_SIZE = 500
+
+    # fields that the stored runtype, reco and status are computed from
+    STATUS_FIELDS = {"type", "type_id", "pixel", "sistrip", "tracking"}
+
+    # fields that are compared with the Run Registry
+    RUN_REGISTRY_COMPARISON_KEYS = [
+        "run_number",
+        "type__runtype",
+        "type__reco",
+        "pixel",
+        "sistrip",
+        "tracking",
+        "pixel_lowstat",
+        "sistrip_lowstat",
+    ]
+    RUN_REGISTRY_FIELDS = STATUS_FIELDS | {
+        "run_number",
+        "pixel_lowstat",
+        "sistrip_lowstat",
+    }
+
     def annotate_status(self):
-        good_criteria = ("Good", "Lowstat")
+        """
+        The status is stored in the status field (see RunInfo.denormalize),
+        kept for backwards compatibility
+        """
+        return self
+
+    def with_relations(self):
+        """
+        Fetches the shifter, type and reference run together with the runs, so
+        that tables which render them for every row need a single query
+
+        :return: QuerySet that selects the related objects in the same query
+        """
+        return self.select_related("userid", "type", "reference_run")
 
-        return self.annotate(
-            status=Case(
-                When(
-                    (Q(type__runtype="Cosmics") | Q(pixel__in=good_criteria))
-                    & Q(sistrip__in=good_criteria)
-                    & Q(tracking__in=good_criteria),
-                    then=Value("good"),
-                ),
-                default=Value("bad"),
-                output_field=CharField(),
+    def refresh_status(self):
+        """
+        Recomputes the stored runtype, reco and status of all runs in the
+        queryset with bulk updates, e.g. after the runtype of a Type changed
+        """
+        from certhelper.models import Type, FlagChangedRun
+
+        good_criteria = ("Good", "Lowstat")
+        pks = list(self.values_list("pk", flat=True))
+
+        for chunk in chunks(pks, 500):
+            runs = RunInfoQuerySet(self.model).filter(pk__in=chunk)
+            type_of_run = Type.all_objects.filter(pk=OuterRef("type_id"))
+            super(RunInfoQuerySet, runs).update(
+                runtype=Subquery(type_of_run.values("runtype")[:1]),
+                reco=Subquery(type_of_run.values("reco")[:1]),
+            )
+            super(RunInfoQuerySet, runs).update(
+                status=Case(
+                    When(
+                        (Q(runtype="Cosmics") | Q(pixel__in=good_criteria))
+                        & Q(sistrip__in=good_criteria)
+                        & Q(tracking__in=good_criteria),
+                        then=Value("good"),
+                    ),
+                    default=Value("bad"),
+                    output_field=CharField(),
+                )
             )
+
+        FlagChangedRun.objects.refresh(
+            RunInfoQuerySet(self.model).filter(pk__in=pks).run_numbers()
         )
 
-    def filter_flag_changed(self, until=None):
+    def update(self, **kwargs):
         """
-        Filters the queryset to all runs where the flag has changed
+        Also refreshes the stored status if the flags or the type are updated
+        and removes the outdated Run Registry comparisons
         """
-        from certhelper.models import RunInfo
+        if self.RUN_REGISTRY_FIELDS.intersection(kwargs):
+            # the stored comparisons are outdated
+            from certhelper.models import RunRegistryComparison
 
-        # Group by unique run_number, status pairs
-        # if a run_number appears more than once, it means that the flag changed
+            RunRegistryComparison.objects.filter(run_info__in=self).delete()
 
-        runs = RunInfo.objects.all()
-        if until:
-            runs = runs.filter(date__lte=until)
-
-        run_number_list = [
-            run["run_number"]
-            for run in runs.annotate_status()
-                .order_by("run_number")
-                .values("run_number", "status")
-                .annotate(times_certified=Count("run_number"))
-        ]
+        if not self.STATUS_FIELDS.intersection(kwargs):
+            rows = super(RunInfoQuerySet, self).update(**kwargs)
+            runs_changed.send(sender=self.model)
+            return rows
 
-        changed_flag_runs = [
-            run
-            for run, count in collections.Counter(run_number_list).items()
-            if count > 1
-        ]
+        pks = list(self.values_list("pk", flat=True))
+        rows = super(RunInfoQuerySet, self).update(**kwargs)
+        RunInfoQuerySet(self.model).filter(pk__in=pks).refresh_status()
+        runs_changed.send(sender=self.model)
+        return rows
 
-        return self.filter(run_number__in=changed_flag_runs)
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        bulk_create bypasses RunInfo.save, so the stored status is computed here
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj.denormalize()
+        created = super(RunInfoQuerySet, self).bulk_create(objs, *args, **kwargs)
+        runs_changed.send(sender=self.model)
+        return created
 
-    def good(self):
-        good_criteria = ("Good", "Lowstat")
+    def filter_flag_changed(self, until=None):
+        """
+        Filters the queryset to all runs where the flag has changed
 
-        return (
-            self.filter(sistrip__in=good_criteria)
-                .filter(tracking__in=good_criteria)
-                .filter(Q(type__runtype="Cosmics") | Q(pixel__in=good_criteria))
-        )
+        Looks the run numbers up in the FlagChangedRun index instead of
+        grouping all certifications by run number and status.
 
-    def bad(self):
-        bad_criteria = ["Bad", "Excluded"]
+        :param until: only consider certifications up to this date
+        """
+        from certhelper.models import FlagChangedRun
+
+        changed_flag_runs = FlagChangedRun.objects.all()
+        if until:
+            changed_flag_runs = changed_flag_runs.filter(changed_on__lte=until)
 
         return self.filter(
-            Q(sistrip__in=bad_criteria)
-            | Q(tracking__in=bad_criteria)
-            | (Q(pixel__in=bad_criteria) & Q(type__runtype="Collisions"))
+            run_number__in=changed_flag_runs.values("run_number")
         )
 
+    def delete(self):
+        run_numbers = self.run_numbers()
+        deleted = super(RunInfoQuerySet, self).delete()
+        self._runs_changed(run_numbers)
+        return deleted
+
+    def hard_delete(self):
+        run_numbers = self.run_numbers()
+        deleted = super(RunInfoQuerySet, self).hard_delete()
+        self._runs_changed(run_numbers)
+        return deleted
+
+    def restore(self):
+        """
+        Also recomputes the stored runtype, reco and status of the restored
+        runs, which may be missing for runs that were deleted before they were
+        stored
+        """
+        pks = list(self.values_list("pk", flat=True))
+        restored = super(RunInfoQuerySet, self).restore()
+        # refresh_status also refreshes the flag change index
+        RunInfoQuerySet(self.model).filter(pk__in=pks).refresh_status()
+        runs_changed.send(sender=self.model)
+        return restored
+
+    def _runs_changed(self, run_numbers):
+        """
+        Refreshes the flag change index and notifies about the changed runs
+        """
+        from certhelper.models import FlagChangedRun
+
+        FlagChangedRun.objects.refresh(run_numbers)
+        runs_changed.send(sender=self.model)
+
+    def good(self):
+        return self.filter(status="good")
+
+    def bad(self):
+        return self.filter(status="bad")
+
     # TODO rename 'type__runtype' to just 'run__type'
     def summary(self):
         """
         Create basic summary with int_luminosity and number_of_ls per type
+        and the list of good and bad run numbers per type.
+
+        All values are computed in a single pass over a single query.
         """
-        summary_dict = (
-            self.order_by("type__runtype", "type__reco")
-                .values("type__runtype", "type__reco")
-                .annotate(
-                runs_certified=Count("pk"),
-                int_luminosity=Sum("int_luminosity", output_field=FloatField()),
-                number_of_ls=Sum("number_of_ls"),
-            )
+        rows = self.order_by("runtype", "reco", "run_number").values_list(
+            "runtype", "reco", "run_number", "int_luminosity", "number_of_ls", "status"
         )
+
+        summary_dict = collections.OrderedDict()
+        for row in rows:
+            runtype, reco, run_number, int_luminosity, number_of_ls, status = row
+            d = summary_dict.get((runtype, reco))
+            if d is None:
+                d = summary_dict[(runtype, reco)] = {
+                    "type__runtype": runtype,
+                    "type__reco": reco,
+                    "runs_certified": 0,
+                    "int_luminosity": 0,
+                    "number_of_ls": 0,
+                    "run_numbers": {"good": [], "bad": []},
+                }
+            d["runs_certified"] += 1
+            d["int_luminosity"] += int_luminosity
+            d["number_of_ls"] += number_of_ls
+            d["run_numbers"][status].append(run_number)
+
+        for d in summary_dict.values():
+            d["int_luminosity"] = float(d["int_luminosity"])
+
+        return list(summary_dict.values())
+
+    def summary_per_day(self):
         """
-        Add List of run_numbers per type to the summary
+        Create summary with int_luminosity, number_of_ls and the classified
+        run numbers (see compare_list_if_certified) per day and type.
+
+        Needs at most two queries, independent of the number of days and types.
         """
-        for d in summary_dict:
-            runs_per_type = self.filter(
-                type__runtype=d.get("type__runtype"), type__reco=d.get("type__reco")
-            ).order_by("run_number")
+        rows = self.order_by("date", "runtype", "reco", "run_number").values_list(
+            "date",
+            "runtype",
+            "reco",
+            "run_number",
+            "int_luminosity",
+            "number_of_ls",
+            "status",
+        )
 
-            good_run_numbers = [r.run_number for r in runs_per_type.good()]
+        summary_dict = collections.OrderedDict()
+        statuses = {}
+        for row in rows:
+            date, runtype, reco, run_number, int_luminosity, number_of_ls, status = row
+            d = summary_dict.get((date, runtype, reco))
+            if d is None:
+                d = summary_dict[(date, runtype, reco)] = {
+                    "date": date,
+                    "type__runtype": runtype,
+                    "type__reco": reco,
+                    "runs_certified": 0,
+                    "int_luminosity": 0,
+                    "number_of_ls": 0,
+                    # same numbering as ExtractWeekDay: 1 = Sunday, 7 = Saturday
+                    "day": date.isoweekday() % 7 + 1,
+                    "run_numbers": [],
+                }
+            d["runs_certified"] += 1
+            d["int_luminosity"] += int_luminosity
+            d["number_of_ls"] += number_of_ls
+            d["run_numbers"].append(run_number)
+            statuses.setdefault(run_number, []).append(status)
+
+        changed_flag_run_numbers = self._changed_flag_run_numbers(statuses)
+        for d in summary_dict.values():
+            d["int_luminosity"] = float(d["int_luminosity"])
+            d["run_numbers"] = self._classify_run_numbers(
+                d["run_numbers"], statuses, changed_flag_run_numbers
+            )
 
-            bad_run_numbers = [r.run_number for r in runs_per_type.bad()]
+        return list(summary_dict.values())
 
-            d.update(
-                {"run_numbers": {"good": good_run_numbers, "bad": bad_run_numbers}}
-            )
+    @staticmethod
+    def _changed_flag_run_numbers(statuses):
+        """
+        Same as filter_flag_changed, but for already loaded statuses
 
-        return summary_dict
+        Only runs that were certified more than once with the same status are
+        looked up in the FlagChangedRun index, with a single query.
 
-    def summary_per_day(self):
-        summary_dict = (
-            self.order_by("date", "type__runtype", "type__reco")
-                .values("date", "type__runtype", "type__reco")
-                .annotate(
-                runs_certified=Count("pk"),
-                int_luminosity=Sum("int_luminosity", output_field=FloatField()),
-                number_of_ls=Sum("number_of_ls"),
-                day=(ExtractWeekDay("date")),
+        :param statuses: dictionary run number -> list of statuses of all
+        certifications of that run in the queryset
+        :return: set of run numbers where the flag changed
+        """
+        from certhelper.models import FlagChangedRun
+
+        changed = {
+            run_number
+            for run_number, run_statuses in statuses.items()
+            if len(set(run_statuses)) > 1
+        }
+        certified_repeatedly = [
+            run_number
+            for run_number, run_statuses in statuses.items()
+            if len(run_statuses) > 1 and run_number not in changed
+        ]
+        if certified_repeatedly:
+            changed.update(
+                FlagChangedRun.objects.filter(
+                    run_number__in=certified_repeatedly
+                ).values_list("run_number", flat=True)
             )
-        )
+        return changed
 
+    @staticmethod
+    def _classify_run_numbers(list_of_run_numbers, statuses, changed_flag_run_numbers):
         """
-        Add List of run_numbers per day and type to the summary
+        :param list_of_run_numbers: run numbers in the order they should be listed
+        :param statuses: dictionary run number -> list of statuses of all
+        certifications of that run in the queryset
+        :param changed_flag_run_numbers: set of run numbers where the flag changed
+        :return: dictionary {"good": [], "bad": [], "missing": [], "different_flags": []}
         """
-        for d in summary_dict:
-            runs = self.filter(
-                date=d.get("date"),
-                type__runtype=d.get("type__runtype"),
-                type__reco=d.get("type__reco"),
-            ).order_by("run_number")
-            run_numbers = [run.run_number for run in runs]
-            d.update({"run_numbers": self.compare_list_if_certified(run_numbers)})
-
-        return summary_dict
+        d = {"good": [], "bad": [], "missing": [], "different_flags": []}
+        for run_number in list_of_run_numbers:
+            try:
+                key = int(run_number)
+            except (TypeError, ValueError):
+                key = None
+            run_statuses = statuses.get(key)
+            if not run_statuses:
+                d["missing"].append(run_number)
+            elif len(run_statuses) > 1 and key in changed_flag_run_numbers:
+                d["different_flags"].append(run_number)
+            else:
+                d[run_statuses[0]].append(run_number)
+        return d
 
     def compare_list_if_certified(self, list_of_run_numbers):
         """
         :param list_of_run_numbers: list of run_numbers e.g. [317696, 123456, 317696, 317696]
         :type list_of_run_numbers: list
         :return: dictionary of run_numbers
-        :rtype: dictionary {"good": [], "bad": [], "missing": [], "conflicting": []}
-        """
-
-        d = {"good": [], "bad": [], "missing": [], "different_flags": []}
-
-        runs = self.annotate_status()
+        :rtype: dictionary {"good": [], "bad": [], "missing": [], "different_flags": []}
 
-        cleaned_run_number_list = [
-            i for i in list_of_run_numbers if type(i) == int or i.isdigit()
-        ]
-
-        changed_flag_runs = runs.filter(
-            run_number__in=cleaned_run_number_list
-        ).filter_flag_changed()
+        Needs at most two queries, independent of the length of the list.
+        """
 
+        cleaned_run_number_list = set()
         for run_number in list_of_run_numbers:
             try:
-                run = runs.get(run_number=run_number)
-                d["{}".format(run.status)].append(run_number)
-            except (ObjectDoesNotExist, ValueError):
-                d["missing"].append(run_number)
-            except MultipleObjectsReturned:
-                run_pair = changed_flag_runs.filter(run_number=run_number)
-                if run_pair.exists():
-                    d["different_flags"].append(run_number)
-                else:
-                    r = runs.filter(run_number=run_number)
-                    d["{}".format(r[0].status)].append(run_number)
+                cleaned_run_number_list.add(int(run_number))
+            except (TypeError, ValueError):
+                pass
+
+        statuses = {}
+        run_number_status_pairs = (
+            self.filter(run_number__in=cleaned_run_number_list)
+            .annotate_status()
+            .order_by()
+            .values_list("run_number", "status")
+        )
+        for run_number, status in run_number_status_pairs:
+            statuses.setdefault(run_number, []).append(status)
 
-        return d
+        return self._classify_run_numbers(
+            list_of_run_numbers, statuses, self._changed_flag_run_numbers(statuses)
+        )
 
     def changed_flags(self):
         """
@@ -255,19 +445,19 @@ class RunInfoQuerySet(SoftDeletionQuerySet):
         pass
 
     def collisions(self):
-        return self.filter(type__runtype="Collisions")
+        return self.filter(runtype="Collisions")
 
     def cosmics(self):
-        return self.filter(type__runtype="Cosmics")
+        return self.filter(runtype="Cosmics")
 
     def express(self):
-        return self.filter(type__reco="Express")
+        return self.filter(reco="Express")
 
     def prompt(self):
-        return self.filter(type__reco="Prompt")
+        return self.filter(reco="Prompt")
 
     def rereco(self):
-        return self.filter(type__reco="reReco")
+        return self.filter(reco="reReco")
 
     def run_numbers(self):
         """
@@ -284,7 +474,10 @@ class RunInfoQuerySet(SoftDeletionQuerySet):
         if not self.run_numbers():
             return []
         client = TrackerRunRegistryClient()
-        return client.get_unique_fill_numbers_by_run_number(self.run_numbers())
+        try:
+            return client.get_unique_fill_numbers_by_run_number(self.run_numbers())
+        except RunRegistryUnavailableError:
+            return []
 
     def pks(self):
         """
@@ -292,18 +485,41 @@ class RunInfoQuerySet(SoftDeletionQuerySet):
         """
         return list(self.values_list("id", flat=True).order_by("id"))
 
+    def stats(self):
+        """
+        Computes the number of runs, lumisections and integrated luminosity
+        with a single aggregate query, without loading the runs
+
+        :return: dictionary with "total_number", "lumisections" and
+        "integrated_luminosity", which are 0 when there are no runs
+        """
+        result = self.aggregate(
+            total_number=Count("id"),
+            lumisections=Sum("number_of_ls"),
+            integrated_luminosity=Sum("int_luminosity"),
+        )
+        if result["total_number"] == 0:
+            return {"total_number": 0, "lumisections": 0, "integrated_luminosity": 0}
+        return {
+            "total_number": result["total_number"],
+            "lumisections": result["lumisections"],
+            "integrated_luminosity": float(result["integrated_luminosity"]),
+        }
+
+    def snapshot(self):
+        """
+        :return: compact RunSnapshot of the runs, created with a single query
+        """
+        return RunSnapshot.from_queryset(self)
+
     def integrated_luminosity(self):
-        if len(self) == 0:
-            return 0
-        return float(self.aggregate(Sum("int_luminosity"))["int_luminosity__sum"])
+        return self.stats()["integrated_luminosity"]
 
     def lumisections(self):
-        if len(self) == 0:
-            return 0
-        return self.aggregate(Sum("number_of_ls"))["number_of_ls__sum"]
+        return self.stats()["lumisections"]
 
     def total_number(self):
-        return len(self)
+        return self.stats()["total_number"]
 
     def days(self):
         return [
@@ -473,77 +689,153 @@ class RunInfoQuerySet(SoftDeletionQuerySet):
                 )
             )
 
-    def compare_with_run_registry(self):
+    def diff_with_run_registry(self):
+        """
+        Compares the certifications with the Run Registry
+
+        :return: tuple (list of (deviating RunInfo tuple, list of corresponding
+        Run Registry tuples), set of the run numbers that could not be compared
+        because the Run Registry did not answer). The tuples contain the
+        RUN_REGISTRY_COMPARISON_KEYS.
+        """
         run_numbers = self.run_numbers()
         run_registry = TrackerRunRegistryClient()
-        keys = [
-            "run_number",
-            "type__runtype",
-            "type__reco",
-            "pixel",
-            "sistrip",
-            "tracking",
-            "pixel_lowstat",
-            "sistrip_lowstat",
-        ]
+        keys = self.RUN_REGISTRY_COMPARISON_KEYS
 
-        run_info_tuple_set = set(self.values_list(*keys))
+        run_info_tuples = self.values_list(*keys)
+
+        # big lists are split into chunks which are fetched in parallel
+        results, failed_chunks = fetch_in_chunks(
+            run_numbers, run_registry.get_runs_by_list, self.RUN_REGISTRY_CHUNK_SIZE
+        )
+        run_registry_entries = list(chain.from_iterable(results))
 
-        # the resthub api cannot handle more than 1000 elements in the SQL query
-        if len(run_numbers) <= 500:
-            run_registry_entries = run_registry.get_runs_by_list(run_numbers)
-        else:  # split the list if it is too big
-            list_of_run_number_lists = chunks(run_numbers, 500)
-            run_registry_entries = []
-            for run_number_list in list_of_run_number_lists:
-                new_entries = run_registry.get_runs_by_list(run_number_list)
-                run_registry_entries.extend(new_entries)
+        # runs of chunks that could not be fetched can not be compared
+        failed_run_numbers = set(chain.from_iterable(failed_chunks))
+        if failed_run_numbers:
+            run_info_tuples = [
+                run for run in run_info_tuples if run[0] not in failed_run_numbers
+            ]
 
         convert_run_registry_to_runinfo(run_registry_entries)
-        run_registry_tuple_set = {
+        run_registry_tuples = (
             tuple(d[key] for key in keys) for d in run_registry_entries
-        }
-
-        deviating_run_info_tuple_list = sorted(
-            run_info_tuple_set - run_registry_tuple_set
         )
-        corresponding_run_registry_runs = []
-        for run in deviating_run_info_tuple_list:
-            elements = list(
-                filter(
-                    lambda x: x[0] == run[0] and x[2] == run[2], run_registry_tuple_set
-                )
+
+        diff = list(diff_with_run_registry(run_info_tuples, run_registry_tuples))
+        return diff, failed_run_numbers
+
+    def compare_with_run_registry(self):
+        """
+        :return: tuple (list of the deviating certifications, list of the
+        corresponding Run Registry entries) as dictionaries
+        :raises RunRegistryUnavailableError: if some of the runs could not be
+        fetched from the Run Registry
+        """
+        keys = self.RUN_REGISTRY_COMPARISON_KEYS
+        diff, failed_run_numbers = self.diff_with_run_registry()
+        if failed_run_numbers:
+            raise RunRegistryUnavailableError(
+                "{} runs could not be fetched".format(len(failed_run_numbers))
             )
-            if not elements:
-                elements = [("", "", "", "", "", "", False, False, False)]
-            corresponding_run_registry_runs.extend(elements)
 
-        deviating_run_info_dict = [
-            dict(zip(keys, run)) for run in deviating_run_info_tuple_list
-        ]
-        corresponding_run_registry_dict = [
-            dict(zip(keys, run)) for run in corresponding_run_registry_runs
-        ]
+        deviating_run_info_dict = []
+        corresponding_run_registry_dict = []
+        for run, corresponding in diff:
+            if not corresponding:
+                corresponding = [("", "", "", "", "", "", False, False, False)]
+            deviating_run_info_dict.append(dict(zip(keys, run)))
+            corresponding_run_registry_dict.extend(
+                dict(zip(keys, entry)) for entry in corresponding
+            )
 
         return deviating_run_info_dict, corresponding_run_registry_dict
 
+    def run_registry_mismatches(self):
+        """
+        :return: QuerySet of the certifications that did not match the Run
+        Registry the last time they were compared (see RunRegistryComparison)
+        """
+        return self.filter(run_registry_comparison__matches=False)
+
+    def not_compared_with_run_registry(self, since=None):
+        """
+        :param since: also include certifications that were compared before
+        this datetime
+        :return: QuerySet of the certifications without a stored comparison
+        """
+        not_compared = Q(run_registry_comparison__isnull=True)
+        if since:
+            not_compared |= Q(run_registry_comparison__checked_at__lt=since)
+        return self.filter(not_compared)
+
     def matches_with_run_registry(self):
         deviating, corresponding = self.compare_with_run_registry()
         return len(deviating) == 0
 
-    def annotate_fill_number(self):
+    def without_fill_number(self):
+        """
+        :return: QuerySet of the runs whose fill has not been stored yet
         """
-        Adds the lhc fill number from the Run Registry
+        from .models import RunFillNumber
 
+        return self.exclude(run_number__in=RunFillNumber.objects.values("run_number"))
+
+    def annotate_fill_number(self, fetch_missing=True):
+        """
+        Adds the LHC fill number of every run, which is None for runs without
+        fill or unknown to the Run Registry.
+
+        The fills are stored in RunFillNumber, so the Run Registry is only asked
+        for runs that have not been looked up yet. The fill number is a
+        subquery, so the result can be used with iterator() and values().
+
+        :param fetch_missing: ask the Run Registry for the runs whose fill is
+        not stored yet, otherwise their fill number is None
         :return: QuerySet with added LHC fill number
         """
-        run_registry = TrackerRunRegistryClient()
-        fills = run_registry.get_fill_number_by_run_number(self.run_numbers())
-        for run in self:
-            run.fill_number = list(
-                filter(lambda x: x["run_number"] == run.run_number, fills)
-            )[0]["fill_number"]
+        from .models import LHCFill, RunFillNumber
+
+        if fetch_missing:
+            LHCFill.objects.sync(self)
+
+        fill_number = RunFillNumber.objects.filter(
+            run_number=OuterRef("run_number")
+        ).values("fill")[:1]
+        return self.annotate(fill_number=Subquery(fill_number))
+
+    def per_fill(self, *fields):
+        """
+        Aggregates the runs per LHC fill (and optionally per other fields,
+        e.g. "reco") in the database. Only the stored fills are used, runs
+        whose fill is not known are left out.
+
+        :return: list of dictionaries with the fill_number, the given fields,
+        number_of_runs, lumisections and integrated_luminosity ordered by
+        fill number and the given fields
+        """
+        rows = (
+            self.annotate_fill_number(fetch_missing=False)
+            .exclude(fill_number=None)
+            .order_by()
+            .values("fill_number", *fields)
+            .annotate(
+                number_of_runs=Count("id"),
+                lumisections=Sum("number_of_ls"),
+                integrated_luminosity=Sum("int_luminosity"),
+            )
+            .order_by("fill_number", *fields)
+        )
+        return [
+            dict(row, integrated_luminosity=float(row["integrated_luminosity"]))
+            for row in rows
+        ]
 
     def group_run_numbers_by_fill_number(self):
         run_registry = TrackerRunRegistryClient()
-        return run_registry.get_grouped_fill_numbers_by_run_number(self.run_numbers())
+        try:
+            return run_registry.get_grouped_fill_numbers_by_run_number(
+                self.run_numbers()
+            )
+        except RunRegistryUnavailableError:
+            return []
@@ -1,14 +1,17 @@
 import allauth
 import django
+from categories.models import Category
 from allauth.account.signals import user_logged_in
 from allauth.socialaccount.models import SocialAccount
 from allauth.socialaccount.signals import social_account_updated, \
     social_account_added, social_account_removed, pre_social_login
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
-from certhelper.models import UserProfile
+from certhelper.cache import ReportCache
+from certhelper.models import UserProfile, RunInfo, Type, ReferenceRun
+from certhelper.query import runs_changed
 from certhelper.utilities.logger import get_configured_logger
 from certhelper.utilities.utilities import create_userprofile, update_userprofile
 
@@ -36,6 +39,24 @@ def save_or_create_userprofile(sender, instance, created, raw, **kwargs):
         logger.info("User {} has been saved".format(instance))
 
 
+@receiver(post_save, sender=RunInfo)
+@receiver(post_delete, sender=RunInfo)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+@receiver(post_save, sender=ReferenceRun)
+@receiver(post_delete, sender=ReferenceRun)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=RunInfo.problem_categories.through)
+@receiver(runs_changed, sender=RunInfo)
+def invalidate_cached_reports(sender, **kwargs):
+    """
+    Cached reports (e.g. the shift leader panels) are outdated as soon as a
+    certification, type, reference run or problem category changes
+    """
+    ReportCache.invalidate()
+
+
 @receiver(social_account_added)
 def update_newly_added_user(request, sociallogin, **kwargs):
     logger.info("Updating UserProfile of newly added Social Account {}"
@@ -1,10 +1,10 @@
 $(document).ready(function () {
 
-    $(document).ready(function(){
-        $('[data-toggle="tooltip"]').tooltip();
-    });
+    $('[data-toggle="tooltip"]').tooltip();
 
-    $("#id-cc-input").keyup(function () {
+    // the weekly certification is part of the report panel, which is loaded
+    // after the page by shiftleader_panels.js
+    $(document).on("keyup", "#id-cc-input", function () {
         let text = $("#id-cc-input").val();
 
         $.ajax({
@@ -0,0 +1,34 @@
+/*
+Loads the panels of the shift leader page (Run Registry comparison, deleted
+certifications, summary and shift leader report) after the page has been
+displayed, so that the filter and the list of runs show up immediately.
+*/
+$(document).ready(function () {
+    $(".shiftleader-panel").each(function () {
+        let panel = $(this);
+        $.ajax({
+            url: panel.data("url"),
+            dataType: "html",
+            success: function (html) {
+                panel.html(html);
+                panel.find('[data-toggle="tooltip"]').tooltip();
+
+                // the tabs inside of a panel (e.g. day by day in the shift leader
+                // report) do not exist yet when restore_selected_tabs.js runs
+                let selectedTab = localStorage.getItem("selectedTab");
+                if (selectedTab != null) {
+                    panel.find('a[data-toggle="tab"][href="' + selectedTab + '"]').tab("show");
+                }
+                panel.find('a[data-toggle="tab"]').on("shown.bs.tab", function (e) {
+                    localStorage.setItem("selectedTab", $(e.target).attr("href"));
+                });
+            },
+            error: function () {
+                panel.html(
+                    '<div class="alert alert-danger" role="alert">' +
+                    'This panel could not be loaded, please reload the page.</div>'
+                );
+            }
+        });
+    });
+});
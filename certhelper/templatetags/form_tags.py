@@ -65,7 +65,13 @@ def render_luminosity_table(caption, queryset):
 
     Used in tools/calculate_luminosity/
     """
-    return {"queryset": queryset, "caption": caption}
+    return {
+        "queryset": queryset,
+        "caption": caption,
+        "total": queryset.stats(),
+        "good": queryset.good().stats(),
+        "bad": queryset.bad().stats(),
+    }
 
 
 @register.inclusion_tag('certhelper/components/templatetags/lhc_fill_table.html')
@@ -22,6 +22,11 @@ app_name = "certhelper"
 urlpatterns = [
     url(r"^$", views.listruns, name="list"),
     url(r"^shiftleader/$", views.shiftleader_view, name="shiftleader"),
+    url(
+        r"^shiftleader/panels/(?P<panel>[\w-]+)/$",
+        views.shiftleader_panel_view,
+        name="shiftleader_panel",
+    ),
     url(r"^summary/$", views.summaryView, name="summary"),
     url(r"^references/$", views.ListReferences.as_view(), name="references"),
     url(r"^create/$", views.CreateRun.as_view(), name="create"),
@@ -115,6 +120,11 @@ urlpatterns = [
         views.validate_central_certification_list,
         name="ajax_validate_cc_list",
     ),
+    url(
+        r"^ajax/refresh-run-registry-comparison/$",
+        views.refresh_run_registry_comparison,
+        name="ajax_refresh_run_registry_comparison",
+    ),
     url(
         r"^ajax/check_integrity_of_run/$",
         views.check_integrity_of_run,
@@ -0,0 +1,273 @@
+import collections
+import math
+from array import array
+from itertools import chain
+from operator import itemgetter
+
+from django.db.models import OuterRef, Subquery
+
+
+class RunSnapshot:
+    """
+    Compact columnar snapshot of the certified runs that the reports are
+    computed from.
+
+    Instead of one model instance per run (with Decimal luminosities, comments
+    and related objects) every field is stored in a parallel array:
+
+    * run_numbers, number_of_ls: array('I')
+    * int_luminosity: array('d')
+    * changed_on: array('I') with the ordinal of the date on which the flag of
+      the run changed (see FlagChangedRun) or 0
+    * fill_numbers: array('I') with the stored LHC fill of the run (see
+      RunFillNumber) or 0
+    * codes[key]: array('H') with the position of the value in values[key]
+      for every key in KEYS (e.g. values["reco"] == ["Express", "Prompt"])
+
+    The runs are additionally split into slices per combination of the KEYS,
+    so that selecting e.g. the bad Prompt collisions of a specific day only
+    looks at the slices of that day and the positions of the matching slices.
+
+    Example:
+    >>> snapshot = RunSnapshot.from_queryset(RunInfo.objects.all())
+    >>> snapshot.select({"runtype": "Collisions", "status": "bad"}).total_number()
+    3
+    """
+
+    FIELDS = (
+        "run_number",
+        "date",
+        "runtype",
+        "reco",
+        "status",
+        "type",
+        "trackermap",
+        "number_of_ls",
+        "int_luminosity",
+        "changed_on",
+        "fill_number",
+    )
+    KEYS = ("date", "runtype", "reco", "status", "type", "trackermap")
+
+    def __init__(self, rows):
+        """
+        :param rows: iterable of tuples with the values of the FIELDS
+        """
+        self.run_numbers = array("I")
+        self.number_of_ls = array("I")
+        self.int_luminosity = array("d")
+        self.changed_on = array("I")
+        self.fill_numbers = array("I")
+        self.codes = {key: array("H") for key in self.KEYS}
+        self.values = {key: [] for key in self.KEYS}
+        self.slices = collections.OrderedDict()
+
+        value_codes = {key: {} for key in self.KEYS}
+        # (position of the key in KEYS, code) -> keys of the slices with that value
+        slices_with_value = {}
+        get_columns = itemgetter(
+            *(
+                self.FIELDS.index(field)
+                for field in (
+                    "run_number",
+                    "number_of_ls",
+                    "int_luminosity",
+                    "changed_on",
+                    "fill_number",
+                )
+            )
+        )
+        get_keys = itemgetter(*(self.FIELDS.index(key) for key in self.KEYS))
+        key_columns = [
+            (value_codes[key], self.values[key], self.codes[key]) for key in self.KEYS
+        ]
+        for position, row in enumerate(rows):
+            (
+                run_number,
+                number_of_ls,
+                int_luminosity,
+                changed_on,
+                fill_number,
+            ) = get_columns(row)
+            self.run_numbers.append(run_number)
+            self.number_of_ls.append(number_of_ls)
+            self.int_luminosity.append(float(int_luminosity))
+            self.changed_on.append(changed_on.toordinal() if changed_on else 0)
+            self.fill_numbers.append(fill_number or 0)
+
+            slice_key = []
+            for value, (codes, values, column) in zip(get_keys(row), key_columns):
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(values)
+                    values.append(value)
+                column.append(code)
+                slice_key.append(code)
+            slice_key = tuple(slice_key)
+            if slice_key not in self.slices:
+                self.slices[slice_key] = array("I")
+                for index, code in enumerate(slice_key):
+                    slices_with_value.setdefault((index, code), []).append(slice_key)
+            self.slices[slice_key].append(position)
+
+        self._value_codes = value_codes
+        self._slices_with_value = slices_with_value
+        self._selections = {}
+
+    @classmethod
+    def from_queryset(cls, runs):
+        """
+        Creates the snapshot with a single query, ordered by date and run number.
+        Only the stored fills are used, the Run Registry is not asked.
+        """
+        from certhelper.models import FlagChangedRun
+
+        changed_on = FlagChangedRun.objects.filter(
+            run_number=OuterRef("run_number")
+        ).values("changed_on")[:1]
+        rows = (
+            runs.annotate_fill_number(fetch_missing=False)
+            .annotate(changed_on=Subquery(changed_on))
+            .order_by("date", "run_number")
+            .values_list(*cls.FIELDS)
+        )
+        return cls(rows.iterator())
+
+    def __len__(self):
+        return len(self.run_numbers)
+
+    def select(self, criteria):
+        """
+        :param criteria: dictionary with the wanted values of some of the
+        KEYS and optionally "changed_until", to only select runs whose flag
+        has changed until that date
+        :return: RunSelection with the matching runs in the order of the
+        snapshot
+        """
+        selection_key = tuple(sorted(criteria.items()))
+        if selection_key not in self._selections:
+            self._selections[selection_key] = RunSelection(
+                self, self._positions(criteria)
+            )
+        return self._selections[selection_key]
+
+    def _positions(self, criteria):
+        wanted = []
+        for index, key in enumerate(self.KEYS):
+            if key in criteria:
+                code = self._value_codes[key].get(criteria[key])
+                if code is None:
+                    return array("I")
+                wanted.append((index, code))
+
+        candidates = self.slices.keys()
+        if wanted:
+            candidates = min(
+                (self._slices_with_value[value] for value in wanted), key=len
+            )
+        slices = [
+            self.slices[slice_key]
+            for slice_key in candidates
+            if all(slice_key[index] == code for index, code in wanted)
+        ]
+        if len(slices) == 1:
+            positions = slices[0]
+        else:
+            positions = array("I", sorted(chain.from_iterable(slices)))
+
+        if "changed_until" in criteria:
+            until = criteria["changed_until"].toordinal()
+            positions = array(
+                "I",
+                (
+                    position
+                    for position in positions
+                    if 0 < self.changed_on[position] <= until
+                ),
+            )
+        return positions
+
+
+class RunSelection:
+    """
+    Runs of a RunSnapshot, given by their positions in the snapshot
+    """
+
+    def __init__(self, snapshot, positions):
+        self.snapshot = snapshot
+        self.positions = positions
+        self._stats = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def run_numbers(self):
+        """
+        :return: sorted list of run numbers (without duplicates)
+        """
+        run_numbers = self.snapshot.run_numbers
+        return sorted({run_numbers[position] for position in self.positions})
+
+    def fill_numbers(self):
+        """
+        :return: sorted list of the known fill numbers of the runs
+        """
+        fill_numbers = self.snapshot.fill_numbers
+        return sorted({fill_numbers[position] for position in self.positions} - {0})
+
+    def run_numbers_per_fill(self):
+        """
+        :return: dictionary fill number -> sorted list of run numbers ordered
+        by fill number, runs with unknown fill are left out
+        """
+        fill_numbers = self.snapshot.fill_numbers
+        run_numbers = self.snapshot.run_numbers
+        fills = {}
+        for position in self.positions:
+            if fill_numbers[position]:
+                fills.setdefault(fill_numbers[position], set()).add(
+                    run_numbers[position]
+                )
+        return collections.OrderedDict(
+            (fill_number, sorted(fills[fill_number])) for fill_number in sorted(fills)
+        )
+
+    def values(self, key):
+        """
+        :return: sorted list of the distinct values of one of the KEYS,
+        e.g. the days of the selected runs with values("date")
+        """
+        codes = self.snapshot.codes[key]
+        values = self.snapshot.values[key]
+        return sorted({values[codes[position]] for position in self.positions})
+
+    def stats(self):
+        """
+        :return: dictionary with "total_number", "lumisections" and
+        "integrated_luminosity" like RunInfoQuerySet.stats()
+        """
+        if self._stats is None:
+            self._stats = self._compute_stats()
+        return self._stats
+
+    def _compute_stats(self):
+        if len(self.positions) == 0:
+            return {"total_number": 0, "lumisections": 0, "integrated_luminosity": 0}
+        number_of_ls = self.snapshot.number_of_ls
+        int_luminosity = self.snapshot.int_luminosity
+        return {
+            "total_number": len(self.positions),
+            "lumisections": sum(number_of_ls[position] for position in self.positions),
+            "integrated_luminosity": math.fsum(
+                int_luminosity[position] for position in self.positions
+            ),
+        }
+
+    def total_number(self):
+        return len(self.positions)
+
+    def lumisections(self):
+        return self.stats()["lumisections"]
+
+    def integrated_luminosity(self):
+        return self.stats()["integrated_luminosity"]
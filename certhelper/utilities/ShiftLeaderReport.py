@@ -1,73 +1,185 @@
+import copy
+from itertools import groupby
+from operator import itemgetter
+
+from certhelper.utilities.RunSnapshot import RunSnapshot
 from certhelper.utilities.utilities import to_weekdayname
 
 
+class ShiftLeaderReportSnapshot(RunSnapshot):
+    """
+    All the certifications that a shift leader report is made of (see
+    RunSnapshot), which are fetched with a single query.
+
+    Any combination of criteria (e.g. the bad Prompt collisions of a specific
+    day) is put together from the slices of the snapshot and remembered, so
+    that the shift leader templates do not run any further queries.
+
+    The fills of the runs are the ones stored in LHCFill, the Run Registry is
+    not asked while the report is rendered. The aggregates per fill are
+    computed by the database once per report.
+    """
+
+    # the fills are aggregated per combination of these keys in a single query
+    FILL_KEYS = ("runtype", "reco", "status")
+
+    def __init__(self, rows, runs=None):
+        super(ShiftLeaderReportSnapshot, self).__init__(rows)
+        self.runs = runs
+        self._per_fill = None
+        self._fills = {}
+
+    @classmethod
+    def from_queryset(cls, runs):
+        snapshot = super(ShiftLeaderReportSnapshot, cls).from_queryset(runs)
+        snapshot.runs = runs
+        return snapshot
+
+    def fills(self, criteria):
+        """
+        :param criteria: see RunSnapshot.select
+        :return: list of dictionaries with the fill_number, the certified
+        run_number list, number_of_runs, lumisections and integrated_luminosity
+        of every stored fill of the selected runs, ordered by fill number
+        """
+        selection_key = tuple(sorted(criteria.items()))
+        if selection_key not in self._fills:
+            run_numbers = self.select(criteria).run_numbers_per_fill()
+            fills = []
+            if run_numbers:
+                for fill_number, rows in groupby(
+                    self._per_fill_rows(criteria), itemgetter("fill_number")
+                ):
+                    fill = {
+                        "fill_number": fill_number,
+                        "run_number": run_numbers.get(fill_number, []),
+                        "number_of_runs": 0,
+                        "lumisections": 0,
+                        "integrated_luminosity": 0,
+                    }
+                    for row in rows:
+                        for field in (
+                            "number_of_runs",
+                            "lumisections",
+                            "integrated_luminosity",
+                        ):
+                            fill[field] += row[field]
+                    fills.append(fill)
+            self._fills[selection_key] = fills
+        return self._fills[selection_key]
+
+    def _per_fill_rows(self, criteria):
+        """
+        :return: rows of RunInfoQuerySet.per_fill ordered by fill number
+        """
+        if set(criteria) <= set(self.FILL_KEYS):
+            if self._per_fill is None:
+                self._per_fill = self.runs.per_fill(*self.FILL_KEYS)
+            return [
+                row
+                for row in self._per_fill
+                if all(row[key] == value for key, value in criteria.items())
+            ]
+        return self.runs.filter(**self._lookups(criteria)).per_fill()
+
+    @staticmethod
+    def _lookups(criteria):
+        from certhelper.models import FlagChangedRun
+
+        lookups = dict(criteria)
+        if "changed_until" in lookups:
+            lookups["run_number__in"] = FlagChangedRun.objects.filter(
+                changed_on__lte=lookups.pop("changed_until")
+            ).values("run_number")
+        return lookups
+
+
 class ShiftLeaderReportBase:
     """
     Base class for the shift leader report
-    Just wraps the RunInfoQuerySet filter functions
+    Every filter narrows down the criteria of the rows that are selected from
+    the ShiftLeaderReportSnapshot
     """
 
+    def __init__(self, snapshot, **criteria):
+        self.snapshot = snapshot
+        self.criteria = criteria
+
+    def _filter(self, **criteria):
+        report = copy.copy(self)
+        report.criteria = dict(self.criteria, **criteria)
+        return report
+
+    def _runs(self):
+        return self.snapshot.select(self.criteria)
+
     def prompt(self):
-        return type(self)(self.runs.prompt())
+        return self._filter(reco="Prompt")
 
     def express(self):
-        return type(self)(self.runs.express())
+        return self._filter(reco="Express")
 
     def rereco(self):
-        return type(self)(self.runs.rereco())
+        return self._filter(reco="reReco")
 
     def collisions(self):
-        return type(self)(self.runs.collisions())
+        return self._filter(runtype="Collisions")
 
     def cosmics(self):
-        return type(self)(self.runs.cosmics())
+        return self._filter(runtype="Cosmics")
 
     def bad(self):
-        return type(self)(self.runs.bad())
+        return self._filter(status="bad")
 
     def good(self):
-        return type(self)(self.runs.good())
+        return self._filter(status="good")
 
     def run_numbers(self):
-        return self.runs.run_numbers()
+        return self._runs().run_numbers()
 
     def fill_numbers(self):
-        return self.runs.fill_numbers()
+        return self._runs().fill_numbers()
 
     def fills(self):
-        return self.runs.group_run_numbers_by_fill_number()
+        return self.snapshot.fills(self.criteria)
+
+    def stats(self):
+        """
+        :return: dictionary with "total_number", "lumisections" and
+        "integrated_luminosity" like RunInfoQuerySet.stats()
+        """
+        return self._runs().stats()
 
     def integrated_luminosity(self):
-        return self.runs.integrated_luminosity()
+        return self.stats()["integrated_luminosity"]
+
+    def lumisections(self):
+        return self.stats()["lumisections"]
 
     def total_number(self):
-        return self.runs.total_number()
+        return self._runs().total_number()
 
+    def day_by_day(self):
+        return [
+            ShiftLeaderReportDay(self.snapshot, **dict(self.criteria, date=day))
+            for day in self._runs().values("date")
+        ]
 
-class ShiftLeaderReportDay(ShiftLeaderReportBase):
-    def __init__(self, runs):
-        self.runs = runs
-        try:
-            day = runs[0].date
-            self.day_name = to_weekdayname(day)
-            self.day_date = day
-        except IndexError:
-            pass
 
+class ShiftLeaderReportDay(ShiftLeaderReportBase):
     def name(self):
-        return self.day_name
+        return to_weekdayname(self.criteria["date"])
 
     def date(self):
-        return self.day_date
+        return self.criteria["date"]
 
     def flag_changed(self):
-        runs = self.runs.filter_flag_changed(until=self.day_date)
-        return type(self)(runs)
+        return self._filter(changed_until=self.criteria["date"])
 
 
 class ShiftLeaderReport(ShiftLeaderReportBase):
     def __init__(self, runs):
+        super(ShiftLeaderReport, self).__init__(
+            ShiftLeaderReportSnapshot.from_queryset(runs)
+        )
         self.runs = runs
-
-    def day_by_day(self):
-        return [ShiftLeaderReportDay(day) for day in self.runs.per_day()]
@@ -1,3 +1,6 @@
+import collections
+
+from certhelper.utilities.RunSnapshot import RunSnapshot
 from certhelper.utilities.utilities import get_ascii_table
 from utilities.luminosity import format_integrated_luminosity
 
@@ -6,19 +9,76 @@ class SummaryReport:
     """
     SummaryReport used in summary.html.
     Everything is returned per type.
+
+    The runs are fetched together with their type and reference run in a
+    single query and grouped by type in memory. The tracker maps, run numbers
+    and sums are selected from a RunSnapshot of these runs, so every section
+    is rendered without any further query.
     """
 
     def __init__(self, runs):
         self.runs = runs
-        self.runs_per_type = runs.per_type()
+        self.runs_per_type = self._group_by_type(runs)
+        self.snapshot = RunSnapshot(
+            (
+                run.run_number,
+                run.date,
+                run.runtype,
+                run.reco,
+                run.status,
+                run.type_id,
+                run.trackermap,
+                run.number_of_ls,
+                run.int_luminosity,
+                # the summary does not need the flag changes and fills
+                None,
+                None,
+            )
+            for run_type, runs in self.runs_per_type
+            for run in runs
+        )
+
+    @staticmethod
+    def _group_by_type(runs):
+        """
+        :return: list of (type, list of runs) ordered like Type.objects and
+        with the runs in the order of the given queryset. Runs of deleted types
+        are not part of the summary.
+        """
+        from certhelper.models import RunInfo, Type
+
+        type_ordering = [
+            "-type__" + field[1:] if field.startswith("-") else "type__" + field
+            for field in Type._meta.ordering
+        ]
+        run_ordering = runs.query.order_by or RunInfo._meta.ordering
+        rows = (
+            runs.filter(type__deleted_at=None)
+            .select_related("type", "reference_run")
+            .order_by(*type_ordering, "type", *run_ordering)
+        )
+
+        groups = collections.OrderedDict()
+        for run in rows:
+            groups.setdefault(run.type_id, (run.type, []))[1].append(run)
+        return list(groups.values())
 
     def reference_runs(self):
-        return self.runs.reference_runs()
+        references = {
+            run.reference_run_id: run.reference_run
+            for type_, runs in self.runs_per_type
+            for run in runs
+            if run.reference_run.deleted_at is None
+        }
+        return sorted(
+            references.values(),
+            key=lambda ref: (-ref.reference_run, ref.runtype, ref.reco),
+        )
 
     def runs_checked_per_type(self):
         runs_checked = []
 
-        for idx, runs_with_specific_type in enumerate(self.runs_per_type):
+        for idx, (run_type, runs) in enumerate(self.runs_per_type):
             column_description = [
                 "Run",
                 "Reference Run",
@@ -39,10 +99,9 @@ class SummaryReport:
                 run.sistrip,
                 run.tracking,
                 run.comment
-            ] for run in runs_with_specific_type]
+            ] for run in runs]
 
-            headline = "Type " + str(idx + 1) + ": " + str(
-                runs_with_specific_type[0].type)
+            headline = "Type " + str(idx + 1) + ": " + str(run_type)
             table = get_ascii_table(column_description, data)
             runs_checked.append(headline + '\n' + table + '\n')
 
@@ -50,43 +109,35 @@ class SummaryReport:
 
     def tracker_maps_per_type(self):
         tracker_maps = []
-        for idx, runs_with_specific_type in enumerate(self.runs_per_type):
+        for idx, (run_type, runs) in enumerate(self.runs_per_type):
             text = "Type {}".format(idx + 1)
-            tk_map_exists_runs = runs_with_specific_type.filter(trackermap="Exists")
-            if tk_map_exists_runs.exists():
-                run_numbers = tk_map_exists_runs.run_numbers()
-                joined = " ".join(str(run_number) for run_number in run_numbers)
-                text += "\n Exists: {}".format(joined)
-
-            tk_map_missing_runs = runs_with_specific_type.filter(trackermap="Missing")
-            if tk_map_missing_runs.exists():
-                run_numbers = tk_map_missing_runs.run_numbers()
-                joined = " ".join(str(run_number) for run_number in run_numbers)
-                text += "\n Missing: {}".format(joined)
+            for trackermap in ("Exists", "Missing"):
+                selection = self.snapshot.select(
+                    {"type": run_type.pk, "trackermap": trackermap}
+                )
+                if selection:
+                    run_numbers = selection.run_numbers()
+                    joined = " ".join(str(run_number) for run_number in run_numbers)
+                    text += "\n {}: {}".format(trackermap, joined)
             tracker_maps.append(text + "\n")
         return tracker_maps
 
     def certified_runs_per_type(self):
         certified_run_numbers = []
-        for idx, runs_with_specific_type in enumerate(self.runs_per_type):
+        for idx, (run_type, runs) in enumerate(self.runs_per_type):
             text = "Type {}".format(idx + 1)
-            good = runs_with_specific_type.good()
-            if good.exists():
-                run_numbers = good.run_numbers()
-                joined = " ".join(str(run_number) for run_number in run_numbers)
-                text += "\n Good: {}".format(joined)
-
-            bad = runs_with_specific_type.bad()
-            if bad.exists():
-                run_numbers = bad.run_numbers()
-                joined = " ".join(str(run_number) for run_number in run_numbers)
-                text += "\n Bad: {}".format(joined)
+            for status in ("good", "bad"):
+                selection = self.snapshot.select({"type": run_type.pk, "status": status})
+                if selection:
+                    run_numbers = selection.run_numbers()
+                    joined = " ".join(str(run_number) for run_number in run_numbers)
+                    text += "\n {}: {}".format(status.capitalize(), joined)
             certified_run_numbers.append(text + "\n")
         return certified_run_numbers
 
     def sum_of_quantities_per_type(self):
         certified_run_numbers = []
-        for idx, runs_with_specific_type in enumerate(self.runs_per_type):
+        for idx, (run_type, runs) in enumerate(self.runs_per_type):
             column_description = [
                 "Type {}".format(idx + 1),
                 "Sum of LS",
@@ -94,17 +145,30 @@ class SummaryReport:
             ]
 
             data = []
-            good = runs_with_specific_type.good()
-            bad = runs_with_specific_type.bad()
-
-            if good.exists():
-                data.append(
-                    ["Good", good.lumisections(), format_integrated_luminosity(good.integrated_luminosity())])
-
-            if bad.exists():
-                data.append(
-                    ["Bad", bad.lumisections(), format_integrated_luminosity(bad.integrated_luminosity())])
+            for status in ("good", "bad"):
+                selection = self.snapshot.select({"type": run_type.pk, "status": status})
+                if selection:
+                    stats = selection.stats()
+                    data.append([
+                        status.capitalize(),
+                        stats["lumisections"],
+                        format_integrated_luminosity(stats["integrated_luminosity"])
+                    ])
 
             table = get_ascii_table(column_description, data)
             certified_run_numbers.append(table)
         return certified_run_numbers
+
+    def sections(self):
+        """
+        :return: dictionary with the rendered text of every section, e.g. to
+        store the whole summary in the ReportCache
+        """
+        return {
+            "refs": [str(ref) for ref in self.reference_runs()],
+            "runs": self.runs_checked_per_type(),
+            "tk_maps": self.tracker_maps_per_type(),
+            "certified_runs": self.certified_runs_per_type(),
+            "sums": self.sum_of_quantities_per_type(),
+        }
+
@@ -0,0 +1,179 @@
+"""
+Streaming exports of the certified runs as JSON or NDJSON (one JSON object
+per line), optionally gzip compressed
+"""
+import json
+import re
+from itertools import chain
+
+from categories.models import Category
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+RUN_EXPORT_FIELDS = [
+    "run_number",
+    "type__reco",
+    "type__runtype",
+    "type__bfield",
+    "type__beamtype",
+    "type__beamenergy",
+    "type__dataset",
+    "reference_run__reference_run",
+    "reference_run__reco",
+    "reference_run__runtype",
+    "reference_run__bfield",
+    "reference_run__beamtype",
+    "reference_run__beamenergy",
+    "reference_run__dataset",
+    "trackermap",
+    "number_of_ls",
+    "int_luminosity",
+    "pixel",
+    "sistrip",
+    "tracking",
+    "pixel_lowstat",
+    "sistrip_lowstat",
+    "tracking_lowstat",
+    "comment",
+    "date",
+]
+
+# number of rows that are sent at once
+ROWS_PER_CHUNK = 500
+
+accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def get_category_display_names(categories=None):
+    """
+    Computes the names of all categories like str(category) (e.g.
+    "Pixel > Noise") with a single query instead of one query per category
+
+    :param categories: dictionaries of all categories with at least "id",
+    "parent_id" and "name", to avoid the query if they were already fetched
+    :return: dictionary category id -> display name, in the order of the
+    categories
+    """
+    if categories is None:
+        categories = Category.objects.values("id", "parent_id", "name")
+    parents = {c["id"]: c["parent_id"] for c in categories}
+    names = {c["id"]: c["name"] for c in categories}
+
+    display_names = {}
+    for category in categories:
+        path = [category["name"]]
+        parent_id = category["parent_id"]
+        while parent_id is not None:
+            path.insert(0, names[parent_id])
+            parent_id = parents[parent_id]
+        display_names[category["id"]] = " > ".join(path)
+    return display_names
+
+
+def get_problem_categories():
+    """
+    All categories with their "full_display_name" and the run number and
+    reconstruction of the certified runs that have this problem, fetched with
+    two queries independent of the number of categories
+
+    :return: list of dictionaries with the fields of the categories
+    """
+    from certhelper.models import RunInfo
+
+    categories = list(Category.objects.all().values())
+    display_names = get_category_display_names(categories)
+
+    runs = {}
+    through = RunInfo.problem_categories.through
+    problems = (
+        through.objects.filter(runinfo__deleted_at=None)
+        .order_by("-runinfo__run_number")
+        .values_list("category_id", "runinfo__run_number", "runinfo__type__reco")
+    )
+    for category_id, run_number, reco in problems:
+        runs.setdefault(category_id, []).append((run_number, reco))
+
+    for category in categories:
+        category["full_display_name"] = display_names[category["id"]]
+        category["runs"] = runs.get(category["id"], [])
+    return categories
+
+
+def iterate_runs(runs, with_problems=False):
+    """
+    Iterates over the runs without keeping them in memory
+
+    :param runs: RunInfoQuerySet
+    :param with_problems: add the "problem_names" and "problem_ids" of the
+    problem categories of every run, which are fetched with one query
+    :return: generator of dictionaries with the RUN_EXPORT_FIELDS
+    """
+    if not with_problems:
+        yield from runs.values(*RUN_EXPORT_FIELDS).iterator()
+        return
+
+    display_names = get_category_display_names()
+    position = {id_: index for index, id_ in enumerate(display_names)}
+    problem_ids = {}
+    through = runs.model.problem_categories.through
+    for run_id, category_id in through.objects.filter(runinfo__in=runs).values_list(
+        "runinfo_id", "category_id"
+    ):
+        problem_ids.setdefault(run_id, []).append(category_id)
+
+    for run in runs.values("id", *RUN_EXPORT_FIELDS).iterator():
+        ids = sorted(problem_ids.get(run.pop("id"), []), key=position.get)
+        run["problem_names"] = [display_names[id_] for id_ in ids]
+        run["problem_ids"] = ids
+        yield run
+
+
+def serialize_rows(rows, ndjson=False):
+    """
+    :param rows: iterable of dictionaries
+    :param ndjson: one JSON object per line instead of a JSON array
+    :return: generator of strings with up to ROWS_PER_CHUNK rows each
+    """
+    encoded = (json.dumps(row, cls=DjangoJSONEncoder) for row in rows)
+    if ndjson:
+        lines = (row + "\n" for row in encoded)
+    else:
+        lines = chain(
+            ["["],
+            (("," if index else "") + row for index, row in enumerate(encoded)),
+            ["]"],
+        )
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def export_response(request, rows):
+    """
+    Streams the rows as JSON array, or as NDJSON with the GET parameter
+    format=ndjson. The response is gzip compressed if the client accepts it.
+
+    :param rows: iterable of dictionaries, e.g. from iterate_runs
+    :return: StreamingHttpResponse
+    """
+    ndjson = request.GET.get("format") == "ndjson"
+    content = (chunk.encode("utf-8") for chunk in serialize_rows(rows, ndjson))
+    content_type = "application/x-ndjson" if ndjson else "application/json"
+
+    gzip = accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if gzip:
+        content = compress_sequence(content)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    if gzip:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -1,14 +1,18 @@
 import datetime
 import decimal
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from allauth.socialaccount.models import SocialAccount
 from django.contrib.auth.models import Group, Permission
+from django.db import connections
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 from terminaltables import AsciiTable
 
 from certhelper.utilities.logger import get_configured_logger
+from runregistry.client import RunRegistryUnavailableError
 
 logger = get_configured_logger(loggername=__name__, filename="utilities.log")
 
@@ -130,6 +134,24 @@ def get_today_filter_parameter():
     return "?date={}".format(timezone.now().strftime("%Y-%m-%d"))
 
 
+def get_run_status(runtype, pixel, sistrip, tracking):
+    """
+    Certification status of a run, as stored in RunInfo.status
+
+    The pixel flag is ignored for cosmics.
+
+    :return: "good" or "bad"
+    """
+    good_criteria = ("Good", "Lowstat")
+    if (
+        (runtype == "Cosmics" or pixel in good_criteria)
+        and sistrip in good_criteria
+        and tracking in good_criteria
+    ):
+        return "good"
+    return "bad"
+
+
 def get_from_summary(summary, runtype=None, reco=None, date=None):
     filtered = summary
     if runtype:
@@ -469,6 +491,37 @@ def convert_run_registry_to_runinfo(list_of_dictionaries):
     return list_of_dictionaries
 
 
+def diff_with_run_registry(run_info_tuples, run_registry_tuples):
+    """
+    Compares RunInfo tuples with Run Registry tuples and yields every RunInfo tuple
+    that has no identical counterpart in the Run Registry, together with the
+    Run Registry tuples of the same run number and reconstruction type.
+
+    The Run Registry tuples are indexed by (run_number, reco) once, so every
+    lookup takes constant time instead of scanning all Run Registry entries.
+
+    Both kinds of tuples have to start with (run_number, runtype, reco, ...).
+
+    Example:
+    >>> run_info = [(1, "Collisions", "Express", "Good"), (2, "Collisions", "Express", "Good")]
+    >>> run_registry = [(1, "Collisions", "Express", "Bad"), (2, "Collisions", "Express", "Good")]
+    >>> list(diff_with_run_registry(run_info, run_registry))
+    [((1, 'Collisions', 'Express', 'Good'), [(1, 'Collisions', 'Express', 'Bad')])]
+
+    :param run_info_tuples: iterable of RunInfo tuples
+    :param run_registry_tuples: iterable of Run Registry tuples
+    :return: generator of (deviating RunInfo tuple, list of corresponding
+    Run Registry tuples) sorted by the RunInfo tuple
+    """
+    run_registry_tuple_set = set(run_registry_tuples)
+    index = {}
+    for entry in run_registry_tuple_set:
+        index.setdefault((entry[0], entry[2]), []).append(entry)
+
+    for run in sorted(set(run_info_tuples) - run_registry_tuple_set):
+        yield run, index.get((run[0], run[2]), [])
+
+
 def chunks(elements_list, n):
     """
     Split a list into sublists of fixed length n
@@ -482,6 +535,53 @@ def chunks(elements_list, n):
         yield elements_list[index : index + n]
 
 
+def fetch_in_chunks(elements_list, fetch, n, max_workers=4):
+    """
+    Splits a list into chunks of length n and calls fetch for every chunk in
+    a bounded thread pool.
+
+    Run Registry errors are isolated per chunk: a chunk whose fetch raises a
+    RunRegistryUnavailableError or a requests exception is logged and reported
+    as failed, the results of all other chunks are still returned. Other
+    exceptions are raised.
+
+    Example:
+    >>> fetch_in_chunks([1, 2, 3, 4, 5], lambda chunk: sum(chunk), 2)
+    ([3, 7, 5], [])
+
+    :param elements_list: list of elements that needs to be split
+    :param fetch: function that is called with every chunk
+    :param n: chunk size
+    :param max_workers: maximum number of chunks that are fetched at the same time
+    :return: tuple (list of results of the successful chunks in the original
+    order, list of failed chunks)
+    """
+    list_of_chunks = list(chunks(elements_list, n))
+    parallel = len(list_of_chunks) > 1
+
+    def fetch_chunk(chunk):
+        try:
+            return fetch(chunk), None
+        except (RunRegistryUnavailableError, requests.RequestException) as e:
+            logger.error("Fetching chunk {}..{} failed: {}".format(chunk[0], chunk[-1], e))
+            return None, chunk
+        finally:
+            if parallel:
+                # database connections are per thread and would stay open
+                connections.close_all()
+
+    if parallel:
+        workers = min(max_workers, len(list_of_chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(fetch_chunk, list_of_chunks))
+    else:
+        outcomes = [fetch_chunk(chunk) for chunk in list_of_chunks]
+
+    results = [result for result, failed in outcomes if failed is None]
+    failed_chunks = [failed for result, failed in outcomes if failed is not None]
+    return results, failed_chunks
+
+
 def number_string_to_list(number_string):
     """
     Converts a string of numbers to a list
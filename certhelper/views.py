@@ -4,24 +4,32 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import redirect_to_login
-from django.http import HttpResponseRedirect, Http404, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag, require_POST
 from django.views import generic
 from django.views.generic import TemplateView
 from django_filters.views import FilterView
 from django_tables2 import RequestConfig, SingleTableView, SingleTableMixin
 
+from certhelper.cache import ReportCache, filter_signature
 from certhelper.filters import (
     RunInfoFilter,
     ShiftLeaderRunInfoFilter,
     ComputeLuminosityRunInfoFilter,
     RunsFilter,
 )
-from certhelper.models import UserProfile
+from certhelper.models import UserProfile, RunRegistryComparison, LHCFill
 from certhelper.utilities.ShiftLeaderReport import ShiftLeaderReport
 from certhelper.utilities.SummaryReport import SummaryReport
+from certhelper.utilities.export import (
+    export_response,
+    get_problem_categories,
+    iterate_runs,
+)
 from certhelper.utilities.utilities import (
     get_filters_from_request_GET,
     request_contains_filter_parameter,
@@ -33,7 +41,7 @@ from certhelper.utilities.utilities import (
     integer_or_none,
     convert_run_registry_to_runinfo,
 )
-from runregistry.client import TrackerRunRegistryClient
+from runregistry.client import TrackerRunRegistryClient, RunRegistryUnavailableError
 from .forms import *
 from .tables import *
 
@@ -76,19 +84,20 @@ def listruns(request):
     if request.user.is_authenticated:
         run_info_list = RunInfo.objects.filter(userid=request.user)
         run_info_filter = RunInfoFilter(request.GET, queryset=run_info_list)
-        table = RunInfoTable(run_info_filter.qs)
+        table = RunInfoTable(run_info_filter.qs.with_relations())
 
-        mismatching_runs, mismatching_run_registy_runs = (
-            run_info_filter.qs.compare_with_run_registry()
+        # the comparison is stored by compare_with_run_registry, the page
+        # only asks for a refresh instead of waiting for the Run Registry
+        context["mismatching_runs"] = (
+            run_info_filter.qs.run_registry_mismatches().run_numbers()
+        )
+        context["run_registry_comparison_outdated"] = (
+            run_info_filter.qs.not_compared_with_run_registry().exists()
         )
-        if len(mismatching_runs) != 0:
-            context["mismatching_runs"] = [
-                run["run_number"] for run in mismatching_runs
-            ]
     else:
         run_info_list = RunInfo.objects.all()
         run_info_filter = RunInfoFilter(request.GET, queryset=run_info_list)
-        table = SimpleRunInfoTable(run_info_filter.qs)
+        table = SimpleRunInfoTable(run_info_filter.qs.with_relations())
 
     RequestConfig(request).configure(table)
 
@@ -101,10 +110,27 @@ def listruns(request):
     context["filter_parameters"] = filter_parameters
     context["table"] = table
     context["filter"] = run_info_filter
-    context["run_registry_online"] = TrackerRunRegistryClient().connection_possible()
     return render(request, "certhelper/list.html", context)
 
 
+@login_required
+@require_POST
+def refresh_run_registry_comparison(request):
+    """
+    Starts the comparison of the users certified runs (filtered like the list
+    of certified runs) with the Run Registry in the background
+
+    :return: JsonResponse telling whether the comparison has been started
+    """
+    runs = RunInfoFilter(
+        request.GET, queryset=RunInfo.objects.filter(userid=request.user)
+    ).qs
+    started = False
+    if TrackerRunRegistryClient().is_available():
+        started = RunRegistryComparison.objects.refresh_in_background(runs)
+    return JsonResponse({"started": started}, status=202 if started else 200)
+
+
 @method_decorator(login_required, name="dispatch")
 class ListReferences(SingleTableView):
     """
@@ -190,6 +216,11 @@ class CreateType(generic.CreateView):
     success_url = "/create"
 
 
+# rendered sections of the summary per user and filter, invalidated in all
+# processes by the version stored in the database (see ReportVersion)
+summary_cache = ReportCache("summary")
+
+
 @login_required
 def summaryView(request):
     """
@@ -206,18 +237,17 @@ def summaryView(request):
         request, alert_errors, alert_infos, alert_filters
     )
 
-    summary = SummaryReport(runs)
-
-    context = {
-        "refs": summary.reference_runs(),
-        "runs": summary.runs_checked_per_type(),
-        "tk_maps": summary.tracker_maps_per_type(),
-        "certified_runs": summary.certified_runs_per_type(),
-        "sums": summary.sum_of_quantities_per_type(),
-        "alert_errors": alert_errors,
-        "alert_infos": alert_infos,
-        "alert_filters": alert_filters,
-    }
+    sections = summary_cache.get_or_set(
+        [request.user.pk, filter_signature(request.GET)],
+        lambda: SummaryReport(runs).sections(),
+    )
+
+    context = dict(
+        sections,
+        alert_errors=alert_errors,
+        alert_infos=alert_infos,
+        alert_filters=alert_filters,
+    )
 
     return render(request, "certhelper/summary.html", context)
 
@@ -264,36 +294,104 @@ def shiftleader_view(request):
     return HttpResponseRedirect("/shiftleader/%s" % get_this_week_filter_parameter())
 
 
-# TODO lazy load summary
 @method_decorator(login_required, name="dispatch")
 class ShiftLeaderView(SingleTableMixin, FilterView):
+    """
+    Shows the filter and the list of certified runs, the other panels are loaded
+    by the page from shiftleader_panel_view after it has been displayed
+    """
+
     table_class = ShiftleaderRunInfoTable
     model = RunInfo
     template_name = "certhelper/shiftleader.html"
     filterset_class = ShiftLeaderRunInfoFilter
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["summary"] = SummaryReport(self.filterset.qs)
-        context["slreport"] = ShiftLeaderReport(self.filterset.qs)
-        context["deleted_runs"] = DeletedRunInfoTable(
-            RunInfo.all_objects.dead().order_by("-run_number")
+    def get_table_data(self):
+        return super().get_table_data().with_relations()
+
+
+def get_summary_panel_context(filterset):
+    return {"summary": SummaryReport(filterset.qs)}
+
+
+def get_report_panel_context(filterset):
+    if filterset.qs.without_fill_number().exists():
+        # the report uses the stored fills, the missing ones are added later
+        LHCFill.objects.sync_in_background(filterset.qs)
+    context = {"filter": filterset, "slreport": ShiftLeaderReport(filterset.qs)}
+    try:
+        context["slchecklist"] = Checklist.objects.get(identifier="shiftleader")
+    except Checklist.DoesNotExist:
+        # shift leader checklist has not been created yet.
+        pass
+    return context
+
+
+def get_deleted_runs_panel_context(filterset):
+    return {
+        "deleted_runs": DeletedRunInfoTable(
+            RunInfo.all_objects.dead().with_relations().order_by("-run_number")
         )
-        try:
-            context["slchecklist"] = Checklist.objects.get(identifier="shiftleader")
-        except Checklist.DoesNotExist:
-            # shift leader checklist has not been created yet.
-            pass
+    }
 
-        deviating, corresponding = self.filterset.qs.compare_with_run_registry()
 
-        if deviating:
-            context["runinfo_comparison_table"] = RunRegistryComparisonTable(deviating)
-            context["run_registry_comparison_table"] = RunRegistryComparisonTable(
-                corresponding
-            )
+def get_run_registry_comparison_panel_context(filterset):
+    context = {"filter": filterset}
+    if not TrackerRunRegistryClient().is_available():
+        context["run_registry_unavailable"] = True
+        return context
 
+    try:
+        deviating, corresponding = filterset.qs.compare_with_run_registry()
+    except RunRegistryUnavailableError:
+        context["run_registry_unavailable"] = True
         return context
+    if deviating:
+        context["runinfo_comparison_table"] = RunRegistryComparisonTable(deviating)
+        context["run_registry_comparison_table"] = RunRegistryComparisonTable(
+            corresponding
+        )
+    return context
+
+
+SHIFT_LEADER_PANELS = {
+    "summary": get_summary_panel_context,
+    "report": get_report_panel_context,
+    "deleted-runs": get_deleted_runs_panel_context,
+    "run-registry-comparison": get_run_registry_comparison_panel_context,
+}
+
+shift_leader_panel_cache = ReportCache("shiftleader-panel")
+
+
+@login_required
+def shiftleader_panel_view(request, panel):
+    """
+    Renders a single panel of the shift leader page as HTML fragment
+
+    The panels are cached per filter until a certification changes. The Run
+    Registry comparison is not cached while the Run Registry is unavailable.
+    """
+    try:
+        get_panel_context = SHIFT_LEADER_PANELS[panel]
+    except KeyError:
+        raise Http404("The panel {} does not exist".format(panel))
+
+    cache_key = [panel, filter_signature(request.GET)]
+    html = shift_leader_panel_cache.get(cache_key)
+    if html is None:
+        filterset = ShiftLeaderRunInfoFilter(
+            request.GET, queryset=RunInfo.objects.all()
+        )
+        context = get_panel_context(filterset)
+        html = render_to_string(
+            "certhelper/components/shiftleader/panels/{}.html".format(panel),
+            context,
+            request,
+        )
+        if not context.get("run_registry_unavailable"):
+            shift_leader_panel_cache.set(cache_key, html)
+    return HttpResponse(html)
 
 
 # TODO superuser required
@@ -399,13 +497,18 @@ class RunRegistryView(TemplateView):
 
         run_registry = TrackerRunRegistryClient()
 
-        if run_list:
-            run_numbers = number_string_to_list(run_list)
-            data = run_registry.get_runs_by_list(run_numbers)
-        elif run_min and run_max:
-            data = run_registry.get_runs_by_range(run_min, run_max)
-        else:
-            data = {}
+        try:
+            if run_list:
+                run_numbers = number_string_to_list(run_list)
+                data = run_registry.get_runs_by_list(run_numbers)
+            elif run_min and run_max:
+                data = run_registry.get_runs_by_range(run_min, run_max)
+            else:
+                data = {}
+        except RunRegistryUnavailableError:
+            return render(
+                request, self.template_name, {"run_registry_unavailable": True}
+            )
 
         table = RunRegistryTable(data)
 
@@ -426,13 +529,18 @@ class RunRegistryLumiSectionView(TemplateView):
 
         run_registry = TrackerRunRegistryClient()
 
-        if run_list:
-            run_numbers = number_string_to_list(run_list)
-            data = run_registry.get_lumi_sections_by_list(run_numbers)
-        elif run_min and run_max:
-            data = run_registry.get_lumi_sections_by_range(run_min, run_max)
-        else:
-            data = {}
+        try:
+            if run_list:
+                run_numbers = number_string_to_list(run_list)
+                data = run_registry.get_lumi_sections_by_list(run_numbers)
+            elif run_min and run_max:
+                data = run_registry.get_lumi_sections_by_range(run_min, run_max)
+            else:
+                data = {}
+        except RunRegistryUnavailableError:
+            return render(
+                request, self.template_name, {"run_registry_unavailable": True}
+            )
 
         table = RunRegistryLumiSectionTable(data)
         return render(request, self.template_name, {"table": table})
@@ -461,7 +569,17 @@ class RunRegistryCompareView(TemplateView):
         else:
             runs = RunInfo.objects.none()
 
-        deviating, corresponding = runs.compare_with_run_registry()
+        if not TrackerRunRegistryClient().is_available():
+            return render(
+                request, self.template_name, {"run_registry_unavailable": True}
+            )
+
+        try:
+            deviating, corresponding = runs.compare_with_run_registry()
+        except RunRegistryUnavailableError:
+            return render(
+                request, self.template_name, {"run_registry_unavailable": True}
+            )
 
         deviating_run_table = RunRegistryComparisonTable(deviating)
         run_registry_table = RunRegistryComparisonTable(corresponding)
@@ -475,9 +593,12 @@ class RunRegistryCompareView(TemplateView):
 
 def runregistry(request, run_number):
     client = TrackerRunRegistryClient()
-    if not client.connection_possible():
-        return JsonResponse("Run Registry is unavailable.")
-    response = client.get_runs_by_list([run_number])
+    if not client.is_available():
+        return JsonResponse("Run Registry is unavailable.", safe=False)
+    try:
+        response = client.get_runs_by_list([run_number])
+    except RunRegistryUnavailableError:
+        return JsonResponse("Run Registry is unavailable.", safe=False)
     runs = convert_run_registry_to_runinfo(response)
     return JsonResponse(runs, safe=False, json_dumps_params={"indent": 2})
 
@@ -497,93 +618,39 @@ class RunsView(FilterView):
         return context
 
 
+def certifications_version(request):
+    """
+    ETag of the JSON exports, which changes whenever a certification, type,
+    reference run or category changes (see ReportCache.invalidate). It is read
+    from the database, so every process sends the same ETag.
+    """
+    return ReportCache.version()
+
+
 @staff_member_required
+@etag(certifications_version)
 def problems_json(request):
-    # TODO improve this code
-    categories_dict = Category.objects.all().values()
-    for c in categories_dict:
-        category = Category.objects.get(id=c["id"])
-        c["full_display_name"] = str(category)
-        c["runs"] = list(
-            category.runinfo_set.all().values_list("run_number", "type__reco")
-        )
-    return JsonResponse(list(categories_dict), safe=False)
+    """
+    All problem categories with their full display name and the runs that have
+    this problem. Clients that poll this should send the ETag back in
+    If-None-Match, which is answered with 304 Not Modified if nothing changed.
+    """
+    return JsonResponse(get_problem_categories(), safe=False)
 
 
 @staff_member_required
 def runs_json(request):
-    # Note: "problem_categories" have to be retrieved separately,
-    # since there is no easy way to retrieve them inline
-
-    runs = RunInfo.objects.all().values(
-        "run_number",
-        "type__reco",
-        "type__runtype",
-        "type__bfield",
-        "type__beamtype",
-        "type__beamenergy",
-        "type__dataset",
-        "reference_run__reference_run",
-        "reference_run__reco",
-        "reference_run__runtype",
-        "reference_run__bfield",
-        "reference_run__beamtype",
-        "reference_run__beamenergy",
-        "reference_run__dataset",
-        "trackermap",
-        "number_of_ls",
-        "int_luminosity",
-        "pixel",
-        "sistrip",
-        "tracking",
-        "pixel_lowstat",
-        "sistrip_lowstat",
-        "tracking_lowstat",
-        "comment",
-        "date",
-    )
-
-    return JsonResponse(list(runs), safe=False)
+    """
+    Streams all certified runs as JSON (or NDJSON with ?format=ndjson)
+    """
+    return export_response(request, iterate_runs(RunInfo.objects.all()))
 
 
 @staff_member_required
 def problem_runs_json(request):
-    # TODO improve this horrible code
-
+    """
+    Streams all certified runs with problem categories as JSON (or NDJSON with
+    ?format=ndjson) including the names and ids of their problem categories
+    """
     problem_runs = RunInfo.objects.all().exclude(problem_categories=None)
-    problem_runs_dict = problem_runs.values(
-        "run_number",
-        "type__reco",
-        "type__runtype",
-        "type__bfield",
-        "type__beamtype",
-        "type__beamenergy",
-        "type__dataset",
-        "reference_run__reference_run",
-        "reference_run__reco",
-        "reference_run__runtype",
-        "reference_run__bfield",
-        "reference_run__beamtype",
-        "reference_run__beamenergy",
-        "reference_run__dataset",
-        "trackermap",
-        "number_of_ls",
-        "int_luminosity",
-        "pixel",
-        "sistrip",
-        "tracking",
-        "pixel_lowstat",
-        "sistrip_lowstat",
-        "tracking_lowstat",
-        "comment",
-        "date",
-    )
-
-    for run in problem_runs_dict:
-        problem_categories = problem_runs.get(
-            run_number=run["run_number"], type__reco=run["type__reco"]
-        ).problem_categories
-        run["problem_names"] = [str(problem) for problem in problem_categories.all()]
-        run["problem_ids"] = [problem.id for problem in problem_categories.all()]
-
-    return JsonResponse(list(problem_runs_dict), safe=False)
+    return export_response(request, iterate_runs(problem_runs, with_problems=True))
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'widget_tweaks',
     'bootstrap3',
     'certhelper.apps.CerthelperConfig',
+    'runregistry.apps.RunRegistryConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.sites',
@@ -109,6 +110,33 @@ DATABASES = {
     },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+#
+# Run Registry results and rendered reports are cached here. Use a backend that
+# is shared across processes in production, e.g.
+# django.core.cache.backends.db.DatabaseCache (run "python manage.py
+# createcachetable" once) or memcached. The version that invalidates the cached
+# reports is stored in the database (see ReportVersion), so every process sees
+# changes immediately, but with LocMemCache every process renders its own copy.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('DJANGO_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('DJANGO_CACHE_LOCATION', default=''),
+    },
+}
+
+# Run Registry
+# Read Run Registry data from the local mirror (filled by "python manage.py
+# sync_run_registry") instead of querying the Run Registry on every request
+
+RUN_REGISTRY_USE_MIRROR = config('DJANGO_RUN_REGISTRY_USE_MIRROR', default=False, cast=bool)
+
+# Maximum number of keep-alive connections to the Run Registry per process
+
+RUN_REGISTRY_POOL_SIZE = config('DJANGO_RUN_REGISTRY_POOL_SIZE', default=10, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
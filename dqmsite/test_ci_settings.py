@@ -13,6 +13,13 @@ DATABASES = {
 MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 DYNAMIC_PREFERENCES = {
     'ENABLE_CACHE': False,
 }
@@ -7,6 +7,12 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 DYNAMIC_PREFERENCES = {
     'ENABLE_CACHE': False,
 }
@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from .models import RunRegistryRun, RunRegistryDataset, RunRegistryLumiSection
+
+
+class RunRegistryRunAdmin(admin.ModelAdmin):
+    list_display = ("run_number", "fill_number")
+    search_fields = ("run_number", "fill_number")
+
+
+class RunRegistryDatasetAdmin(admin.ModelAdmin):
+    list_display = ("run_number", "dataset", "state", "pixel", "sistrip", "tracking")
+    list_filter = ("state",)
+    search_fields = ("run_number", "dataset")
+
+
+class RunRegistryLumiSectionAdmin(admin.ModelAdmin):
+    list_display = ("run_number", "dataset", "section_from", "section_to")
+    search_fields = ("run_number", "dataset")
+
+
+admin.site.register(RunRegistryRun, RunRegistryRunAdmin)
+admin.site.register(RunRegistryDataset, RunRegistryDatasetAdmin)
+admin.site.register(RunRegistryLumiSection, RunRegistryLumiSectionAdmin)
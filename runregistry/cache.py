@@ -0,0 +1,144 @@
+"""
+Caches used by the RunRegistry client
+"""
+import threading
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class QueryIdCache:
+    """
+    Least recently used (LRU) cache that maps SQL query strings to the query ids
+    (qid) handed out by resthub, so that a repeated query does not have to be
+    POSTed again.
+
+    Example:
+    >>> cache = QueryIdCache(max_size=2)
+    >>> cache.set("select 1 from dual", "o1662d3e8bb1")
+    >>> cache.get("select 1 from dual")
+    'o1662d3e8bb1'
+    >>> cache.hits, cache.misses
+    (1, 0)
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param max_size: maximum number of query ids that are kept in the cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._query_ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._query_ids)
+
+    def __contains__(self, query):
+        return query in self._query_ids
+
+    def get(self, query):
+        """
+        :return: cached query id or None if the query is not cached
+        """
+        with self._lock:
+            try:
+                query_id = self._query_ids[query]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._query_ids.move_to_end(query)
+            self.hits += 1
+            return query_id
+
+    def set(self, query, query_id):
+        """
+        Caches the query id and evicts the least recently used query ids
+        if the cache is full.
+        """
+        with self._lock:
+            self._query_ids[query] = query_id
+            self._query_ids.move_to_end(query)
+            while len(self._query_ids) > self.max_size:
+                self._query_ids.popitem(last=False)
+
+    def invalidate(self, query):
+        """
+        Removes the query id of the given query, e.g. when resthub does not
+        know the query id anymore
+        """
+        with self._lock:
+            self._query_ids.pop(query, None)
+
+    def clear(self):
+        with self._lock:
+            self._query_ids.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class ResultCache:
+    """
+    Caches Run Registry results per key (e.g. per run number) in the Django cache
+    framework, so that the results are shared by all processes using the same
+    cache backend.
+
+    Example:
+    >>> cache = ResultCache("fill_of_run")
+    >>> cache.get_many([321177, 321178], fetch, lambda fill: 3600)
+    {321177: 7048, 321178: 7048}
+
+    :param prefix: namespace of the cached values, e.g. "runs"
+    :param cache_alias: alias of the Django cache in the CACHES setting
+    """
+
+    KEY_PREFIX = "runregistry"
+
+    def __init__(self, prefix, cache_alias="default"):
+        self.prefix = prefix
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def make_key(self, key):
+        return "{}:{}:{}".format(self.KEY_PREFIX, self.prefix, key)
+
+    def get_many(self, keys, fetch, get_timeout):
+        """
+        Looks up all keys with a single cache request and fetches only the missing
+        ones. Keys that can not be fetched (e.g. unknown run numbers) are not cached
+        and are missing in the returned dictionary.
+
+        :param keys: list of keys, e.g. run numbers
+        :param fetch: function list of missing keys -> dictionary key -> value
+        :param get_timeout: function value -> timeout in seconds
+        :return: dictionary key -> value
+        """
+        cache_keys = {self.make_key(key): key for key in keys}
+        cached = self.cache.get_many(list(cache_keys))
+        values = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+
+        missing = [key for key in cache_keys.values() if key not in values]
+        if missing:
+            fetched = fetch(missing)
+            self.set_many(fetched, get_timeout)
+            values.update(fetched)
+        return values
+
+    def set_many(self, values, get_timeout):
+        """
+        :param values: dictionary key -> value
+        :param get_timeout: function value -> timeout in seconds
+        """
+        values_per_timeout = {}
+        for key, value in values.items():
+            timeout = get_timeout(value)
+            values_per_timeout.setdefault(timeout, {})[self.make_key(key)] = value
+        for timeout, cache_values in values_per_timeout.items():
+            self.cache.set_many(cache_values, timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.make_key(key) for key in keys])
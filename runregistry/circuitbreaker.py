@@ -0,0 +1,117 @@
+"""
+Circuit breaker that protects the application from a slow or unavailable
+Run Registry
+"""
+import threading
+import time
+
+
+class CircuitBreaker:
+    """
+    Keeps track of failing calls and stops calling a failing service for a while.
+
+    closed:    calls are allowed, consecutive failures are counted
+    open:      calls are rejected until the reset timeout has elapsed
+    half-open: a single probe call is allowed, a success closes the circuit,
+               a failure opens it again with a doubled reset timeout
+               (exponential backoff up to max_reset_timeout)
+
+    Example:
+    >>> breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5)
+    >>> breaker.record_failure()
+    >>> breaker.record_failure()
+    >>> breaker.state
+    'open'
+    >>> breaker.allow_request()
+    False
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self, failure_threshold=3, reset_timeout=5, max_reset_timeout=300, clock=None
+    ):
+        """
+        :param failure_threshold: consecutive failures after which the circuit opens
+        :param reset_timeout: seconds until the first probe after the circuit opened
+        :param max_reset_timeout: upper limit of the reset timeout in seconds
+        :param clock: function returning the current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.initial_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock or time.monotonic
+
+        self.failures = 0
+        self.reset_timeout = reset_timeout
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self.retry_at <= self.clock():
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_at(self):
+        """
+        :return: time at which the next probe is allowed, None if not open
+        """
+        if self.opened_at is None:
+            return None
+        return self.opened_at + self.reset_timeout
+
+    def allow_request(self):
+        """
+        :return: True if a call is allowed. In the half-open state only a single
+        caller is allowed to probe, until the outcome has been recorded.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.reset_timeout = self.initial_reset_timeout
+            self.opened_at = None
+            self._state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._current_state() == self.HALF_OPEN or self._probing:
+                self._open(backoff=True)
+            elif self.failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self):
+        """
+        Opens the circuit immediately, e.g. after a failed connection test
+        """
+        with self._lock:
+            self.failures += 1
+            backoff = self._current_state() == self.HALF_OPEN or self._probing
+            self._open(backoff=backoff)
+
+    def _open(self, backoff=False):
+        if backoff:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+        self.opened_at = self.clock()
+        self._state = self.OPEN
+        self._probing = False
@@ -1,26 +1,72 @@
 """"
 RunRegistry Client
 """
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from itertools import groupby
 from json import JSONDecodeError
 from operator import itemgetter
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 
+from runregistry.cache import QueryIdCache, ResultCache
+from runregistry.circuitbreaker import CircuitBreaker
 from runregistry.utilities import (
     transform_lowstat_to_boolean,
     list_to_dict,
     build_range_where_clause,
     build_list_where_clause,
+    unique_run_numbers,
 )
 
 
+class ResourceNotFoundError(Exception):
+    """
+    Raised when resthub answers with "404 Not Found", e.g. for an unknown query id
+    """
+
+
+class ServerError(requests.HTTPError):
+    """
+    Raised when resthub answers with a "5xx" status code
+    """
+
+
+class DeadlineExceeded(requests.Timeout):
+    """
+    Raised when a call took longer than its deadline
+    """
+
+
+class RunRegistryUnavailableError(Exception):
+    """
+    Raised when the Run Registry can not be reached, takes too long to answer or
+    when the circuit breaker is open because the previous calls failed
+    """
+
+
 class Singleton(type):
+    """
+    Creates a single instance per class. The arguments are only used for the
+    first instance, so calling the class again with different arguments raises
+    a ValueError instead of silently ignoring them.
+    """
+
     _instances = {}
+    _arguments = {}
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
             cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            cls._arguments[cls] = (args, kwargs)
+        elif (args or kwargs) and cls._arguments.get(cls) != (args, kwargs):
+            raise ValueError(
+                "{} already exists with different arguments".format(cls.__name__)
+            )
         return cls._instances[cls]
 
 
@@ -39,28 +85,115 @@ class RunRegistryClient(metaclass=Singleton):
     DEFAULT_NAMESPACE = "runreg_tracker"
     DEFAULT_TABLE = "dataset_lumis"
 
-    def __init__(self, url=DEFAULT_URL):
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_TIMEOUT = (3.05, 30)  # (connect, read) in seconds
+    DEFAULT_DEADLINE = 30  # seconds
+    DEFAULT_QUERY_ID_CACHE_SIZE = 256
+
+    def __init__(self, url=DEFAULT_URL, pool_size=None,
+                 timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE,
+                 query_id_cache_size=DEFAULT_QUERY_ID_CACHE_SIZE,
+                 circuit_breaker=None):
+        """
+        :param url: url of the resthub server
+        :param pool_size: maximum number of keep-alive connections kept open,
+        defaults to the RUN_REGISTRY_POOL_SIZE setting
+        :param timeout: timeout of every single request in seconds, either a
+        number or a (connect timeout, read timeout) tuple
+        :param deadline: maximum time in seconds a query may take in total,
+        including the query id lookup and the retry
+        :param query_id_cache_size: number of query ids that are remembered
+        :param circuit_breaker: CircuitBreaker that stops calling the Run Registry
+        after consecutive failures
+        """
+        if pool_size is None:
+            pool_size = getattr(
+                settings, "RUN_REGISTRY_POOL_SIZE", self.DEFAULT_POOL_SIZE
+            )
         self.url = url
-        self._connection_successful = None  # Lazy
+        self.timeout = timeout
+        self.deadline = deadline
+        self.query_id_cache = QueryIdCache(max_size=query_id_cache_size)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._connection_tested = False
+
+        # The adapter holds the connection pool. It is thread-safe and shared by
+        # the sessions of all threads, the sessions themselves are not.
+        self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._thread_local = threading.local()
+
+    @property
+    def session(self):
+        """
+        Keep-alive session of the current thread.
+
+        Every thread (e.g. Django worker thread) gets its own session, but all
+        sessions reuse the connections of the same connection pool.
+        """
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"Connection": "keep-alive"})
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            self._thread_local.session = session
+        return session
+
+    def _get_timeout(self):
+        """
+        Timeout of the next request, shortened to the time that is left until
+        the deadline of the current call (if there is one)
+        """
+        deadline = getattr(self._thread_local, "deadline", None)
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Deadline of {}s exceeded".format(self.deadline))
+        if isinstance(self.timeout, tuple):
+            return tuple(min(timeout, remaining) for timeout in self.timeout)
+        return min(self.timeout, remaining)
+
+    def _get(self, resource, **kwargs):
+        return self.session.get(self.url + resource, timeout=self._get_timeout(), **kwargs)
+
+    def _post(self, resource, **kwargs):
+        return self.session.post(self.url + resource, timeout=self._get_timeout(), **kwargs)
 
     def _test_connection(self):
         try:
-            requests.get(self.url)
-            return True
-        except requests.ConnectionError:
+            response = self._get("")
+            return response.status_code < 500
+        except (requests.ConnectionError, requests.Timeout):
             return False
 
+    @property
+    def state(self):
+        """
+        State of the circuit breaker: "closed", "open" or "half-open"
+        """
+        return self.circuit_breaker.state
+
     def retry_connection(self):
         """
         Retry to connect to Run Registry.
-        Updates return value of the connection_possible method.
+        Updates the circuit breaker and thus the return value of the
+        connection_possible method.
         """
-        self._connection_successful = self._test_connection()
+        self._connection_tested = True
+        if self._test_connection():
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.trip()
 
     def connection_possible(self):
         """
         Check if the connection to the Run Registry is possible.
 
+        Does not block while the circuit breaker is open. After the reset timeout
+        has elapsed (half-open) a single connection test is made, which closes
+        the circuit breaker again if it succeeds.
+
         Example:
         >>> client = RunRegistryClient()
         >>> client.connection_possible()
@@ -68,9 +201,12 @@ class RunRegistryClient(metaclass=Singleton):
 
         :return: True when connection to Run Registry was successful
         """
-        if self._connection_successful is None:
-            self.retry_connection()
-        return self._connection_successful
+        if self._connection_tested and self.circuit_breaker.state == CircuitBreaker.CLOSED:
+            return True
+        if not self.circuit_breaker.allow_request():
+            return False
+        self.retry_connection()
+        return self.circuit_breaker.state == CircuitBreaker.CLOSED
 
     def _get_json_response(self, resource, media_type=None):
         if not self.connection_possible():
@@ -78,30 +214,68 @@ class RunRegistryClient(metaclass=Singleton):
 
         if media_type:
             headers = {"Accept": media_type}
-            response = requests.get(self.url + resource, headers=headers)
+            response = self._get(resource, headers=headers)
+            self._raise_for_status(response, resource)
             return response.content.decode("utf-8")
 
         try:
-            response = requests.get(self.url + resource)
+            response = self._get(resource)
+            self._raise_for_status(response, resource)
             return response.json()
         except JSONDecodeError:
             return {}
 
-    def _get_query_id(self, query):
+    def _get_description(self, resource):
         """
-        Converts a SQL query string into a query id (qid), that will be used to access
-        the RunRegistry.
+        Descriptions of the service, tables and queries are empty when resthub
+        does not know the resource or fails to describe it
 
+        :return: json dictionary or {}
+        """
+        try:
+            return self._get_json_response(resource)
+        except (ResourceNotFoundError, ServerError):
+            return {}
+
+    @staticmethod
+    def _raise_for_status(response, resource):
+        if response.status_code == 404:
+            raise ResourceNotFoundError(resource)
+        if response.status_code >= 500:
+            raise ServerError(
+                "{} {}".format(response.status_code, resource), response=response
+            )
+
+    def _post_query(self, query):
+        """
         POST: /query
 
         :param query: SQL query string
-        :return: query id
+        :return: new query id
         """
-        response = requests.post(self.url + "/query?", data=query)
+        response = self._post("/query?", data=query)
         if response.status_code == 400:
             raise ValueError(response.text)
+        self._raise_for_status(response, "/query")
         return response.text
 
+    def _get_query_id(self, query):
+        """
+        Converts a SQL query string into a query id (qid), that will be used to access
+        the RunRegistry.
+
+        The same query always maps to the same query id, so known query ids are
+        taken from the query id cache instead of asking resthub again.
+
+        :param query: SQL query string
+        :return: query id
+        """
+        query_id = self.query_id_cache.get(query)
+        if query_id is None:
+            query_id = self._post_query(query)
+            self.query_id_cache.set(query, query_id)
+        return query_id
+
     def execute_query(self, query, media_type=None):
         """
         Executes an arbitrary SQL query
@@ -128,15 +302,52 @@ class RunRegistryClient(metaclass=Singleton):
         >>> client.execute_query(query)
         {'data': [[247073], [247076], [247077], [247078], [247079]]}
 
+        Every call has to finish within the deadline. Calls that fail or time out
+        are recorded by the circuit breaker, which rejects all calls for a while
+        after consecutive failures.
+
         :param media_type: Desired media type, e.g. application/xml, text/json
         :param query: SQL query string
         :return: JSON dictionary
+        :raises RunRegistryUnavailableError: if the Run Registry is unavailable
         """
         if not self.connection_possible():
-            return {}
+            raise RunRegistryUnavailableError(
+                "Run Registry is unavailable (circuit breaker {})".format(self.state)
+            )
+
+        self._thread_local.deadline = time.monotonic() + self.deadline
+        try:
+            response = self.__execute_query(query, media_type)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            ServerError,
+            ResourceNotFoundError,
+        ) as e:
+            self.circuit_breaker.record_failure()
+            raise RunRegistryUnavailableError(str(e)) from e
+        finally:
+            self._thread_local.deadline = None
+        self.circuit_breaker.record_success()
+        return response
+
+    def __execute_query(self, query, media_type):
         query_id = self._get_query_id(query)
         resource = "/query/" + query_id + "/data"
-        return self._get_json_response(resource, media_type)
+        try:
+            return self._get_json_response(resource, media_type)
+        except ResourceNotFoundError:
+            # resthub does not know the cached query id anymore (e.g. restart)
+            self.query_id_cache.invalidate(query)
+            query_id = self._get_query_id(query)
+            resource = "/query/" + query_id + "/data"
+            try:
+                return self._get_json_response(resource, media_type)
+            except ResourceNotFoundError:
+                # the new query id is not known either, do not keep it
+                self.query_id_cache.invalidate(query)
+                raise
 
     def get_table_description(self, namespace=DEFAULT_NAMESPACE, table=DEFAULT_TABLE):
         """
@@ -152,7 +363,7 @@ class RunRegistryClient(metaclass=Singleton):
         :return: json containing the table description
         """
         resource = "/table/{}/{}".format(namespace, table)
-        return self._get_json_response(resource)
+        return self._get_description(resource)
 
     def get_queries(self):
         """
@@ -160,7 +371,7 @@ class RunRegistryClient(metaclass=Singleton):
 
         :return: list of queries
         """
-        return self._get_json_response("/queries")
+        return self._get_description("/queries")
 
     def get_query_description(self, query_id):
         """
@@ -168,7 +379,7 @@ class RunRegistryClient(metaclass=Singleton):
 
         :return: json dictionary with query description
         """
-        return self._get_json_response("/query/{}".format(query_id))
+        return self._get_description("/query/{}".format(query_id))
 
     def get_info(self):
         """
@@ -183,7 +394,7 @@ class RunRegistryClient(metaclass=Singleton):
 
         :return json with general information about the service
         """
-        return self._get_json_response("/info")
+        return self._get_description("/info")
 
 
 class TrackerRunRegistryClient(RunRegistryClient):
@@ -191,8 +402,106 @@ class TrackerRunRegistryClient(RunRegistryClient):
     Client to access the Tracker Workspace of the Run Registry
 
     https://cmswbmoffshift.web.cern.ch/cmswbmoffshift/runregistry_offline/index.jsf
+
+    Results are cached per run number (and per fill number) in the Django cache.
+    Runs that are still OPEN or SIGNOFF can change at any time and are cached only
+    for a short time, COMPLETED runs are frozen and are cached for a long time.
+
+    In mirror mode all queries are answered by the local Run Registry mirror
+    (see runregistry.models) instead of the Run Registry itself.
     """
 
+    SHORT_CACHE_TIMEOUT = 5 * 60  # seconds
+    LONG_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # seconds
+    FINAL_STATES = ("COMPLETED",)
+
+    def __init__(self, *args, cache_alias="default", use_mirror=None, **kwargs):
+        """
+        :param cache_alias: alias of the Django cache used to cache the results
+        :param use_mirror: read from the local mirror instead of the Run Registry,
+        defaults to the RUN_REGISTRY_USE_MIRROR setting
+        """
+        super().__init__(*args, **kwargs)
+        if use_mirror is None:
+            use_mirror = getattr(settings, "RUN_REGISTRY_USE_MIRROR", False)
+        self.use_mirror = use_mirror
+        self._mirror = None  # Lazy
+        self.runs_cache = ResultCache("runs", cache_alias)
+        self.fill_number_cache = ResultCache("fill_number", cache_alias)
+        self.fill_runs_cache = ResultCache("fill_runs", cache_alias)
+
+    @property
+    def use_mirror(self):
+        override = getattr(self._thread_local, "use_mirror", None)
+        return self._use_mirror if override is None else override
+
+    @use_mirror.setter
+    def use_mirror(self, use_mirror):
+        self._use_mirror = use_mirror
+
+    @contextmanager
+    def mirror_disabled(self):
+        """
+        Reads from the Run Registry itself inside of the with block, e.g. to
+        fill the mirror. Only affects the current thread, the client is shared.
+        """
+        previous = getattr(self._thread_local, "use_mirror", None)
+        self._thread_local.use_mirror = False
+        try:
+            yield self
+        finally:
+            self._thread_local.use_mirror = previous
+
+    def is_available(self):
+        """
+        Check if Run Registry data can be accessed, either through the local
+        mirror or the Run Registry itself. Does not block while the circuit
+        breaker is open.
+
+        :return: True if queries can be made
+        """
+        return self.use_mirror or self.connection_possible()
+
+    @property
+    def mirror(self):
+        if self._mirror is None:
+            # the models can only be imported once Django is set up
+            from runregistry.mirror import RunRegistryMirror
+
+            self._mirror = RunRegistryMirror()
+        return self._mirror
+
+    def invalidate_cache(self, list_of_run_numbers):
+        """
+        Removes the cached results of the given run numbers
+        """
+        run_numbers = unique_run_numbers(list_of_run_numbers)
+        self.runs_cache.delete_many(run_numbers)
+        self.fill_number_cache.delete_many(run_numbers)
+
+    def _get_runs_cache_timeout(self, datasets):
+        """
+        :param datasets: list of dataset dictionaries of a single run
+        :return: long timeout if all datasets are COMPLETED, short timeout otherwise
+        """
+        if all(dataset["state"] in self.FINAL_STATES for dataset in datasets):
+            return self.LONG_CACHE_TIMEOUT
+        return self.SHORT_CACHE_TIMEOUT
+
+    def _get_fill_number_cache_timeout(self, fill_number):
+        """
+        The fill number of a run does not change anymore once it is known
+        """
+        if fill_number is None:
+            return self.SHORT_CACHE_TIMEOUT
+        return self.LONG_CACHE_TIMEOUT
+
+    def _get_fill_runs_cache_timeout(self, run_numbers):
+        """
+        New runs can be added to a fill as long as the fill is ongoing
+        """
+        return self.SHORT_CACHE_TIMEOUT
+
     def __get_dataset_runs(self, where_clause):
         query = (
             "select r.run_number, r.run_class_name, r.rda_name, r.rda_state, "
@@ -329,9 +638,28 @@ class TrackerRunRegistryClient(RunRegistryClient):
         """
         if not list_of_run_numbers:
             return []
+        if self.use_mirror:
+            return self.mirror.get_runs_by_list(list_of_run_numbers)
 
-        where_clause = build_list_where_clause(list_of_run_numbers, "r.run_number")
-        return self.__get_dataset_runs(where_clause)
+        run_numbers = unique_run_numbers(list_of_run_numbers)
+        runs = self.runs_cache.get_many(
+            run_numbers, self.__fetch_runs, self._get_runs_cache_timeout
+        )
+        return [
+            dataset
+            for run_number in run_numbers
+            for dataset in runs.get(run_number, [])
+        ]
+
+    def __fetch_runs(self, run_numbers):
+        """
+        :return: dictionary run number -> list of dataset dictionaries
+        """
+        where_clause = build_list_where_clause(run_numbers, "r.run_number")
+        runs = OrderedDict()
+        for dataset in self.__get_dataset_runs(where_clause):
+            runs.setdefault(dataset["run_number"], []).append(dataset)
+        return runs
 
     def get_runs_by_range(self, min_run_number, max_run_number):
         """
@@ -347,6 +675,8 @@ class TrackerRunRegistryClient(RunRegistryClient):
         :param max_run_number: last run number
         :return: dictionary containing the queryset
         """
+        if self.use_mirror:
+            return self.mirror.get_runs_by_range(min_run_number, max_run_number)
         where_clause = build_range_where_clause(
             min_run_number, max_run_number, "r.run_number"
         )
@@ -365,6 +695,8 @@ class TrackerRunRegistryClient(RunRegistryClient):
         :param list_of_run_numbers:
         :return:
         """
+        if self.use_mirror:
+            return self.mirror.get_lumi_sections_by_list(list_of_run_numbers)
         where_clause = build_list_where_clause(list_of_run_numbers, "r.rdr_run_number")
         return self.__get_dataset_lumis_runs(where_clause)
 
@@ -382,6 +714,10 @@ class TrackerRunRegistryClient(RunRegistryClient):
         :param max_run_number: last run number
         :return: dictionary containing the queryset
         """
+        if self.use_mirror:
+            return self.mirror.get_lumi_sections_by_range(
+                min_run_number, max_run_number
+            )
         where_clause = build_range_where_clause(
             min_run_number, max_run_number, "r.rdr_run_number"
         )
@@ -397,6 +733,8 @@ class TrackerRunRegistryClient(RunRegistryClient):
         >>> runs[0]["lumi_sections"]
         279
         """
+        if self.use_mirror:
+            return self.mirror.get_active_lumi_runs_by_list(list_of_run_numbers)
         where_clause = build_list_where_clause(list_of_run_numbers, "r.run_number")
         return self.__get_dataset_runs_with_active_lumis(where_clause)
 
@@ -410,24 +748,73 @@ class TrackerRunRegistryClient(RunRegistryClient):
         >>> runs[0]["pixel"]
         'GOOD'
         """
+        if self.use_mirror:
+            return self.mirror.get_active_lumi_runs_by_range(
+                min_run_number, max_run_number
+            )
         where_clause = build_range_where_clause(
             min_run_number, max_run_number, "r.run_number"
         )
         return self.__get_dataset_runs_with_active_lumis(where_clause)
 
-    def get_fill_number_by_run_number(self, list_of_run_numbers):
+    def __fetch_fill_numbers(self, run_numbers):
         """
-        Retrieve a list of fill numbers by the given run numbers
+        :return: dictionary run number -> fill number
+        """
+        where_clause = build_list_where_clause(run_numbers, "r.runnumber")
+        query = (
+            "select r.runnumber, r.lhcfill "
+            "from runreg_tracker.runs r "
+            "where {} "
+            "order by r.runnumber".format(where_clause)
+        )
+        items = self.execute_query(query).get("data", [])
+        return OrderedDict((run_number, fill_number) for run_number, fill_number in items)
 
-        Example:
-        >>> client = TrackerRunRegistryClient()
-        >>> client.get_fill_number_by_run_number([321177, 321178, 321218])
-        [{'run_number': 321177, 'fill_number': 7048}, {'run_number': 321178, 'fill_number': 7048}, {'run_number': 321218, 'fill_number': 7052}]
+    def __fetch_run_numbers_of_fills(self, fill_numbers):
+        """
+        :return: dictionary fill number -> list of run numbers
+        """
+        where_clause = build_list_where_clause(fill_numbers, "r.lhcfill")
+        query = (
+            "select r.lhcfill, r.runnumber "
+            "from runreg_tracker.runs r "
+            "where {} "
+            "order by r.runnumber".format(where_clause)
+        )
+        response = self.execute_query(query).get("data", [])
+        fills = OrderedDict()
+        for fill_number, run_number in response:
+            fills.setdefault(fill_number, []).append(run_number)
+        return fills
 
-        :param list_of_run_numbers:
+    def _get_fill_numbers(self, list_of_run_numbers):
+        """
+        :param list_of_run_numbers: list of run numbers
+        :return: list of (run number, fill number) tuples ordered by run number,
+        runs that are unknown to the Run Registry are left out
+        """
+        if self.use_mirror:
+            return self.mirror.get_fill_numbers(list_of_run_numbers)
+        fill_numbers = self.fill_number_cache.get_many(
+            unique_run_numbers(list_of_run_numbers),
+            self.__fetch_fill_numbers,
+            self._get_fill_number_cache_timeout,
+        )
+        return sorted(fill_numbers.items())
+
+    def get_fill_numbers_by_range(self, min_run_number, max_run_number):
+        """
+        Retrieve the fill numbers of all runs in the given run number range.
+        Always asks the Run Registry, e.g. to fill the local mirror.
+
+        :param min_run_number: first run number
+        :param max_run_number: last run number
         :return: list of dictionaries containing run number and corresponding fill number
         """
-        where_clause = build_list_where_clause(list_of_run_numbers, "r.runnumber")
+        where_clause = build_range_where_clause(
+            min_run_number, max_run_number, "r.runnumber"
+        )
         query = (
             "select r.runnumber, r.lhcfill "
             "from runreg_tracker.runs r "
@@ -438,6 +825,31 @@ class TrackerRunRegistryClient(RunRegistryClient):
         keys = ["run_number", "fill_number"]
         return list_to_dict(items, keys)
 
+    def get_latest_run_number(self):
+        """
+        Always asks the Run Registry, e.g. to fill the local mirror.
+
+        :return: highest run number in the Run Registry or None
+        """
+        query = "select max(r.runnumber) from runreg_tracker.runs r"
+        items = self.execute_query(query).get("data", [])
+        return items[0][0] if items else None
+
+    def get_fill_number_by_run_number(self, list_of_run_numbers):
+        """
+        Retrieve a list of fill numbers by the given run numbers
+
+        Example:
+        >>> client = TrackerRunRegistryClient()
+        >>> client.get_fill_number_by_run_number([321177, 321178, 321218])
+        [{'run_number': 321177, 'fill_number': 7048}, {'run_number': 321178, 'fill_number': 7048}, {'run_number': 321218, 'fill_number': 7052}]
+
+        :param list_of_run_numbers:
+        :return: list of dictionaries containing run number and corresponding fill number
+        """
+        keys = ["run_number", "fill_number"]
+        return list_to_dict(self._get_fill_numbers(list_of_run_numbers), keys)
+
     def get_unique_fill_numbers_by_run_number(self, list_of_run_numbers):
         """
         Retrieve a list of unique fill numbers by the given run numbers
@@ -450,16 +862,8 @@ class TrackerRunRegistryClient(RunRegistryClient):
         :param list_of_run_numbers:
         :return: list of dictionaries containing run number and corresponding fill number
         """
-
-        where_clause = build_list_where_clause(list_of_run_numbers, "r.runnumber")
-        query = (
-            "select r.lhcfill "
-            "from runreg_tracker.runs r "
-            "where {} "
-            "order by r.runnumber".format(where_clause)
-        )
-        runs = self.execute_query(query).get("data", [])
-        return sorted({run[0] for run in runs if run[0] is not None})
+        fill_numbers = self._get_fill_numbers(list_of_run_numbers)
+        return sorted({fill for run, fill in fill_numbers if fill is not None})
 
     def get_run_numbers_by_fill_number(self, list_of_fill_numbers):
         """
@@ -474,16 +878,15 @@ class TrackerRunRegistryClient(RunRegistryClient):
         :return: list of dictionaries containing fill number and corresponding
         list of run numbers
         """
-        where_clause = build_list_where_clause(list_of_fill_numbers, "r.lhcfill")
-        query = (
-            "select r.lhcfill, r.runnumber "
-            "from runreg_tracker.runs r "
-            "where {} "
-            "order by r.runnumber".format(where_clause)
-        )
-        response = self.execute_query(query).get("data", [])
-        groups = groupby(response, itemgetter(0))
-        items = [(key, [item[1] for item in value]) for key, value in groups]
+        if self.use_mirror:
+            fills = self.mirror.get_run_numbers_of_fills(list_of_fill_numbers)
+        else:
+            fills = self.fill_runs_cache.get_many(
+                unique_run_numbers(list_of_fill_numbers),
+                self.__fetch_run_numbers_of_fills,
+                self._get_fill_runs_cache_timeout,
+            )
+        items = sorted(fills.items(), key=lambda fill: fill[1][0])
         keys = ["fill_number", "run_number"]
         return list_to_dict(items, keys)
 
@@ -494,15 +897,8 @@ class TrackerRunRegistryClient(RunRegistryClient):
         >>> client.get_grouped_fill_numbers_by_run_number([321171, 321179, 321181, 321182, 321185])
         [{'fill_number': 7048, 'run_number': [321171, 321179, 321181]}, {'fill_number': 7049, 'run_number': [321182, 321185]}]
         """
-        where_clause = build_list_where_clause(list_of_run_numbers, "r.runnumber")
-        query = (
-            "select r.lhcfill, r.runnumber "
-            "from runreg_tracker.runs r "
-            "where {} "
-            "order by r.runnumber".format(where_clause)
-        )
-        response = self.execute_query(query).get("data", [])
-        groups = groupby(response, itemgetter(0))
-        items = [(key, [item[1] for item in value]) for key, value in groups]
+        fill_numbers = self._get_fill_numbers(list_of_run_numbers)
+        groups = groupby(fill_numbers, itemgetter(1))
+        items = [(key, [item[0] for item in value]) for key, value in groups]
         keys = ["fill_number", "run_number"]
         return list_to_dict(items, keys)
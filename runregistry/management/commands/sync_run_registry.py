@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from runregistry.client import TrackerRunRegistryClient, RunRegistryUnavailableError
+from runregistry.mirror import (
+    get_watermark,
+    get_unfinished_run_numbers,
+    sync_range,
+    sync_list,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Incrementally syncs the local Run Registry mirror. "
+        "All runs above the highest mirrored run number (watermark) are added "
+        "and mirrored runs that were not COMPLETED yet are synced again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=int,
+            help="first run number to sync, defaults to the watermark + 1",
+        )
+        parser.add_argument(
+            "--until",
+            type=int,
+            help="last run number to sync, defaults to the latest run in the Run Registry",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of run numbers that are synced with one query",
+        )
+
+    def handle(self, *args, **options):
+        client = TrackerRunRegistryClient()
+        try:
+            # the mirror itself is always filled from the Run Registry, the
+            # shared client keeps using the mirror everywhere else
+            with client.mirror_disabled():
+                self.sync(client, **options)
+        except RunRegistryUnavailableError as e:
+            raise CommandError("Run Registry is unavailable: {}".format(e))
+
+    def sync(self, client, **options):
+        if not client.connection_possible():
+            raise CommandError("Run Registry is unavailable.")
+
+        watermark = get_watermark()
+        since = options["since"]
+        if since is None:
+            if watermark is None:
+                raise CommandError("The mirror is empty, use --since for the first sync.")
+            since = watermark + 1
+
+        until = options["until"]
+        if until is None:
+            until = client.get_latest_run_number()
+            if until is None:
+                raise CommandError("Latest run number could not be determined.")
+
+        unfinished_run_numbers = [
+            run_number for run_number in get_unfinished_run_numbers() if run_number < since
+        ]
+        refreshed = 0
+        for index in range(0, len(unfinished_run_numbers), 500):
+            refreshed += sync_list(client, unfinished_run_numbers[index : index + 500])
+
+        added = 0
+        batch_size = options["batch_size"]
+        for first_run_number in range(since, until + 1, batch_size):
+            last_run_number = min(first_run_number + batch_size - 1, until)
+            added += sync_range(client, first_run_number, last_run_number)
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    "Synced runs {} to {}".format(first_run_number, last_run_number)
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Synced {} new and {} unfinished runs up to run {}".format(
+                    added, refreshed, until
+                )
+            )
+        )
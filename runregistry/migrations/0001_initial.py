@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2026-10-18 09:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunRegistryDataset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_number', models.PositiveIntegerField(db_index=True)),
+                ('run_class', models.CharField(blank=True, max_length=50)),
+                ('dataset', models.CharField(max_length=150)),
+                ('state', models.CharField(blank=True, max_length=30)),
+                ('shifter', models.CharField(blank=True, max_length=100, null=True)),
+                ('pixel', models.CharField(blank=True, max_length=30, null=True)),
+                ('sistrip', models.CharField(blank=True, max_length=30, null=True)),
+                ('tracking', models.CharField(blank=True, max_length=30, null=True)),
+                ('pixel_lowstat', models.BooleanField(default=False)),
+                ('sistrip_lowstat', models.BooleanField(default=False)),
+                ('tracking_lowstat', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ('run_number', 'dataset'),
+            },
+        ),
+        migrations.CreateModel(
+            name='RunRegistryLumiSection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_number', models.PositiveIntegerField(db_index=True)),
+                ('lhcfill', models.PositiveIntegerField(blank=True, null=True)),
+                ('dataset', models.CharField(max_length=150)),
+                ('section_from', models.PositiveIntegerField()),
+                ('section_to', models.PositiveIntegerField()),
+                ('section_count', models.PositiveIntegerField()),
+                ('cms_active', models.PositiveSmallIntegerField(null=True)),
+                ('beam1_stable', models.PositiveSmallIntegerField(null=True)),
+                ('beam2_stable', models.PositiveSmallIntegerField(null=True)),
+                ('beam1_present', models.PositiveSmallIntegerField(null=True)),
+                ('beam2_present', models.PositiveSmallIntegerField(null=True)),
+                ('tibtid', models.PositiveSmallIntegerField(null=True)),
+                ('tob', models.PositiveSmallIntegerField(null=True)),
+                ('tecp', models.PositiveSmallIntegerField(null=True)),
+                ('tecm', models.PositiveSmallIntegerField(null=True)),
+                ('bpix', models.PositiveSmallIntegerField(null=True)),
+                ('fpix', models.PositiveSmallIntegerField(null=True)),
+            ],
+            options={
+                'ordering': ('run_number', 'dataset', 'section_from'),
+            },
+        ),
+        migrations.CreateModel(
+            name='RunRegistryRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_number', models.PositiveIntegerField(unique=True)),
+                ('fill_number', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('run_number',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='runregistrydataset',
+            unique_together=set([('run_number', 'dataset')]),
+        ),
+    ]
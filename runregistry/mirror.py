@@ -0,0 +1,216 @@
+"""
+Read and sync access to the local Run Registry mirror (see runregistry.models)
+"""
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+
+from runregistry.models import RunRegistryRun, RunRegistryDataset, RunRegistryLumiSection
+from runregistry.utilities import unique_run_numbers
+
+DATASET_KEYS = [
+    "run_number",
+    "run_class",
+    "dataset",
+    "state",
+    "shifter",
+    "pixel",
+    "sistrip",
+    "tracking",
+    "pixel_lowstat",
+    "sistrip_lowstat",
+    "tracking_lowstat",
+]
+
+LUMI_SECTION_KEYS = [
+    "run_number",
+    "lhcfill",
+    "dataset",
+    "section_from",
+    "section_to",
+    "section_count",
+    "cms_active",
+    "beam1_stable",
+    "beam2_stable",
+    "beam1_present",
+    "beam2_present",
+    "tibtid",
+    "tob",
+    "tecp",
+    "tecm",
+    "bpix",
+    "fpix",
+]
+
+FINAL_STATES = ("COMPLETED",)
+
+
+class RunRegistryMirror:
+    """
+    Answers the queries of the TrackerRunRegistryClient from the local mirror.
+
+    All methods return the same structures as the corresponding methods of the
+    TrackerRunRegistryClient, so the mirror can be used as a drop-in replacement.
+    """
+
+    def get_runs_by_list(self, list_of_run_numbers):
+        datasets = RunRegistryDataset.objects.filter(
+            run_number__in=unique_run_numbers(list_of_run_numbers)
+        )
+        return list(datasets.values(*DATASET_KEYS))
+
+    def get_runs_by_range(self, min_run_number, max_run_number):
+        datasets = RunRegistryDataset.objects.filter(
+            run_number__gte=min_run_number, run_number__lte=max_run_number
+        )
+        return list(datasets.values(*DATASET_KEYS))
+
+    def get_lumi_sections_by_list(self, list_of_run_numbers):
+        lumi_sections = RunRegistryLumiSection.objects.filter(
+            run_number__in=unique_run_numbers(list_of_run_numbers)
+        )
+        return list(lumi_sections.values(*LUMI_SECTION_KEYS))
+
+    def get_lumi_sections_by_range(self, min_run_number, max_run_number):
+        lumi_sections = RunRegistryLumiSection.objects.filter(
+            run_number__gte=min_run_number, run_number__lte=max_run_number
+        )
+        return list(lumi_sections.values(*LUMI_SECTION_KEYS))
+
+    def __get_active_lumi_runs(self, run_filter):
+        """
+        Same as the query of the TrackerRunRegistryClient: datasets with the sum
+        of lumi sections in which CMS and all tracker partitions were ready
+        and both beams were stable (except for cosmics)
+        """
+        active_lumi_sections = (
+            RunRegistryLumiSection.objects.filter(run_filter)
+            .filter(
+                Q(beam1_stable=1, beam2_stable=1) | Q(dataset__contains="Cosmics"),
+                cms_active=1,
+                tibtid=1,
+                tob=1,
+                tecp=1,
+                tecm=1,
+                bpix=1,
+                fpix=1,
+            )
+            .values("run_number", "dataset")
+            .annotate(lumi_sections=Sum("section_count"))
+            .order_by()
+        )
+        lumi_sections = {
+            (entry["run_number"], entry["dataset"]): entry["lumi_sections"]
+            for entry in active_lumi_sections
+        }
+
+        runs = []
+        for dataset in RunRegistryDataset.objects.filter(run_filter).values(*DATASET_KEYS):
+            key = (dataset["run_number"], dataset["dataset"])
+            if key in lumi_sections:
+                run = {field: dataset[field] for field in DATASET_KEYS[:3]}
+                run["lumi_sections"] = lumi_sections[key]
+                run.update({field: dataset[field] for field in DATASET_KEYS[3:]})
+                runs.append(run)
+        return runs
+
+    def get_active_lumi_runs_by_list(self, list_of_run_numbers):
+        run_numbers = unique_run_numbers(list_of_run_numbers)
+        return self.__get_active_lumi_runs(Q(run_number__in=run_numbers))
+
+    def get_active_lumi_runs_by_range(self, min_run_number, max_run_number):
+        return self.__get_active_lumi_runs(
+            Q(run_number__gte=min_run_number, run_number__lte=max_run_number)
+        )
+
+    def get_fill_numbers(self, list_of_run_numbers):
+        """
+        :return: list of (run number, fill number) tuples ordered by run number
+        """
+        runs = RunRegistryRun.objects.filter(
+            run_number__in=unique_run_numbers(list_of_run_numbers)
+        )
+        return list(runs.values_list("run_number", "fill_number"))
+
+    def get_run_numbers_of_fills(self, list_of_fill_numbers):
+        """
+        :return: dictionary fill number -> list of run numbers
+        """
+        runs = RunRegistryRun.objects.filter(
+            fill_number__in=unique_run_numbers(list_of_fill_numbers)
+        )
+        fills = {}
+        for run_number, fill_number in runs.values_list("run_number", "fill_number"):
+            fills.setdefault(fill_number, []).append(run_number)
+        return fills
+
+
+def get_watermark():
+    """
+    :return: highest run number in the mirror or None if the mirror is empty
+    """
+    return RunRegistryRun.objects.aggregate(watermark=Max("run_number"))["watermark"]
+
+
+def get_unfinished_run_numbers():
+    """
+    :return: run numbers with datasets that can still change in the Run Registry
+    """
+    datasets = RunRegistryDataset.objects.exclude(state__in=FINAL_STATES)
+    return sorted(set(datasets.values_list("run_number", flat=True)))
+
+
+@transaction.atomic
+def replace_runs(run_filter, datasets, lumi_sections, fill_numbers):
+    """
+    Replaces all mirrored entries that match the run filter
+
+    :param run_filter: Q object filtering by run_number
+    :param datasets: list of dataset dictionaries from the Run Registry
+    :param lumi_sections: list of lumi section dictionaries from the Run Registry
+    :param fill_numbers: list of dictionaries with run_number and fill_number
+    """
+    RunRegistryRun.objects.filter(run_filter).delete()
+    RunRegistryDataset.objects.filter(run_filter).delete()
+    RunRegistryLumiSection.objects.filter(run_filter).delete()
+
+    RunRegistryRun.objects.bulk_create(RunRegistryRun(**run) for run in fill_numbers)
+    RunRegistryDataset.objects.bulk_create(
+        RunRegistryDataset(**{key: dataset[key] for key in DATASET_KEYS})
+        for dataset in datasets
+    )
+    RunRegistryLumiSection.objects.bulk_create(
+        RunRegistryLumiSection(**lumi_section) for lumi_section in lumi_sections
+    )
+
+
+def sync_range(client, min_run_number, max_run_number):
+    """
+    Mirrors all runs in the given run number range
+
+    :return: number of mirrored runs
+    """
+    fill_numbers = client.get_fill_numbers_by_range(min_run_number, max_run_number)
+    replace_runs(
+        Q(run_number__gte=min_run_number, run_number__lte=max_run_number),
+        client.get_runs_by_range(min_run_number, max_run_number),
+        client.get_lumi_sections_by_range(min_run_number, max_run_number),
+        fill_numbers,
+    )
+    return len(fill_numbers)
+
+
+def sync_list(client, list_of_run_numbers):
+    """
+    Mirrors the given runs again, e.g. runs that were not COMPLETED yet
+
+    :return: number of mirrored runs
+    """
+    client.invalidate_cache(list_of_run_numbers)
+    fill_numbers = client.get_fill_number_by_run_number(list_of_run_numbers)
+    replace_runs(
+        Q(run_number__in=list_of_run_numbers),
+        client.get_runs_by_list(list_of_run_numbers),
+        client.get_lumi_sections_by_list(list_of_run_numbers),
+        fill_numbers,
+    )
+    return len(fill_numbers)
@@ -0,0 +1,84 @@
+"""
+Local mirror of the Tracker workspace of the Run Registry
+
+The models mirror the runreg_tracker tables that are used by the
+TrackerRunRegistryClient and are kept up to date by the sync_run_registry
+management command. Field names match the keys of the dictionaries returned
+by the client.
+"""
+from django.db import models
+
+
+class RunRegistryRun(models.Model):
+    """
+    runreg_tracker.runs
+    """
+
+    run_number = models.PositiveIntegerField(unique=True)
+    fill_number = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("run_number",)
+
+    def __str__(self):
+        return "{} (fill {})".format(self.run_number, self.fill_number)
+
+
+class RunRegistryDataset(models.Model):
+    """
+    runreg_tracker.datasets
+    """
+
+    run_number = models.PositiveIntegerField(db_index=True)
+    run_class = models.CharField(max_length=50, blank=True)
+    dataset = models.CharField(max_length=150)
+    state = models.CharField(max_length=30, blank=True)
+    shifter = models.CharField(max_length=100, blank=True, null=True)
+    pixel = models.CharField(max_length=30, blank=True, null=True)
+    sistrip = models.CharField(max_length=30, blank=True, null=True)
+    tracking = models.CharField(max_length=30, blank=True, null=True)
+    pixel_lowstat = models.BooleanField(default=False)
+    sistrip_lowstat = models.BooleanField(default=False)
+    tracking_lowstat = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ("run_number", "dataset")
+        unique_together = ["run_number", "dataset"]
+
+    def __str__(self):
+        return "{} {}".format(self.run_number, self.dataset)
+
+
+class RunRegistryLumiSection(models.Model):
+    """
+    runreg_tracker.dataset_lumis
+
+    Every entry is a range of lumi sections of a dataset with the same
+    detector and beam conditions.
+    """
+
+    run_number = models.PositiveIntegerField(db_index=True)
+    lhcfill = models.PositiveIntegerField(null=True, blank=True)
+    dataset = models.CharField(max_length=150)
+    section_from = models.PositiveIntegerField()
+    section_to = models.PositiveIntegerField()
+    section_count = models.PositiveIntegerField()
+    cms_active = models.PositiveSmallIntegerField(null=True)
+    beam1_stable = models.PositiveSmallIntegerField(null=True)
+    beam2_stable = models.PositiveSmallIntegerField(null=True)
+    beam1_present = models.PositiveSmallIntegerField(null=True)
+    beam2_present = models.PositiveSmallIntegerField(null=True)
+    tibtid = models.PositiveSmallIntegerField(null=True)
+    tob = models.PositiveSmallIntegerField(null=True)
+    tecp = models.PositiveSmallIntegerField(null=True)
+    tecm = models.PositiveSmallIntegerField(null=True)
+    bpix = models.PositiveSmallIntegerField(null=True)
+    fpix = models.PositiveSmallIntegerField(null=True)
+
+    class Meta:
+        ordering = ("run_number", "dataset", "section_from")
+
+    def __str__(self):
+        return "{} {} {}-{}".format(
+            self.run_number, self.dataset, self.section_from, self.section_to
+        )
@@ -1,12 +1,31 @@
+import re
+import threading
+import time
 import unittest
-from unittest.mock import MagicMock
+from io import StringIO
+from unittest.mock import MagicMock, PropertyMock, patch
 
-from runregistry.client import RunRegistryClient
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.test import override_settings
+
+from runregistry.cache import QueryIdCache, ResultCache
+from runregistry.circuitbreaker import CircuitBreaker
+from runregistry.client import (
+    RunRegistryClient,
+    RunRegistryUnavailableError,
+    Singleton,
+    TrackerRunRegistryClient,
+)
+from runregistry.models import RunRegistryRun, RunRegistryDataset, RunRegistryLumiSection
 from runregistry.utilities import (
     transform_lowstat_to_boolean,
     list_as_comma_separated_string,
     list_to_dict,
+    unique_run_numbers,
 )
+from tests.utils.resthub import FakeResthubServer, FakeTrackerRunRegistry
 
 
 class TestRunRegistryClient(unittest.TestCase):
@@ -36,6 +55,493 @@ class TestRunRegistryClient(unittest.TestCase):
         )
 
 
+class TestConnectionPooling(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeResthubServer(rows=[[247073], [247076]]).start()
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.client = RunRegistryClient(url=self.server.url, pool_size=4)
+
+    def tearDown(self):
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.server.stop()
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            response = self.client.execute_query("select 1 from dual")
+            self.assertEqual({"data": [[247073], [247076]]}, response)
+
+        self.assertEqual(7, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_sessions_per_thread_share_pool(self):
+        sessions = []
+
+        def query():
+            self.client.execute_query("select 1 from dual")
+            sessions.append(self.client.session)
+
+        threads = [threading.Thread(target=query) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(3, len({id(session) for session in sessions}))
+        adapters = {id(session.get_adapter(self.server.url)) for session in sessions}
+        self.assertEqual(1, len(adapters))
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_arguments_of_existing_instance(self):
+        self.assertIs(self.client, RunRegistryClient())
+        self.assertIs(self.client, RunRegistryClient(url=self.server.url, pool_size=4))
+        with self.assertRaises(ValueError):
+            RunRegistryClient(url=self.server.url, pool_size=8)
+
+    def test_pool_size_setting(self):
+        Singleton._instances.pop(RunRegistryClient, None)
+        with override_settings(RUN_REGISTRY_POOL_SIZE=2):
+            client = RunRegistryClient(url=self.server.url)
+        self.assertEqual(2, client._adapter._pool_maxsize)
+
+    def test_timeout(self):
+        self.server.latency = 0.5
+        self.client.timeout = 0.05
+        self.assertFalse(self.client._test_connection())
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, max_reset_timeout=30, clock=self.clock
+        )
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_allows_single_probe(self):
+        self.breaker.trip()
+        self.clock.now += 10
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_exponential_backoff(self):
+        self.breaker.trip()
+        for expected_timeout in [20, 30, 30]:
+            self.clock.now += self.breaker.reset_timeout
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+            self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+            self.assertEqual(expected_timeout, self.breaker.reset_timeout)
+
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(10, self.breaker.reset_timeout)
+
+
+class TestCircuitBreakerClient(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeResthubServer(rows=[[247073]]).start()
+        self.clock = FakeClock()
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.client = RunRegistryClient(
+            url=self.server.url,
+            timeout=(0.5, 0.5),
+            deadline=0.2,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=2, reset_timeout=10, clock=self.clock
+            ),
+        )
+
+    def tearDown(self):
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.server.stop()
+
+    def test_failures_open_the_circuit(self):
+        self.server.fail_next(2)
+        for _ in range(2):
+            with self.assertRaises(RunRegistryUnavailableError):
+                self.client.execute_query("select 1 from dual")
+        self.assertEqual("open", self.client.state)
+        self.assertFalse(self.client.connection_possible())
+
+        number_of_requests = len(self.server.requests)
+        with self.assertRaises(RunRegistryUnavailableError):
+            self.client.execute_query("select 1 from dual")
+        self.assertEqual(number_of_requests, len(self.server.requests))
+
+    def test_deadline(self):
+        self.client.connection_possible()
+        self.server.latency = 0.3
+        start = time.monotonic()
+        with self.assertRaises(RunRegistryUnavailableError):
+            self.client.execute_query("select 1 from dual")
+        self.assertLess(time.monotonic() - start, 0.3)
+
+    def test_recovered_server_is_noticed(self):
+        self.server.latency = 0.7
+        self.assertFalse(self.client.connection_possible())
+        self.assertEqual("open", self.client.state)
+
+        self.server.latency = 0
+        self.assertFalse(self.client.connection_possible())
+        self.clock.now += 10
+        self.assertEqual("half-open", self.client.state)
+        self.assertTrue(self.client.connection_possible())
+        self.assertEqual("closed", self.client.state)
+        self.assertEqual({"data": [[247073]]}, self.client.execute_query("select 1 from dual"))
+
+    def test_failed_probe_backs_off(self):
+        self.server.fail_next(2)
+        self.assertFalse(self.client.connection_possible())
+        self.clock.now += 10
+        self.assertFalse(self.client.connection_possible())
+        self.assertEqual(20, self.client.circuit_breaker.reset_timeout)
+        self.clock.now += 20
+        self.assertTrue(self.client.connection_possible())
+
+
+class TestQueryIdCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = QueryIdCache()
+        self.assertIsNone(cache.get("select 1 from dual"))
+        cache.set("select 1 from dual", "o1662d3e8bb1")
+        self.assertEqual("o1662d3e8bb1", cache.get("select 1 from dual"))
+        self.assertEqual("o1662d3e8bb1", cache.get("select 1 from dual"))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_eviction(self):
+        cache = QueryIdCache(max_size=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertEqual(2, len(cache))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_invalidate(self):
+        cache = QueryIdCache()
+        cache.set("a", "1")
+        cache.invalidate("a")
+        cache.invalidate("unknown")
+        self.assertNotIn("a", cache)
+
+
+class TestQueryIdCaching(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeResthubServer(rows=[[247073]]).start()
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.client = RunRegistryClient(url=self.server.url)
+
+    def tearDown(self):
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.server.stop()
+
+    def test_repeated_query_is_posted_once(self):
+        for _ in range(3):
+            self.client.execute_query("select 1 from dual")
+        self.assertEqual(1, self.server.count_requests("POST"))
+        self.assertEqual(3, self.server.count_requests("GET", "/query/"))
+        self.assertEqual(2, self.client.query_id_cache.hits)
+        self.assertEqual(1, self.client.query_id_cache.misses)
+
+    def test_stale_query_id(self):
+        self.client.execute_query("select 1 from dual")
+        self.server.forget_queries()
+        response = self.client.execute_query("select 1 from dual")
+        self.assertEqual({"data": [[247073]]}, response)
+        self.assertEqual(2, self.server.count_requests("POST"))
+
+    def test_query_id_not_found_after_retry(self):
+        self.server.remember_queries = False
+        with self.assertRaises(RunRegistryUnavailableError):
+            self.client.execute_query("select 1 from dual")
+        self.assertEqual(2, self.server.count_requests("POST"))
+        self.assertNotIn("select 1 from dual", self.client.query_id_cache)
+        self.assertEqual(1, self.client.circuit_breaker.failures)
+
+
+class TestDescriptions(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeResthubServer().start()
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.client = RunRegistryClient(url=self.server.url)
+
+    def tearDown(self):
+        Singleton._instances.pop(RunRegistryClient, None)
+        self.server.stop()
+
+    def test_unknown_resource(self):
+        self.assertEqual({}, self.client.get_info())
+        self.assertEqual({}, self.client.get_table_description())
+        self.assertEqual({}, self.client.get_queries())
+        self.assertEqual({}, self.client.get_query_description("o1662d3e8bb1"))
+
+    def test_server_error(self):
+        self.assertTrue(self.client.connection_possible())
+        self.server.fail_next()
+        self.assertEqual({}, self.client.get_info())
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fetches_only_missing_keys(self):
+        result_cache = ResultCache("test")
+        fetch = MagicMock(side_effect=lambda keys: {key: key * 2 for key in keys})
+
+        self.assertEqual({1: 2, 2: 4}, result_cache.get_many([1, 2], fetch, lambda v: 60))
+        fetch.assert_called_once_with([1, 2])
+
+        values = result_cache.get_many([1, 2, 3], fetch, lambda v: 60)
+        self.assertEqual({1: 2, 2: 4, 3: 6}, values)
+        fetch.assert_called_with([3])
+
+        result_cache.get_many([3, 2, 1], fetch, lambda v: 60)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_unknown_keys_are_not_cached(self):
+        result_cache = ResultCache("test")
+        fetch = MagicMock(return_value={})
+        self.assertEqual({}, result_cache.get_many([42], fetch, lambda v: 60))
+        self.assertEqual({}, result_cache.get_many([42], fetch, lambda v: 60))
+        self.assertEqual(2, fetch.call_count)
+
+    def test_timeout_per_value(self):
+        backend = MagicMock()
+        backend.get_many.return_value = {}
+        with patch.object(ResultCache, "cache", new_callable=PropertyMock) as mock:
+            mock.return_value = backend
+            ResultCache("test").get_many(
+                [1, 2, 3],
+                lambda keys: {key: key for key in keys},
+                lambda value: 10 if value == 2 else 20,
+            )
+        backend.set_many.assert_any_call({"runregistry:test:2": 2}, 10)
+        backend.set_many.assert_any_call(
+            {"runregistry:test:1": 1, "runregistry:test:3": 3}, 20
+        )
+
+
+def fake_tracker_run_registry():
+    """
+    Runs 321177 (COMPLETED), 321178 (OPEN) of fill 7048 and 321218 (COMPLETED)
+    of fill 7052
+    """
+    run_registry = FakeTrackerRunRegistry()
+    run_registry.add_run(321177, fill_number=7048, state="COMPLETED")
+    run_registry.add_run(321178, fill_number=7048, state="OPEN")
+    run_registry.add_run(321218, fill_number=7052, state="COMPLETED")
+    return run_registry
+
+
+class TestTrackerResultCaching(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = FakeResthubServer(rows=fake_tracker_run_registry()).start()
+        Singleton._instances.pop(TrackerRunRegistryClient, None)
+        self.client = TrackerRunRegistryClient(url=self.server.url)
+
+    def tearDown(self):
+        Singleton._instances.pop(TrackerRunRegistryClient, None)
+        self.server.stop()
+        cache.clear()
+
+    def queried_run_numbers(self, table):
+        return [
+            sorted(int(number) for number in re.findall(r"'(\d+)'", query))
+            for query in self.server.queries.values()
+            if table in query
+        ]
+
+    def test_runs_are_cached_per_run_number(self):
+        runs = self.client.get_runs_by_list(["321177"])
+        self.assertEqual(1, len(runs))
+        self.assertEqual("COMPLETED", runs[0]["state"])
+
+        runs = self.client.get_runs_by_list([321178, 321177, 999999])
+        self.assertEqual([321178, 321177], [run["run_number"] for run in runs])
+        self.assertEqual(
+            [[321177], [321178, 999999]],
+            sorted(self.queried_run_numbers("runreg_tracker.datasets")),
+        )
+
+        requests_before = len(self.server.requests)
+        self.client.get_runs_by_list([321177, 321178])
+        self.assertEqual(requests_before, len(self.server.requests))
+
+    def test_timeout_depends_on_state(self):
+        client = self.client
+        self.assertEqual(
+            client.LONG_CACHE_TIMEOUT,
+            client._get_runs_cache_timeout([{"state": "COMPLETED"}]),
+        )
+        for state in ["OPEN", "SIGNOFF"]:
+            self.assertEqual(
+                client.SHORT_CACHE_TIMEOUT,
+                client._get_runs_cache_timeout(
+                    [{"state": "COMPLETED"}, {"state": state}]
+                ),
+            )
+
+    def test_fill_numbers(self):
+        self.assertEqual(
+            [7048], self.client.get_unique_fill_numbers_by_run_number([321177])
+        )
+        self.assertEqual(
+            [{"fill_number": 7048, "run_number": [321177, 321178]}],
+            self.client.get_grouped_fill_numbers_by_run_number([321178, 321177]),
+        )
+        self.assertEqual(
+            [
+                {"run_number": 321177, "fill_number": 7048},
+                {"run_number": 321178, "fill_number": 7048},
+            ],
+            self.client.get_fill_number_by_run_number([321177, 321178]),
+        )
+        self.assertEqual(
+            [[321177], [321178]], sorted(self.queried_run_numbers("r.runnumber in"))
+        )
+
+    def test_run_numbers_by_fill_number(self):
+        expected = [{"fill_number": 7048, "run_number": [321177, 321178]}]
+        self.assertEqual(expected, self.client.get_run_numbers_by_fill_number([7048]))
+        self.assertEqual(expected, self.client.get_run_numbers_by_fill_number(["7048"]))
+        self.assertEqual(1, self.server.count_requests("GET", "/query/"))
+
+
+@pytest.fixture
+def run_registry():
+    return fake_tracker_run_registry()
+
+
+@pytest.fixture
+def resthub(run_registry):
+    cache.clear()
+    server = FakeResthubServer(rows=run_registry).start()
+    yield server
+    server.stop()
+    cache.clear()
+
+
+@pytest.fixture
+def tracker_client(resthub):
+    Singleton._instances.pop(TrackerRunRegistryClient, None)
+    yield TrackerRunRegistryClient(url=resthub.url, use_mirror=False)
+    Singleton._instances.pop(TrackerRunRegistryClient, None)
+
+
+def sync_run_registry(**options):
+    call_command("sync_run_registry", stdout=StringIO(), **options)
+
+
+@pytest.mark.django_db
+def test_first_sync_requires_since(tracker_client):
+    with pytest.raises(CommandError):
+        sync_run_registry()
+
+
+@pytest.mark.django_db
+def test_sync(tracker_client):
+    sync_run_registry(since=321000, batch_size=100)
+
+    assert [(321177, 7048), (321178, 7048), (321218, 7052)] == list(
+        RunRegistryRun.objects.values_list("run_number", "fill_number")
+    )
+    assert 3 == RunRegistryDataset.objects.count()
+    assert 3 == RunRegistryLumiSection.objects.count()
+    assert "OPEN" == RunRegistryDataset.objects.get(run_number=321178).state
+
+
+@pytest.mark.django_db
+def test_sync_keeps_the_mirror_of_the_shared_client(tracker_client, resthub):
+    tracker_client.use_mirror = True
+    sync_run_registry(since=321000)
+
+    # the sync itself has asked the Run Registry
+    assert 3 == RunRegistryRun.objects.count()
+    assert TrackerRunRegistryClient() is tracker_client
+    assert tracker_client.use_mirror
+    requests_before = len(resthub.requests)
+    assert [7048] == tracker_client.get_unique_fill_numbers_by_run_number([321177])
+    assert requests_before == len(resthub.requests)
+
+
+@pytest.mark.django_db
+def test_incremental_sync(tracker_client, resthub, run_registry):
+    sync_run_registry(since=321000, until=321218)
+    resthub.forget_queries()
+
+    run_registry.runs[321178][0]["state"] = "COMPLETED"
+    run_registry.add_run(321300, fill_number=7060, state="OPEN")
+    sync_run_registry()
+
+    assert 4 == RunRegistryRun.objects.count()
+    assert "COMPLETED" == RunRegistryDataset.objects.get(run_number=321178).state
+    # only runs above the watermark and unfinished runs are queried
+    queries = "".join(resthub.queries.values())
+    assert ">= '321219'" in queries
+    assert "in ('321178')" in queries
+    assert "'321000'" not in queries
+
+
+@pytest.mark.django_db
+def test_mirror_mode(tracker_client, resthub, django_assert_num_queries):
+    client = tracker_client
+    sync_run_registry(since=321000)
+    run_numbers = [321177, 321178, 321218]
+
+    expected = {
+        "runs": client.get_runs_by_list(run_numbers),
+        "runs_by_range": client.get_runs_by_range(321000, 322000),
+        "lumis": client.get_lumi_sections_by_list(run_numbers),
+        "active": client.get_active_lumi_runs_by_range(321000, 322000),
+        "fills": client.get_fill_number_by_run_number(run_numbers),
+        "grouped": client.get_grouped_fill_numbers_by_run_number(run_numbers),
+        "runs_of_fills": client.get_run_numbers_by_fill_number([7048, 7052]),
+    }
+
+    # the mirror keeps working while the Run Registry is down
+    resthub.stop()
+    client.use_mirror = True
+    with django_assert_num_queries(1):
+        runs = client.get_runs_by_list(run_numbers)
+    assert expected["runs"] == runs
+    assert expected["runs_by_range"] == client.get_runs_by_range(321000, 322000)
+    assert expected["lumis"] == client.get_lumi_sections_by_list(run_numbers)
+    assert expected["active"] == client.get_active_lumi_runs_by_range(321000, 322000)
+    assert expected["fills"] == client.get_fill_number_by_run_number(run_numbers)
+    assert expected["grouped"] == client.get_grouped_fill_numbers_by_run_number(
+        run_numbers
+    )
+    assert expected["runs_of_fills"] == client.get_run_numbers_by_fill_number(
+        [7048, 7052]
+    )
+
+
 class TestUtilities(unittest.TestCase):
     def test_transform_lowstat_to_boolean(self):
         run_dict = {
@@ -80,3 +586,6 @@ class TestUtilities(unittest.TestCase):
         ]
 
         self.assertEqual(expected_dict_list, list_of_dicts)
+
+    def test_unique_run_numbers(self):
+        self.assertEqual([3, 1, 2], unique_run_numbers(["3", 1, "1", 2, 3]))
@@ -1,3 +1,6 @@
+from collections import OrderedDict
+
+
 def transform_lowstat_to_boolean(list_of_run_dict):
     """
     Converts the low_stat properties of the list of run dictionaries into
@@ -27,6 +30,17 @@ def list_as_comma_separated_string(items):
     return ", ".join(["'" + str(item) + "'" for item in items])
 
 
+def unique_run_numbers(items):
+    """
+    Converts a list of run (or fill) numbers into a list of unique integers,
+    keeping the original order
+
+    :param items: list of run numbers, either as integers or strings
+    :return: list of unique run numbers as integers
+    """
+    return list(OrderedDict.fromkeys(int(item) for item in items))
+
+
 def list_to_dict(list_of_lists, keys):
     """
     Turns a list of lists into a list of dictionaries
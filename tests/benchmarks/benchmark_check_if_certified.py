@@ -0,0 +1,177 @@
+"""
+Compares the query per flag category check_if_certified that was used before
+with the single query check_if_certified on growing central certification lists.
+
+Benchmarks are not collected by default, run them explicitly:
+
+    pytest -s tests/benchmarks/benchmark_check_if_certified.py
+"""
+import datetime
+import random
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mixer.backend.django import mixer
+
+from certhelper.models import RunInfo
+from certhelper.utilities.utilities import uniquely_sorted
+
+pytestmark = pytest.mark.django_db
+
+LIST_SIZES = [1250, 2500, 5000]
+FIRST_RUN_NUMBER = 300000
+PROMPT_FRACTION = 0.7
+CHANGED_FLAG_FRACTION = 0.05
+MISSING_FRACTION = 0.1
+
+
+def create_certifications(number_of_runs):
+    random.seed(42)
+    user = mixer.blend("auth.User")
+    reference_run = mixer.blend("certhelper.ReferenceRun")
+    types = {
+        (runtype, reco): mixer.blend("certhelper.Type", runtype=runtype, reco=reco)
+        for runtype in ("Collisions", "Cosmics")
+        for reco in ("Express", "Prompt")
+    }
+
+    def certification(run_number, runtype, reco, flag):
+        return RunInfo(
+            userid=user,
+            type=types[(runtype, reco)],
+            reference_run=reference_run,
+            run_number=run_number,
+            trackermap="Exists",
+            number_of_ls=100,
+            int_luminosity=1,
+            pixel="Good",
+            sistrip=flag,
+            tracking="Good",
+            date=datetime.date(2018, 5, 14),
+        )
+
+    runs = []
+    for run_number in range(FIRST_RUN_NUMBER, FIRST_RUN_NUMBER + number_of_runs):
+        if random.random() < MISSING_FRACTION:
+            continue
+        runtype = random.choice(("Collisions", "Cosmics"))
+        flag = random.choice(("Good", "Good", "Good", "Bad"))
+        runs.append(certification(run_number, runtype, "Express", flag))
+        if random.random() < PROMPT_FRACTION:
+            if random.random() < CHANGED_FLAG_FRACTION:
+                flag = "Bad" if flag == "Good" else "Good"
+            runs.append(certification(run_number, runtype, "Prompt", flag))
+    RunInfo.objects.bulk_create(runs)
+
+
+def per_category_check_if_certified(list_of_run_numbers):
+    """
+    check_if_certified the way it was implemented before it used a single query
+    """
+    list_of_run_numbers = uniquely_sorted(list_of_run_numbers)
+    runs = RunInfo.objects.filter(run_number__in=list_of_run_numbers).annotate_status()
+
+    def do_check(runs):
+        flags = {
+            "good": [],
+            "bad": [],
+            "missing": [],
+            "prompt_missing": [],
+            "changed_good": [],
+            "changed_bad": [],
+        }
+        prompt_runs = runs.prompt()
+        flags["good"] = prompt_runs.good().run_numbers()
+        flags["bad"] = prompt_runs.bad().run_numbers()
+        non_missing_prompt_run_numbers = [
+            run["run_number"]
+            for run in prompt_runs.order_by("run_number").values("run_number").distinct()
+        ]
+        non_missing_run_numbers = [
+            run["run_number"]
+            for run in runs.order_by("run_number").values("run_number").distinct()
+        ]
+        flags["prompt_missing"] = list(
+            set(non_missing_run_numbers) - set(non_missing_prompt_run_numbers)
+        )
+        express_runs = runs.express().filter(run_number__in=non_missing_run_numbers)
+        for run in express_runs.good().run_numbers():
+            if run in flags["bad"]:
+                flags["bad"].remove(run)
+                flags["changed_bad"].append(run)
+        for run in express_runs.bad().run_numbers():
+            if run in flags["good"]:
+                flags["good"].remove(run)
+                flags["changed_good"].append(run)
+        for d in flags.values():
+            d.sort()
+        return flags
+
+    check_dictionary = {
+        "collisions": do_check(runs.collisions()),
+        "cosmics": do_check(runs.cosmics()),
+    }
+    non_missing_run_numbers = [
+        run_number
+        for flags in check_dictionary.values()
+        for run_numbers in flags.values()
+        for run_number in run_numbers
+    ]
+    check_dictionary["missing"] = sorted(
+        set(list_of_run_numbers) - set(non_missing_run_numbers)
+    )
+    return check_dictionary
+
+
+def measure(function, *args, repetitions=3):
+    """
+    :return: tuple (fastest duration, number of queries per call, result)
+    """
+    durations = []
+    with CaptureQueriesContext(connection) as context:
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            result = function(*args)
+            durations.append(time.perf_counter() - start)
+    return min(durations), len(context.captured_queries) // repetitions, result
+
+
+def test_benchmark_per_category_vs_single_query():
+    create_certifications(max(LIST_SIZES))
+
+    print()
+    print(
+        "{:>6} {:>20} {:>10} {:>20} {:>10}".format(
+            "runs", "per category [ms]", "queries", "single query [ms]", "queries"
+        )
+    )
+    durations = []
+    for size in LIST_SIZES:
+        run_numbers = [
+            str(run_number)
+            for run_number in range(FIRST_RUN_NUMBER, FIRST_RUN_NUMBER + size)
+        ]
+        per_category_duration, per_category_queries, per_category_result = measure(
+            per_category_check_if_certified, run_numbers
+        )
+        single_duration, single_queries, single_result = measure(
+            RunInfo.objects.check_if_certified, run_numbers
+        )
+        durations.append(single_duration)
+        print(
+            "{:>6} {:20.1f} {:10} {:20.1f} {:10}".format(
+                size,
+                per_category_duration * 1000,
+                per_category_queries,
+                single_duration * 1000,
+                single_queries,
+            )
+        )
+
+        assert per_category_result == single_result
+        assert single_queries == 1
+
+    # 4 times the runs should take roughly 4 times as long, not 16 times
+    assert durations[-1] / durations[0] < 8
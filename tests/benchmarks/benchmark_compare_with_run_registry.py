@@ -0,0 +1,78 @@
+"""
+Compares the linear scan that was used to find the Run Registry counterparts of
+deviating runs with the (run_number, reco) index of diff_with_run_registry.
+
+Benchmarks are not collected by default, run them explicitly:
+
+    pytest -s tests/benchmarks/benchmark_compare_with_run_registry.py
+"""
+import random
+import time
+
+from certhelper.utilities.utilities import diff_with_run_registry
+
+NUMBER_OF_ENTRIES = 50000
+DEVIATING_FRACTION = 0.01
+RECOS = ["Express", "Prompt", "reReco"]
+
+
+def synthetic_entries():
+    """
+    :return: tuple (RunInfo tuples, Run Registry tuples)
+    """
+    random.seed(42)
+    run_registry = [
+        (300000 + i // len(RECOS), "Collisions", RECOS[i % len(RECOS)],
+         "Good", "Good", "Good", False, False)
+        for i in range(NUMBER_OF_ENTRIES)
+    ]
+    run_info = list(run_registry)
+    for i in random.sample(range(NUMBER_OF_ENTRIES), int(NUMBER_OF_ENTRIES * DEVIATING_FRACTION)):
+        run_info[i] = run_info[i][:3] + ("Bad",) + run_info[i][4:]
+    return run_info, run_registry
+
+
+def linear_scan_diff(run_info_tuples, run_registry_tuples):
+    """
+    Diff the way compare_with_run_registry did before it used an index
+    """
+    run_registry_tuple_set = set(run_registry_tuples)
+    deviating = sorted(set(run_info_tuples) - run_registry_tuple_set)
+    corresponding = []
+    for run in deviating:
+        elements = list(
+            filter(lambda x: x[0] == run[0] and x[2] == run[2], run_registry_tuple_set)
+        )
+        corresponding.extend(elements)
+    return deviating, corresponding
+
+
+def indexed_diff(run_info_tuples, run_registry_tuples):
+    deviating = []
+    corresponding = []
+    for run, elements in diff_with_run_registry(run_info_tuples, run_registry_tuples):
+        deviating.append(run)
+        corresponding.extend(elements)
+    return deviating, corresponding
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def test_benchmark_linear_scan_vs_index():
+    run_info, run_registry = synthetic_entries()
+
+    linear_duration, linear_result = measure(linear_scan_diff, run_info, run_registry)
+    indexed_duration, indexed_result = measure(indexed_diff, run_info, run_registry)
+
+    print()
+    print("{} entries, {} deviating".format(NUMBER_OF_ENTRIES, len(indexed_result[0])))
+    print("{:12} {:>12}".format("", "time [ms]"))
+    print("{:12} {:12.1f}".format("linear scan", linear_duration * 1000))
+    print("{:12} {:12.1f}".format("index", indexed_duration * 1000))
+
+    assert linear_result == indexed_result
+    assert indexed_duration < linear_duration
@@ -0,0 +1,149 @@
+"""
+Compares the memory and time needed to compute report statistics from model
+instances and querysets with the columnar RunSnapshot on 100k certifications.
+
+Benchmarks are not collected by default, run them explicitly:
+
+    pytest -s tests/benchmarks/benchmark_run_snapshot.py
+"""
+import datetime
+import random
+import time
+import tracemalloc
+
+import pytest
+from mixer.backend.django import mixer
+
+from certhelper.models import RunInfo, FlagChangedRun
+
+pytestmark = pytest.mark.django_db
+
+NUMBER_OF_RUNS = 100000
+FIRST_DAY = datetime.date(2018, 1, 1)
+NUMBER_OF_DAYS = 365
+FIRST_RUN_NUMBER = 300000
+DAYS_PER_REPORT = 7
+
+CRITERIA = [
+    {"runtype": runtype, "reco": reco, "status": status}
+    for runtype in ("Collisions", "Cosmics")
+    for reco in ("Express", "Prompt")
+    for status in ("good", "bad")
+]
+
+
+def create_certifications():
+    random.seed(42)
+    user = mixer.blend("auth.User")
+    reference_run = mixer.blend("certhelper.ReferenceRun")
+    types = {
+        (runtype, reco): mixer.blend("certhelper.Type", runtype=runtype, reco=reco)
+        for runtype in ("Collisions", "Cosmics")
+        for reco in ("Express", "Prompt")
+    }
+
+    runs = []
+    for index in range(NUMBER_OF_RUNS):
+        runtype = random.choice(("Collisions", "Cosmics"))
+        reco = random.choice(("Express", "Prompt"))
+        runs.append(
+            RunInfo(
+                userid=user,
+                type=types[(runtype, reco)],
+                reference_run=reference_run,
+                run_number=FIRST_RUN_NUMBER + index // 2,
+                trackermap=random.choice(("Exists", "Missing")),
+                number_of_ls=random.randint(1, 2000),
+                int_luminosity=random.uniform(0, 500),
+                pixel="Good",
+                sistrip=random.choice(("Good", "Good", "Good", "Bad")),
+                tracking="Good",
+                comment="Some comment about the run " * 3,
+                date=FIRST_DAY
+                + datetime.timedelta(days=index * NUMBER_OF_DAYS // NUMBER_OF_RUNS),
+            )
+        )
+    RunInfo.objects.bulk_create(runs)
+    # bulk_create bypasses the hooks that keep the flag change index up to date
+    FlagChangedRun.objects.rebuild()
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def measure_memory(function):
+    """
+    :return: memory that is still allocated by the result of the function
+    """
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def queryset_statistics(runs, days):
+    return [
+        runs.filter(date=day, **criteria).stats()
+        for day in days
+        for criteria in CRITERIA
+    ]
+
+
+def snapshot_statistics(snapshot, days):
+    return [
+        snapshot.select(dict(criteria, date=day)).stats()
+        for day in days
+        for criteria in CRITERIA
+    ]
+
+
+def test_benchmark_queryset_vs_snapshot():
+    create_certifications()
+    runs = RunInfo.objects.all()
+    days = [FIRST_DAY + datetime.timedelta(days=day) for day in range(DAYS_PER_REPORT)]
+
+    def load_instances():
+        return list(runs.select_related("type", "reference_run"))
+
+    instances_memory = measure_memory(load_instances)
+    instances_duration = measure(load_instances)[1]
+    snapshot_memory = measure_memory(runs.snapshot)
+    snapshot, snapshot_duration = measure(runs.snapshot)
+
+    queryset_result, queryset_stats_duration = measure(
+        lambda: queryset_statistics(runs, days)
+    )
+    snapshot_result, snapshot_stats_duration = measure(
+        lambda: snapshot_statistics(snapshot, days)
+    )
+
+    print()
+    print("{} certifications".format(len(snapshot)))
+    print("{:22} {:>12} {:>14}".format("", "time [ms]", "memory [MB]"))
+    print(
+        "{:22} {:12.1f} {:14.1f}".format(
+            "load model instances", instances_duration * 1000, instances_memory / 1e6
+        )
+    )
+    print(
+        "{:22} {:12.1f} {:14.1f}".format(
+            "build snapshot", snapshot_duration * 1000, snapshot_memory / 1e6
+        )
+    )
+    print("{:22} {:12.1f}".format("queryset statistics", queryset_stats_duration * 1000))
+    print("{:22} {:12.1f}".format("snapshot statistics", snapshot_stats_duration * 1000))
+
+    for expected, actual in zip(queryset_result, snapshot_result):
+        assert expected["total_number"] == actual["total_number"]
+        assert expected["lumisections"] == actual["lumisections"]
+        assert expected["integrated_luminosity"] == pytest.approx(
+            actual["integrated_luminosity"]
+        )
+    assert snapshot_memory < instances_memory / 10
+    assert snapshot_duration < instances_duration
+    assert snapshot_stats_duration < queryset_stats_duration
@@ -0,0 +1,55 @@
+"""
+Compares the latency of pooled (keep-alive) and unpooled Run Registry queries
+against a local stand-in resthub server.
+
+Benchmarks are not collected by default, run them explicitly:
+
+    pytest -s tests/benchmarks/benchmark_runregistry_client.py
+"""
+import time
+
+import requests
+
+from runregistry.client import RunRegistryClient, Singleton
+from tests.utils.resthub import FakeResthubServer
+
+NUMBER_OF_QUERIES = 200
+QUERY = "select r.runnumber, r.lhcfill from runreg_tracker.runs r"
+
+
+def unpooled_query(url, query):
+    """
+    Query the way the client did before it used a connection pool
+    """
+    query_id = requests.post(url + "/query?", data=query).text
+    return requests.get(url + "/query/" + query_id + "/data").json()
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    for _ in range(NUMBER_OF_QUERIES):
+        function(*args)
+    return (time.perf_counter() - start) / NUMBER_OF_QUERIES
+
+
+def test_benchmark_pooled_vs_unpooled():
+    with FakeResthubServer(rows=[[321177, 7048], [321178, 7048]]) as server:
+        unpooled_latency = measure(unpooled_query, server.url, QUERY)
+        unpooled_connections = server.connections
+
+        server.connections = 0
+        Singleton._instances.pop(RunRegistryClient, None)
+        client = RunRegistryClient(url=server.url)
+        pooled_latency = measure(client.execute_query, QUERY)
+        pooled_connections = server.connections
+        Singleton._instances.pop(RunRegistryClient, None)
+
+    print()
+    print("{:10} {:>15} {:>12}".format("", "latency [ms]", "connections"))
+    print("{:10} {:15.3f} {:12}".format(
+        "unpooled", unpooled_latency * 1000, unpooled_connections))
+    print("{:10} {:15.3f} {:12}".format(
+        "pooled", pooled_latency * 1000, pooled_connections))
+
+    assert pooled_connections == 1
+    assert unpooled_connections == 2 * NUMBER_OF_QUERIES
@@ -0,0 +1,170 @@
+"""
+Compares the per group queries that summary_per_day used to run with the
+batched summary_per_day on a year of synthetic certifications.
+
+Benchmarks are not collected by default, run them explicitly:
+
+    pytest -s tests/benchmarks/benchmark_summary_per_day.py
+"""
+import collections
+import datetime
+import random
+import time
+
+import pytest
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.db import connection
+from django.db.models import Count, Sum, FloatField
+from django.db.models.functions import ExtractWeekDay
+from django.test.utils import CaptureQueriesContext
+from mixer.backend.django import mixer
+
+from certhelper.models import RunInfo, FlagChangedRun
+
+pytestmark = pytest.mark.django_db
+
+FIRST_DAY = datetime.date(2018, 1, 1)
+NUMBER_OF_DAYS = 365
+RUNS_PER_DAY = 4
+PROMPT_FRACTION = 0.7
+CHANGED_FLAG_FRACTION = 0.05
+
+
+def create_year_of_certifications():
+    """
+    Every run is certified in Express and most of them two days later in Prompt,
+    a few of them with a different flag
+    """
+    random.seed(42)
+    user = mixer.blend("auth.User")
+    reference_run = mixer.blend("certhelper.ReferenceRun")
+    types = {
+        (runtype, reco): mixer.blend("certhelper.Type", runtype=runtype, reco=reco)
+        for runtype in ("Collisions", "Cosmics")
+        for reco in ("Express", "Prompt")
+    }
+
+    def certification(run_number, runtype, reco, date, flag):
+        return RunInfo(
+            userid=user,
+            type=types[(runtype, reco)],
+            reference_run=reference_run,
+            run_number=run_number,
+            trackermap="Exists",
+            number_of_ls=random.randint(1, 2000),
+            int_luminosity=random.uniform(0, 500),
+            pixel="Good",
+            sistrip=flag,
+            tracking="Good",
+            date=date,
+        )
+
+    runs = []
+    run_number = 300000
+    for day in range(NUMBER_OF_DAYS):
+        date = FIRST_DAY + datetime.timedelta(days=day)
+        for _ in range(RUNS_PER_DAY):
+            run_number += 1
+            runtype = random.choice(("Collisions", "Cosmics"))
+            flag = random.choice(("Good", "Good", "Good", "Bad"))
+            runs.append(certification(run_number, runtype, "Express", date, flag))
+            if random.random() < PROMPT_FRACTION:
+                if random.random() < CHANGED_FLAG_FRACTION:
+                    flag = "Bad" if flag == "Good" else "Good"
+                prompt_date = date + datetime.timedelta(days=2)
+                runs.append(certification(run_number, runtype, "Prompt", prompt_date, flag))
+    RunInfo.objects.bulk_create(runs)
+    # bulk_create bypasses the hooks that keep the flag change index up to date
+    FlagChangedRun.objects.rebuild()
+    return len(runs)
+
+
+def per_group_summary_per_day(runs):
+    """
+    summary_per_day the way it was implemented before it was batched
+    """
+    summary_dict = (
+        runs.order_by("date", "type__runtype", "type__reco")
+        .values("date", "type__runtype", "type__reco")
+        .annotate(
+            runs_certified=Count("pk"),
+            int_luminosity=Sum("int_luminosity", output_field=FloatField()),
+            number_of_ls=Sum("number_of_ls"),
+            day=(ExtractWeekDay("date")),
+        )
+    )
+    for d in summary_dict:
+        group = runs.filter(
+            date=d.get("date"),
+            type__runtype=d.get("type__runtype"),
+            type__reco=d.get("type__reco"),
+        ).order_by("run_number")
+        run_numbers = [run.run_number for run in group]
+        d.update({"run_numbers": per_run_compare_list_if_certified(runs, run_numbers)})
+    return list(summary_dict)
+
+
+def per_run_compare_list_if_certified(queryset, list_of_run_numbers):
+    d = {"good": [], "bad": [], "missing": [], "different_flags": []}
+    runs = queryset.annotate_status()
+    changed_flag_runs = runs.filter(
+        run_number__in=list_of_run_numbers
+    ).filter_flag_changed()
+    for run_number in list_of_run_numbers:
+        try:
+            run = runs.get(run_number=run_number)
+            d[run.status].append(run_number)
+        except ObjectDoesNotExist:
+            d["missing"].append(run_number)
+        except MultipleObjectsReturned:
+            if changed_flag_runs.filter(run_number=run_number).exists():
+                d["different_flags"].append(run_number)
+            else:
+                d[runs.filter(run_number=run_number)[0].status].append(run_number)
+    return d
+
+
+def measure(function, *args):
+    # the per group summary runs more queries than the query log keeps by default
+    connection.queries_log = collections.deque(maxlen=100000)
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+    return duration, len(context.captured_queries), result
+
+
+def test_benchmark_per_group_vs_batched():
+    number_of_certifications = create_year_of_certifications()
+    runs = RunInfo.objects.all()
+
+    per_group_duration, per_group_queries, per_group_result = measure(
+        per_group_summary_per_day, runs
+    )
+    batched_duration, batched_queries, batched_result = measure(
+        RunInfo.objects.all().summary_per_day
+    )
+
+    print()
+    print(
+        "{} certifications in {} days, {} groups".format(
+            number_of_certifications, NUMBER_OF_DAYS, len(batched_result)
+        )
+    )
+    print("{:10} {:>12} {:>10}".format("", "time [ms]", "queries"))
+    print(
+        "{:10} {:12.1f} {:10}".format(
+            "per group", per_group_duration * 1000, per_group_queries
+        )
+    )
+    print(
+        "{:10} {:12.1f} {:10}".format("batched", batched_duration * 1000, batched_queries)
+    )
+
+    assert len(per_group_result) == len(batched_result)
+    for expected, actual in zip(per_group_result, batched_result):
+        assert expected["run_numbers"] == actual["run_numbers"]
+        assert expected["day"] == actual["day"]
+        assert expected["number_of_ls"] == actual["number_of_ls"]
+    assert batched_queries <= 2
+    assert batched_duration < per_group_duration
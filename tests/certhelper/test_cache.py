@@ -0,0 +1,92 @@
+import pytest
+from django.apps import apps
+from django.core.cache import cache
+from django.db.migrations.state import ProjectState
+from django.db.models import F
+from django.http import QueryDict
+from mixer.backend.django import mixer
+
+from certhelper.cache import ReportCache, filter_signature
+from certhelper.models import RunInfo, ReportVersion
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+def assert_invalidates(function):
+    version = ReportCache.version()
+    function()
+    assert ReportCache.version() != version
+
+
+class TestReportCache:
+    def test_get_or_set(self):
+        report_cache = ReportCache("test")
+        assert report_cache.get_or_set(["a"], lambda: "report") == "report"
+        assert report_cache.get_or_set(["a"], lambda: "other report") == "report"
+        assert report_cache.get_or_set(["b"], lambda: "other report") == "other report"
+
+    def test_invalidate(self):
+        report_cache = ReportCache("test")
+        report_cache.set(["a"], "report")
+        ReportCache.invalidate()
+        assert report_cache.get(["a"]) is None
+
+    def test_version_is_shared_by_processes(self):
+        report_cache = ReportCache("test")
+        report_cache.set(["a"], "report")
+        # another process only shares the database, not the cache
+        cache.clear()
+        ReportCache.invalidate()
+        report_cache.set(["a"], "new report")
+        # the version of this process is read from the database again
+        assert report_cache.get(["a"]) == "new report"
+        ReportVersion.objects.update(version=F("version") + 1)
+        assert report_cache.get(["a"]) is None
+
+    def test_missing_version(self):
+        ReportVersion.objects.all().delete()
+        assert ReportCache.version() == "0"
+        ReportCache.invalidate()
+        assert ReportCache.version() == "1"
+
+    def test_changes_invalidate(self):
+        run = mixer.blend("certhelper.RunInfo")
+        runs = RunInfo.objects.filter(pk=run.pk)
+
+        assert_invalidates(lambda: mixer.blend("certhelper.RunInfo"))
+        assert_invalidates(run.save)
+        assert_invalidates(lambda: runs.update(comment="changed"))
+        assert_invalidates(lambda: runs.update(pixel="Bad"))
+        assert_invalidates(runs.delete)
+        assert_invalidates(RunInfo.all_objects.filter(pk=run.pk).restore)
+        assert_invalidates(run.type.save)
+        assert_invalidates(run.reference_run.save)
+        category = mixer.blend("categories.Category")
+        assert_invalidates(lambda: run.problem_categories.add(category))
+        assert_invalidates(lambda: RunInfo.objects.bulk_create([]))
+        assert_invalidates(run.hard_delete)
+
+    def test_historical_models_do_not_invalidate(self):
+        run = mixer.blend("certhelper.RunInfo")
+        historical_apps = ProjectState.from_apps(apps).apps
+        HistoricalRunInfo = historical_apps.get_model("certhelper", "RunInfo")
+        runs = HistoricalRunInfo.objects.filter(pk=run.pk)
+
+        version = ReportCache.version()
+        runs.update(comment="changed")
+        runs.delete()
+        assert ReportCache.version() == version
+
+
+def test_filter_signature():
+    assert filter_signature(
+        QueryDict("date__lte=2018-06-17&date__gte=2018-06-11&page=2&type=")
+    ) == (("date__gte", ("2018-06-11",)), ("date__lte", ("2018-06-17",)))
+    assert filter_signature(QueryDict("userid=2&userid=1")) == filter_signature(
+        QueryDict("userid=1&userid=2")
+    )
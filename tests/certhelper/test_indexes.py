@@ -0,0 +1,67 @@
+"""
+Makes sure that the main list, shift leader and summary queries use an index
+on the RunInfo table instead of falling back to a sequential scan
+"""
+import pytest
+from django.test import RequestFactory
+from mixer.backend.django import mixer
+
+from certhelper.filters import RunInfoFilter, ShiftLeaderRunInfoFilter
+from certhelper.models import RunInfo
+from certhelper.utilities.utilities import get_runs_from_request_filters
+from tests.utils.explain import sequential_scans
+
+pytestmark = pytest.mark.django_db
+
+RUNINFO_TABLE = RunInfo._meta.db_table
+
+
+def assert_uses_index(queryset):
+    assert RUNINFO_TABLE not in sequential_scans(queryset), queryset.query
+
+
+def test_sequential_scan_is_detected():
+    assert RUNINFO_TABLE in sequential_scans(RunInfo.objects.filter(comment="x"))
+
+
+def test_list_queries(django_user_model):
+    user = mixer.blend(django_user_model)
+    type_ = mixer.blend("certhelper.Type")
+    runs = RunInfo.objects.filter(userid=user)
+
+    for parameters in [
+        {"date": "2018-06-13"},
+        {"date_range_0": "2018-06-11", "date_range_1": "2018-06-17"},
+        {"runs_0": "317000", "runs_1": "318000"},
+        {"type": str(type_.pk)},
+    ]:
+        assert_uses_index(RunInfoFilter(parameters, queryset=runs).qs)
+
+
+def test_shiftleader_queries(django_user_model):
+    user = mixer.blend(django_user_model)
+    type_ = mixer.blend("certhelper.Type")
+
+    for parameters in [
+        {"date__gte": "2018-06-11", "date__lte": "2018-06-17"},
+        {"run_number__in": "317696,317697"},
+        {"run_number__gte": "317000", "run_number__lte": "318000"},
+        {"userid": [user.pk], "date__gte": "2018-06-11"},
+        {"type": str(type_.pk)},
+    ]:
+        runs = ShiftLeaderRunInfoFilter(parameters, queryset=RunInfo.objects.all()).qs
+        assert_uses_index(runs)
+        assert_uses_index(runs.filter_flag_changed(until="2018-06-17"))
+
+
+def test_summary_queries(django_user_model):
+    request = RequestFactory().get(
+        "/", {"date_range_0": "2018-06-11", "date_range_1": "2018-06-17"}
+    )
+    request.user = mixer.blend(django_user_model)
+    type_ = mixer.blend("certhelper.Type")
+    runs = get_runs_from_request_filters(request, [], [], [])
+
+    assert_uses_index(runs)
+    assert_uses_index(runs.filter(type=type_))
+    assert_uses_index(RunInfo.objects.filter(run_number__in=[317696, 317697]).good())
@@ -173,6 +173,51 @@ class TestRunInfoManager:
         assert a["int_luminosity"] == 0
         assert a["number_of_ls"] == 25
 
+    def test_summary_run_numbers(self, django_assert_num_queries):
+        conditions = [
+            [5, "Collisions", "Express", "Good", "Good", "Good"],
+            [3, "Collisions", "Express", "Bad", "Good", "Good"],
+            [4, "Collisions", "Express", "Lowstat", "Good", "Lowstat"],
+            [2, "Cosmics", "Express", "Bad", "Good", "Good"],
+            [1, "Cosmics", "Express", "Good", "Excluded", "Good"],
+            [6, "Collisions", "Prompt", "Good", "Good", "Bad"],
+        ]
+
+        for condition in conditions:
+            mixer.blend(
+                "certhelper.RunInfo",
+                run_number=condition[0],
+                type=mixer.blend(
+                    "certhelper.Type", runtype=condition[1], reco=condition[2]
+                ),
+                pixel=condition[3],
+                sistrip=condition[4],
+                tracking=condition[5],
+            )
+
+        with django_assert_num_queries(1):
+            summary = RunInfo.objects.all().summary()
+
+        assert [(d["type__runtype"], d["type__reco"]) for d in summary] == [
+            ("Collisions", "Express"),
+            ("Collisions", "Prompt"),
+            ("Cosmics", "Express"),
+        ]
+        assert summary[0]["run_numbers"] == {"good": [4, 5], "bad": [3]}
+        assert summary[1]["run_numbers"] == {"good": [], "bad": [6]}
+        assert summary[2]["run_numbers"] == {"good": [2], "bad": [1]}
+
+        for d in summary:
+            runs = RunInfo.objects.filter(
+                type__runtype=d["type__runtype"], type__reco=d["type__reco"]
+            )
+            assert d["run_numbers"]["good"] == sorted(
+                runs.good().values_list("run_number", flat=True)
+            )
+            assert d["run_numbers"]["bad"] == sorted(
+                runs.bad().values_list("run_number", flat=True)
+            )
+
     def test_summary_per_day(self):
         conditions = [
             ["Cosmics", "Express", 0.1234, 72, "2018-05-14"],
@@ -240,6 +285,54 @@ class TestRunInfoManager:
         assert get_from_summary(summary, date="2018-05-18")[0]["number_of_ls"] == 144
         assert get_from_summary(summary, date="2018-05-14")[2]["int_luminosity"] == 0.1234
 
+    def test_summary_per_day_run_numbers(self, django_assert_max_num_queries):
+        conditions = [
+            [1, "Collisions", "Express", "Good", "2018-05-14"],
+            [1, "Collisions", "Prompt", "Bad", "2018-05-15"],
+            [2, "Collisions", "Express", "Good", "2018-05-14"],
+            [2, "Collisions", "Prompt", "Good", "2018-05-15"],
+            [3, "Collisions", "Express", "Bad", "2018-05-14"],
+            [4, "Cosmics", "Express", "Good", "2018-05-20"],
+            [4, "Cosmics", "Prompt", "Good", "2018-05-21"],
+            [4, "Cosmics", "reReco", "Bad", "2018-06-21"],
+        ]
+
+        for condition in conditions:
+            mixer.blend(
+                "certhelper.RunInfo",
+                run_number=condition[0],
+                type=mixer.blend(
+                    "certhelper.Type", runtype=condition[1], reco=condition[2]
+                ),
+                pixel="Good",
+                sistrip=condition[3],
+                tracking="Good",
+                date=condition[4],
+            )
+
+        runs = RunInfo.objects.filter(date__lte="2018-05-31")
+        with django_assert_max_num_queries(2):
+            summary = runs.summary_per_day()
+
+        assert [d["day"] for d in summary] == [2, 3, 1, 2]
+        assert summary[0]["run_numbers"] == {
+            "good": [2],
+            "bad": [3],
+            "missing": [],
+            "different_flags": [1],
+        }
+        assert summary[1]["run_numbers"]["different_flags"] == [1]
+        assert summary[1]["run_numbers"]["good"] == [2]
+        # run 4 was certified bad outside of the filtered runs
+        assert summary[2]["run_numbers"]["different_flags"] == [4]
+        assert summary[3]["run_numbers"]["different_flags"] == [4]
+
+        for d in summary:
+            run_numbers = runs.filter(
+                date=d["date"], type__runtype=d["type__runtype"], type__reco=d["type__reco"]
+            ).run_numbers()
+            assert d["run_numbers"] == runs.compare_list_if_certified(run_numbers)
+
     def test_get_queryset(self):
         mixer.blend("certhelper.RunInfo", run_number=123456)
         mixer.blend("certhelper.RunInfo", run_number=234567)
@@ -333,6 +426,16 @@ class TestRunInfoManager:
         assert cosmics["changed_good"] == []
         assert cosmics["changed_bad"] == [14]
 
+    def test_check_if_certified_number_of_queries(
+        self, some_certified_runs, django_assert_num_queries
+    ):
+        with django_assert_num_queries(1):
+            check = RunInfo.objects.check_if_certified(list(range(5000)))
+
+        assert check["missing"] == [0, 8, 9] + list(range(15, 5000))
+        assert check["collisions"]["changed_bad"] == [4]
+        assert check["cosmics"]["prompt_missing"] == [10, 12, 13]
+
     def test_check_integrity_of_run(self):
         """
         Checks if the given run has any inconsistencies with already certified runs.
@@ -1,10 +1,13 @@
+from io import StringIO
+
 import pytest
 from allauth.socialaccount.models import SocialAccount
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from mixer.backend.django import mixer
 
-from certhelper.models import RunInfo, UserProfile
+from certhelper.models import RunInfo, UserProfile, FlagChangedRun
 
 pytestmark = pytest.mark.django_db
 
@@ -417,3 +420,77 @@ class TestRuninfo:
             mixer.blend(
                 "certhelper.RunInfo", run_number=123456, type=t, reference_run=ref
             )
+
+
+class TestFlagChangedRun:
+    def certify(self, run_number, reco, date, sistrip="Good"):
+        return mixer.blend(
+            "certhelper.RunInfo",
+            run_number=run_number,
+            type__runtype="Collisions",
+            type__reco=reco,
+            pixel="Good",
+            sistrip=sistrip,
+            tracking="Good",
+            date=date,
+        )
+
+    def changed_run_numbers(self):
+        return list(FlagChangedRun.objects.values_list("run_number", flat=True))
+
+    def test_save(self):
+        self.certify(1, "Express", "2018-05-14")
+        run = self.certify(1, "Prompt", "2018-05-16")
+        self.certify(2, "Express", "2018-05-14", sistrip="Bad")
+        assert self.changed_run_numbers() == []
+
+        run.sistrip = "Bad"
+        run.save()
+        assert self.changed_run_numbers() == [1]
+        assert str(FlagChangedRun.objects.get().changed_on) == "2018-05-16"
+
+        run.run_number = 2
+        run.save()
+        assert self.changed_run_numbers() == []
+
+    def test_delete_and_restore(self):
+        self.certify(1, "Express", "2018-05-14")
+        run = self.certify(1, "Prompt", "2018-05-16", sistrip="Bad")
+        assert self.changed_run_numbers() == [1]
+
+        run.delete()
+        assert self.changed_run_numbers() == []
+        run.restore()
+        assert self.changed_run_numbers() == [1]
+
+        RunInfo.objects.filter(type__reco="Prompt").delete()
+        assert self.changed_run_numbers() == []
+        RunInfo.all_objects.dead().restore()
+        assert self.changed_run_numbers() == [1]
+
+        run.hard_delete()
+        assert self.changed_run_numbers() == []
+
+    def test_filter_flag_changed_until(self):
+        self.certify(1, "Express", "2018-05-14")
+        self.certify(1, "Prompt", "2018-05-16", sistrip="Bad")
+        self.certify(2, "Express", "2018-05-14", sistrip="Bad")
+        self.certify(2, "Prompt", "2018-05-15")
+
+        runs = RunInfo.objects.all()
+        assert runs.filter_flag_changed(until="2018-05-14").run_numbers() == []
+        assert runs.filter_flag_changed(until="2018-05-15").run_numbers() == [2]
+        assert runs.filter_flag_changed(until="2018-05-16").run_numbers() == [1, 2]
+        assert runs.filter_flag_changed().run_numbers() == [1, 2]
+
+    def test_rebuild_command(self):
+        self.certify(1, "Express", "2018-05-14")
+        self.certify(1, "Prompt", "2018-05-16", sistrip="Bad")
+        self.certify(2, "Express", "2018-05-14")
+        FlagChangedRun.objects.all().delete()
+        FlagChangedRun.objects.create(run_number=2, changed_on="2018-05-14")
+
+        call_command("rebuild_flag_changed_index", stdout=StringIO())
+
+        assert self.changed_run_numbers() == [1]
+        assert str(FlagChangedRun.objects.get().changed_on) == "2018-05-16"
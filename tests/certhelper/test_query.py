@@ -1,9 +1,24 @@
 import math
+from io import StringIO
+from unittest.mock import patch
+
 import pytest
+from django.core.management import call_command
+from django.db.models import QuerySet
 from mixer.backend.django import mixer
 
-from certhelper.models import RunInfo, ReferenceRun, Type
+from certhelper.cache import ReportCache
+from certhelper.models import (
+    RunInfo,
+    ReferenceRun,
+    Type,
+    RunRegistryComparison,
+    RunFillNumber,
+    LHCFill,
+)
+from certhelper.query import RunInfoQuerySet
 from certhelper.utilities.utilities import to_date, to_weekdayname, uniquely_sorted
+from runregistry.client import RunRegistryUnavailableError
 from tests.utils.utilities import create_runs
 
 pytestmark = pytest.mark.django_db
@@ -125,6 +140,23 @@ class TestRunInfoQuerySet:
         assert set([7777, 888, "abde"]) == set(d["missing"])
         assert set([4321, 333]) == set(d["different_flags"])
 
+    def test_compare_list_if_certified_number_of_queries(
+        self, some_certified_runs, django_assert_max_num_queries
+    ):
+        list_of_run_numbers = [14, 1, "2", 0, 1, 4, "x", None, 11, 6, 5] * 100
+
+        with django_assert_max_num_queries(2):
+            d = RunInfo.objects.all().compare_list_if_certified(list_of_run_numbers)
+
+        assert d["good"] == [1, "2", 1, 11] * 100
+        assert d["bad"] == [6] * 100
+        assert d["missing"] == [0, "x", None] * 100
+        assert d["different_flags"] == [14, 4, 5] * 100
+
+        # runs certified only once in the queryset keep their flag
+        d = RunInfo.objects.filter(type__reco="Prompt").compare_list_if_certified([4, 6])
+        assert d == {"good": [], "bad": [4, 6], "missing": [], "different_flags": []}
+
     def test_changed_flags(self, some_certified_runs):
         """
         run     type       reco    good
@@ -256,6 +288,28 @@ class TestRunInfoQuerySet:
         assert 19 == RunInfo.objects.all().total_number()
         assert len(RunInfo.objects.all()) == RunInfo.objects.all().total_number()
 
+    def test_stats(self, django_assert_num_queries):
+        mixer.blend("certhelper.RunInfo", int_luminosity="13", number_of_ls=10)
+        mixer.blend("certhelper.RunInfo", int_luminosity="12.2", number_of_ls=5)
+
+        with django_assert_num_queries(1):
+            stats = RunInfo.objects.all().stats()
+        assert stats == {
+            "total_number": 2,
+            "lumisections": 15,
+            "integrated_luminosity": 25.2,
+        }
+
+        with django_assert_num_queries(1):
+            stats = RunInfo.objects.filter(run_number=-1).stats()
+        assert stats == {"total_number": 0, "lumisections": 0, "integrated_luminosity": 0}
+
+    def test_stats_empty(self):
+        runs = RunInfo.objects.all()
+        assert runs.total_number() == 0
+        assert runs.lumisections() == 0
+        assert runs.integrated_luminosity() == 0
+
     def test_slr(self, runs_for_slr):
         runs = RunInfo.objects.all()
 
@@ -427,3 +481,409 @@ class TestRunInfoQuerySet:
 
         assert len(runs)
         assert len(runs.trackermap_missing()) == 2
+
+
+def run_registry_entry(run_number, pixel="GOOD"):
+    return {
+        "run_number": run_number,
+        "run_class": "Collisions18",
+        "dataset": "/Express/Collisions2018/DQM",
+        "state": "COMPLETED",
+        "shifter": "shifter",
+        "pixel": pixel,
+        "sistrip": "GOOD",
+        "tracking": "GOOD",
+        "pixel_lowstat": False,
+        "sistrip_lowstat": False,
+        "tracking_lowstat": False,
+    }
+
+
+class TestStoredStatus:
+    def test_save(self):
+        run = mixer.blend(
+            "certhelper.RunInfo",
+            type__runtype="Cosmics",
+            type__reco="Prompt",
+            pixel="Bad",
+            sistrip="Good",
+            tracking="Lowstat",
+        )
+        assert ("Cosmics", "Prompt", "good") == (run.runtype, run.reco, run.status)
+
+        run.tracking = "Excluded"
+        run.save()
+        assert "bad" == RunInfo.objects.get().status
+
+    def test_update(self, some_certified_runs):
+        runs = RunInfo.objects.filter(run_number=4)
+        assert runs.filter_flag_changed().exists()
+
+        runs.filter(status="bad").update(sistrip="Good")
+
+        assert ["good", "good"] == list(runs.values_list("status", flat=True))
+        assert not runs.filter_flag_changed().exists()
+
+    def test_type_changed(self):
+        run_type = mixer.blend("certhelper.Type", runtype="Collisions", reco="Express")
+        mixer.blend(
+            "certhelper.RunInfo",
+            type=run_type,
+            pixel="Bad",
+            sistrip="Good",
+            tracking="Good",
+        )
+        assert "bad" == RunInfo.objects.get().status
+
+        run_type.runtype = "Cosmics"
+        run_type.save()
+
+        run = RunInfo.objects.get()
+        assert ("Cosmics", "good") == (run.runtype, run.status)
+
+    def test_bulk_create(self):
+        run = mixer.blend("certhelper.RunInfo", type__runtype="Collisions", pixel="Bad")
+        run.pk = None
+        run.status = run.runtype = ""
+        RunInfo.objects.bulk_create([run])
+
+        assert [("Collisions", "bad")] * 2 == list(
+            RunInfo.objects.values_list("runtype", "status")
+        )
+
+    def test_restore(self):
+        run = mixer.blend(
+            "certhelper.RunInfo",
+            type__runtype="Collisions",
+            pixel="Good",
+            sistrip="Good",
+            tracking="Good",
+        )
+        run.delete()
+        run.type.delete()
+        # runs that were deleted before the status was stored
+        QuerySet(RunInfo).update(runtype="", reco="", status="")
+
+        RunInfo.all_objects.dead().restore()
+
+        assert [run] == list(RunInfo.objects.good().collisions())
+
+    def test_no_join(self):
+        for runs in [
+            RunInfo.objects.good(),
+            RunInfo.objects.bad(),
+            RunInfo.objects.all().annotate_status().collisions().prompt(),
+        ]:
+            sql = str(runs.query)
+            assert "JOIN" not in sql
+            assert "CASE" not in sql
+
+
+class TestCompareWithRunRegistry:
+    def get_runs_by_list(self, run_numbers):
+        if 3 in run_numbers:
+            raise RunRegistryUnavailableError("Run Registry not reachable")
+        return [
+            run_registry_entry(run_number, "BAD" if run_number == 5 else "GOOD")
+            for run_number in run_numbers
+        ]
+
+    def test_chunks_are_fetched_in_parallel(self, monkeypatch):
+        create_runs(7, 1, "Collisions", "Express", good=True)
+        RunInfo.objects.update(pixel_lowstat=False, sistrip_lowstat=False)
+        monkeypatch.setattr(RunInfoQuerySet, "RUN_REGISTRY_CHUNK_SIZE", 2)
+
+        with patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=self.get_runs_by_list,
+        ) as get_runs_by_list:
+            diff, failed_run_numbers = RunInfo.objects.all().diff_with_run_registry()
+
+        assert 4 == get_runs_by_list.call_count
+        # run 5 is bad in the Run Registry, runs 3 and 4 can not be compared
+        assert [5] == [run[0] for run, corresponding in diff]
+        assert "Bad" == diff[0][1][0][3]
+        assert {3, 4} == failed_run_numbers
+
+    def test_failed_chunks_are_not_reported_as_matching(self, monkeypatch):
+        create_runs(7, 1, "Collisions", "Express", good=True)
+        RunInfo.objects.update(pixel_lowstat=False, sistrip_lowstat=False)
+        monkeypatch.setattr(RunInfoQuerySet, "RUN_REGISTRY_CHUNK_SIZE", 2)
+        runs = RunInfo.objects.filter(run_number__in=[3, 4])
+
+        with patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=self.get_runs_by_list,
+        ):
+            with pytest.raises(RunRegistryUnavailableError):
+                runs.compare_with_run_registry()
+            with pytest.raises(RunRegistryUnavailableError):
+                runs.matches_with_run_registry()
+
+    def test_single_chunk(self):
+        create_runs(3, 5, "Collisions", "Express", good=True)
+        RunInfo.objects.update(pixel_lowstat=False, sistrip_lowstat=False)
+
+        with patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=self.get_runs_by_list,
+        ):
+            deviating, corresponding = RunInfo.objects.all().compare_with_run_registry()
+
+        assert [5] == [run["run_number"] for run in deviating]
+        assert 1 == len(corresponding)
+
+    def test_stored_comparison(self, monkeypatch):
+        create_runs(7, 1, "Collisions", "Express", good=True)
+        RunInfo.objects.update(pixel_lowstat=False, sistrip_lowstat=False)
+        monkeypatch.setattr(RunInfoQuerySet, "RUN_REGISTRY_CHUNK_SIZE", 2)
+        runs = RunInfo.objects.all()
+
+        with patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=self.get_runs_by_list,
+        ):
+            assert 5 == RunRegistryComparison.objects.refresh(runs)
+
+        assert [5] == runs.run_registry_mismatches().run_numbers()
+        # runs 3 and 4 could not be compared
+        assert [3, 4] == runs.not_compared_with_run_registry().run_numbers()
+
+        runs.filter(run_number=5).update(pixel="Bad")
+        run = RunInfo.objects.get(run_number=1)
+        run.pixel_lowstat = True
+        run.save()
+        runs.filter(run_number=2).update(comment="does not change the comparison")
+        run = RunInfo.objects.get(run_number=6)
+        run.comment = "does not change the comparison either"
+        run.save()
+        assert [] == runs.run_registry_mismatches().run_numbers()
+        assert [1, 3, 4, 5] == runs.not_compared_with_run_registry().run_numbers()
+
+    def test_compare_with_run_registry_command(self):
+        create_runs(3, 5, "Collisions", "Express", good=True)
+        RunInfo.objects.update(pixel_lowstat=False, sistrip_lowstat=False)
+
+        with patch(
+            "certhelper.management.commands.compare_with_run_registry"
+            ".TrackerRunRegistryClient.is_available",
+            return_value=True,
+        ), patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=self.get_runs_by_list,
+        ) as get_runs_by_list:
+            out = StringIO()
+            call_command("compare_with_run_registry", stdout=out)
+            assert "Compared 3 certified runs, 1 runs" in out.getvalue()
+
+            # recently compared runs are skipped
+            call_command("compare_with_run_registry", stdout=StringIO())
+            assert 1 == get_runs_by_list.call_count
+
+            call_command("compare_with_run_registry", "--all", stdout=StringIO())
+            assert 2 == get_runs_by_list.call_count
+
+    def test_refresh_in_background(self):
+        runs = RunInfo.objects.all()
+
+        class Thread:
+            def __init__(self, target, daemon):
+                self.target = target
+
+            def start(self):
+                self.target()
+
+        with patch("certhelper.manager.threading.Thread", Thread), patch(
+            "certhelper.manager.connections"
+        ), patch.object(RunRegistryComparison.objects, "refresh") as refresh:
+            assert RunRegistryComparison.objects.refresh_in_background(runs)
+            assert refresh.called
+
+            with RunRegistryComparison.objects._background_lock:
+                assert not RunRegistryComparison.objects.refresh_in_background(runs)
+
+    def test_refresh_in_background_query_fails(self):
+        runs = RunInfo.objects.all()
+        with patch.object(
+            RunInfoQuerySet, "values_list", side_effect=RuntimeError
+        ), pytest.raises(RuntimeError):
+            RunRegistryComparison.objects.refresh_in_background(runs)
+        assert not RunRegistryComparison.objects._background_lock.locked()
+
+
+class TestAnnotateFillNumber:
+    FILLS = {1: 7048, 2: 7048, 3: 7052, 5: None}
+
+    def get_fill_number_by_run_number(self, run_numbers):
+        # run 4 is unknown to the Run Registry
+        return [
+            {"run_number": run_number, "fill_number": self.FILLS[run_number]}
+            for run_number in run_numbers
+            if run_number in self.FILLS
+        ]
+
+    def patch_run_registry(self, **kwargs):
+        return patch(
+            "runregistry.client.TrackerRunRegistryClient.get_fill_number_by_run_number",
+            **kwargs
+        )
+
+    def test_annotate_fill_number(self):
+        create_runs(5, 1, "Collisions", "Express")
+        create_runs(2, 1, "Collisions", "Prompt")
+
+        with self.patch_run_registry(
+            side_effect=self.get_fill_number_by_run_number
+        ) as get_fill_number:
+            runs = RunInfo.objects.all().annotate_fill_number()
+            fills = {(run.run_number, run.fill_number) for run in runs.iterator()}
+        assert fills == {(1, 7048), (2, 7048), (3, 7052), (4, None), (5, None)}
+        get_fill_number.assert_called_once_with([1, 2, 3, 4, 5])
+        # run 4 is stored without fill, so that it is not asked again
+        assert 5 == RunFillNumber.objects.count()
+
+        with self.patch_run_registry(
+            side_effect=self.get_fill_number_by_run_number
+        ) as get_fill_number:
+            runs = RunInfo.objects.filter(run_number__lte=3).annotate_fill_number()
+            assert [7052, 7048, 7048, 7048, 7048] == [run.fill_number for run in runs]
+        assert not get_fill_number.called
+
+    def test_run_registry_unavailable(self):
+        create_runs(2, 1, "Collisions", "Express")
+
+        with self.patch_run_registry(side_effect=RunRegistryUnavailableError):
+            runs = RunInfo.objects.all().annotate_fill_number()
+            assert [None, None] == [run.fill_number for run in runs]
+        assert not RunFillNumber.objects.exists()
+
+    def test_resolve(self):
+        RunFillNumber.objects.create(
+            run_number=1, fill=LHCFill.objects.create(fill_number=7000)
+        )
+
+        with self.patch_run_registry(
+            side_effect=self.get_fill_number_by_run_number
+        ) as get_fill_number:
+            fills = RunFillNumber.objects.resolve([3, 1, 4, 3])
+        assert fills == {1: 7000, 3: 7052, 4: None}
+        get_fill_number.assert_called_once_with([3, 4])
+
+    def test_fills_are_stored(self):
+        create_runs(5, 1, "Collisions", "Express")
+
+        with self.patch_run_registry(side_effect=self.get_fill_number_by_run_number):
+            assert 3 == LHCFill.objects.sync(RunInfo.objects.all())
+        assert ["7048", "7052"] == [str(fill) for fill in LHCFill.objects.all()]
+        assert [1, 2] == sorted(
+            LHCFill.objects.get(fill_number=7048).runs.values_list(
+                "run_number", flat=True
+            )
+        )
+        # run 4 is unknown to the Run Registry
+        assert [] == RunInfo.objects.all().without_fill_number().run_numbers()
+        assert RunFillNumber.objects.get(run_number=4).fill is None
+
+    def test_sync_invalidates_reports(self):
+        create_runs(1, 1, "Collisions", "Express")
+        version = ReportCache.version()
+
+        with self.patch_run_registry(return_value=[]):
+            LHCFill.objects.sync(RunInfo.objects.all())
+        assert version == ReportCache.version()
+
+        with self.patch_run_registry(side_effect=self.get_fill_number_by_run_number):
+            LHCFill.objects.sync(RunInfo.objects.all(), recheck=True)
+        assert version != ReportCache.version()
+
+    def test_sync_in_background(self):
+        create_runs(2, 1, "Collisions", "Express")
+        RunFillNumber.objects.create(run_number=1)
+        runs = RunInfo.objects.all()
+
+        class Thread:
+            def __init__(self, target, daemon):
+                self.target = target
+
+            def start(self):
+                self.target()
+
+        with patch("certhelper.manager.threading.Thread", Thread), patch(
+            "certhelper.manager.connections"
+        ), patch.object(RunFillNumber.objects, "fetch") as fetch:
+            assert LHCFill.objects.sync_in_background(runs)
+            fetch.assert_called_once_with([2])
+
+            with LHCFill.objects._background_lock:
+                assert not LHCFill.objects.sync_in_background(runs)
+
+    def test_sync_in_background_query_fails(self):
+        runs = RunInfo.objects.all()
+        with patch.object(
+            RunInfoQuerySet, "without_fill_number", side_effect=RuntimeError
+        ), pytest.raises(RuntimeError):
+            LHCFill.objects.sync_in_background(runs)
+        assert not LHCFill.objects._background_lock.locked()
+
+    def test_sync_lhc_fills_command(self):
+        create_runs(5, 1, "Collisions", "Express")
+
+        with patch(
+            "certhelper.management.commands.sync_lhc_fills"
+            ".TrackerRunRegistryClient.is_available",
+            return_value=True,
+        ), self.patch_run_registry(
+            side_effect=self.get_fill_number_by_run_number
+        ) as get_fill_number:
+            out = StringIO()
+            call_command("sync_lhc_fills", stdout=out)
+            assert "Stored the fills of 3 runs, 2 fills are known" in out.getvalue()
+
+            call_command("sync_lhc_fills", stdout=StringIO())
+            assert 1 == get_fill_number.call_count
+
+            # the runs without fill are only asked again on request
+            call_command("sync_lhc_fills", "--recheck", stdout=StringIO())
+            get_fill_number.assert_called_with([4, 5])
+
+
+class TestPerFill:
+    def test_per_fill(self, django_assert_num_queries):
+        fill = LHCFill.objects.create(fill_number=7048)
+        for run_number in (1, 2, 3):
+            RunFillNumber.objects.create(run_number=run_number, fill=fill)
+        RunFillNumber.objects.create(
+            run_number=4, fill=LHCFill.objects.create(fill_number=7052)
+        )
+        # run 5 has no fill and the fill of run 6 is not known yet
+        RunFillNumber.objects.create(run_number=5)
+        create_runs(6, 1, "Collisions", "Express")
+        create_runs(2, 1, "Collisions", "Prompt")
+        runs = RunInfo.objects.all()
+
+        with django_assert_num_queries(1):
+            per_fill = runs.per_fill("reco")
+
+        assert [(7048, "Express"), (7048, "Prompt"), (7052, "Express")] == [
+            (row["fill_number"], row["reco"]) for row in per_fill
+        ]
+        for row in per_fill:
+            expected = runs.filter(
+                run_number__in=fill.runs.values("run_number")
+                if row["fill_number"] == 7048
+                else [4],
+                reco=row["reco"],
+            )
+            assert row["number_of_runs"] == expected.total_number()
+            assert row["lumisections"] == expected.lumisections()
+            assert row["integrated_luminosity"] == pytest.approx(
+                expected.integrated_luminosity()
+            )
+
+    def test_per_fill_without_fills(self):
+        create_runs(2, 1, "Collisions", "Express")
+        with patch(
+            "runregistry.client.TrackerRunRegistryClient.get_fill_number_by_run_number"
+        ) as get_fill_number:
+            assert [] == RunInfo.objects.all().per_fill()
+        assert not get_fill_number.called
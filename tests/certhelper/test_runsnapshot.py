@@ -0,0 +1,98 @@
+from array import array
+
+import pytest
+
+from certhelper.models import RunInfo, RunFillNumber, LHCFill
+from certhelper.utilities.RunSnapshot import RunSnapshot
+from certhelper.utilities.utilities import to_date
+from tests.utils.utilities import create_runs
+
+pytestmark = pytest.mark.django_db
+
+
+class TestRunSnapshot:
+    def test_columns(self, runs_for_slr, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            snapshot = RunInfo.objects.all().snapshot()
+
+        assert len(snapshot) == 19
+        assert isinstance(snapshot.run_numbers, array)
+        assert snapshot.run_numbers.typecode == "I"
+        assert snapshot.int_luminosity.typecode == "d"
+        assert snapshot.codes["reco"].typecode == "H"
+        assert sorted(snapshot.values["reco"]) == ["Express", "Prompt"]
+        assert snapshot.values["date"][0] == to_date("2018-05-14")
+
+    def test_select(self, runs_for_slr, django_assert_num_queries):
+        runs = RunInfo.objects.all()
+        snapshot = runs.snapshot()
+
+        for runtype in ("Collisions", "Cosmics"):
+            for reco in ("Express", "Prompt"):
+                for status in ("good", "bad"):
+                    criteria = {"runtype": runtype, "reco": reco, "status": status}
+                    with django_assert_num_queries(0):
+                        selection = snapshot.select(criteria)
+                        stats = selection.stats()
+                        run_numbers = selection.run_numbers()
+
+                    expected = runs.filter(**criteria)
+                    assert stats["total_number"] == expected.total_number()
+                    assert stats["lumisections"] == expected.lumisections()
+                    assert stats["integrated_luminosity"] == pytest.approx(
+                        expected.integrated_luminosity()
+                    )
+                    assert run_numbers == expected.run_numbers()
+
+    def test_select_day(self, runs_for_slr):
+        snapshot = RunInfo.objects.all().snapshot()
+        day = snapshot.select({"date": to_date("2018-05-14")})
+        assert day.total_number() == 8
+        assert snapshot.select({}).values("date") == [
+            to_date("2018-05-14"),
+            to_date("2018-05-15"),
+            to_date("2018-05-17"),
+            to_date("2018-05-18"),
+            to_date("2018-05-20"),
+        ]
+        assert snapshot.select({"date": to_date("2018-05-14")}) is day
+
+    def test_unknown_value(self, runs_for_slr):
+        snapshot = RunInfo.objects.all().snapshot()
+        selection = snapshot.select({"reco": "reReco"})
+        assert len(selection) == 0
+        assert selection.run_numbers() == []
+        assert selection.stats() == {
+            "total_number": 0,
+            "lumisections": 0,
+            "integrated_luminosity": 0,
+        }
+
+    def test_changed_until(self):
+        create_runs(2, 1, "Collisions", "Express", date="2018-05-14")
+        create_runs(1, 2, "Collisions", "Prompt", date="2018-05-15")
+        create_runs(1, 1, "Collisions", "Prompt", good=False, date="2018-05-15")
+
+        snapshot = RunInfo.objects.all().snapshot()
+        assert len(snapshot.select({"changed_until": to_date("2018-05-14")})) == 0
+        changed = snapshot.select({"changed_until": to_date("2018-05-15")})
+        assert changed.run_numbers() == [1]
+
+    def test_fill_numbers(self, django_assert_num_queries):
+        create_runs(3, 1, "Collisions", "Express")
+        fill = LHCFill.objects.create(fill_number=7048)
+        RunFillNumber.objects.create(run_number=1, fill=fill)
+        RunFillNumber.objects.create(run_number=2, fill=fill)
+        RunFillNumber.objects.create(run_number=3)
+
+        with django_assert_num_queries(1):
+            snapshot = RunInfo.objects.all().snapshot()
+        fills = dict(zip(snapshot.run_numbers, snapshot.fill_numbers))
+        assert fills == {1: 7048, 2: 7048, 3: 0}
+        assert snapshot.select({}).fill_numbers() == [7048]
+        assert snapshot.select({}).run_numbers_per_fill() == {7048: [1, 2]}
+
+    def test_empty(self):
+        snapshot = RunSnapshot([])
+        assert len(snapshot) == 0
+        assert snapshot.select({"reco": "Express"}).total_number() == 0
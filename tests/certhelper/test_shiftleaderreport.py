@@ -1,7 +1,10 @@
 import math
+from unittest.mock import patch
+
 import pytest
+from django.template.loader import render_to_string
 
-from certhelper.models import RunInfo
+from certhelper.models import RunInfo, RunFillNumber, LHCFill
 from certhelper.utilities.ShiftLeaderReport import ShiftLeaderReport
 from certhelper.utilities.utilities import to_date
 from tests.utils.utilities import create_runs
@@ -254,3 +257,69 @@ class TestShiftLeaderReport:
         assert [26, 27] == days[2].express().cosmics().run_numbers()
         assert [10, 11, 15, 16] == days[1].prompt().collisions().run_numbers()
         assert [30, 31, 35, 36] == days[0].prompt().cosmics().run_numbers()
+
+    def test_flag_changed(self):
+        create_runs(2, 1, "Collisions", "Express", good=True, date="2018-05-14")
+        create_runs(1, 1, "Collisions", "Prompt", good=False, date="2018-05-15")
+        create_runs(1, 2, "Collisions", "Prompt", good=True, date="2018-05-15")
+
+        days = ShiftLeaderReport(RunInfo.objects.all()).day_by_day()
+
+        assert days[0].flag_changed().total_number() == 0
+        assert days[1].flag_changed().total_number() == 1
+        assert days[1].flag_changed().bad().run_numbers() == [1]
+        assert days[1].flag_changed().good().run_numbers() == []
+
+    def test_number_of_queries(self, runs_for_slr, django_assert_num_queries):
+        fill = LHCFill.objects.create(fill_number=7048)
+        for run_number in RunInfo.objects.all().collisions().run_numbers():
+            RunFillNumber.objects.create(run_number=run_number, fill=fill)
+
+        with django_assert_num_queries(1):
+            report = ShiftLeaderReport(RunInfo.objects.all())
+
+        # the fills of all four tables are aggregated in a single query
+        with django_assert_num_queries(1), patch(
+            "runregistry.client.TrackerRunRegistryClient.execute_query"
+        ) as execute_query:
+            html = render_to_string(
+                "certhelper/components/shift-leader-report.html", {"slreport": report}
+            )
+
+        assert not execute_query.called
+        assert "Monday" in html
+        assert "7048" in html
+
+    def test_fills(self):
+        create_runs(3, 1, "Collisions", "Express", date="2018-05-14")
+        create_runs(2, 1, "Collisions", "Prompt", good=False, date="2018-05-15")
+        create_runs(1, 4, "Cosmics", "Express", date="2018-05-15")
+        fills = {1: 7048, 2: 7048, 3: 7052, 4: 7052}
+        for run_number, fill_number in fills.items():
+            fill, created = LHCFill.objects.get_or_create(fill_number=fill_number)
+            RunFillNumber.objects.create(run_number=run_number, fill=fill)
+        runs = RunInfo.objects.all()
+        report = ShiftLeaderReport(runs)
+
+        express = report.collisions().express()
+        assert [7048, 7052] == express.fill_numbers()
+        assert [[1, 2], [3]] == [fill["run_number"] for fill in express.fills()]
+        assert [2, 1] == [fill["number_of_runs"] for fill in express.fills()]
+        first = runs.filter(run_number__in=[1, 2]).express()
+        assert express.fills()[0]["lumisections"] == first.lumisections()
+        assert express.fills()[0]["integrated_luminosity"] == pytest.approx(
+            first.integrated_luminosity()
+        )
+
+        assert [7048] == report.collisions().prompt().fill_numbers()
+        assert [7052] == report.cosmics().fill_numbers()
+        assert [7048, 7052] == [fill["fill_number"] for fill in report.fills()]
+        assert [[1, 2], [3, 4]] == [fill["run_number"] for fill in report.fills()]
+
+        days = report.day_by_day()
+        assert [7048, 7052] == days[0].fill_numbers()
+        assert [7048] == days[1].collisions().fill_numbers()
+        assert [[1, 2]] == [
+            fill["run_number"] for fill in days[1].collisions().bad().fills()
+        ]
+        assert [] == report.cosmics().prompt().fills()
@@ -106,3 +106,32 @@ class TestSummaryReport:
         assert "| Type 4 | Sum of LS | Sum of int. luminosity |" in sums[3]
         assert "| Bad    | 2091      | 0" in sums[3]
         assert "| Good   | 341       | 0" in sums[3]
+
+    def test_number_of_queries(
+        self, shifter, runs_for_summary_report, django_assert_num_queries
+    ):
+        with django_assert_num_queries(1):
+            summary = SummaryReport(RunInfo.objects.all())
+            sections = summary.sections()
+        assert 4 == len(sections["refs"])
+        assert 4 == len(sections["sums"])
+
+    def test_deleted_type(self, shifter, runs_for_summary_report):
+        RunInfo.objects.get(run_number=300001, type__reco="Express").type.delete()
+
+        summary = SummaryReport(RunInfo.objects.all())
+
+        runs_checked = summary.runs_checked_per_type()
+        assert 3 == len(runs_checked)
+        assert "Type 1: Prompt Collisions" in runs_checked[0]
+        assert 3 == len(summary.sum_of_quantities_per_type())
+
+    def test_empty(self):
+        summary = SummaryReport(RunInfo.objects.none())
+        assert summary.sections() == {
+            "refs": [],
+            "runs": [],
+            "tk_maps": [],
+            "certified_runs": [],
+            "sums": [],
+        }
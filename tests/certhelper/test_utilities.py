@@ -1,12 +1,17 @@
+import threading
+import time
+import types
 from decimal import Decimal
 
 import pytest
+import requests
 from django.contrib.auth.models import User
 from django.test import RequestFactory, TestCase
 from mixer.backend.django import mixer
 
 from certhelper.models import RunInfo, UserProfile
 from certhelper.utilities.utilities import *
+from runregistry.client import RunRegistryUnavailableError
 
 pytestmark = pytest.mark.django_db
 
@@ -296,3 +301,84 @@ class TestCreateUserProfile(TestCase):
         # UserProfile instances should be automatically created for new Users
         user = mixer.blend(User)
         assert user.userprofile
+
+
+class TestFetchInChunks:
+    def test_results_are_merged_in_order(self):
+        results, failed = fetch_in_chunks(list(range(10)), lambda chunk: chunk, 3)
+        assert [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]] == results
+        assert [] == failed
+
+    def test_failed_chunks_are_isolated(self):
+        def fetch(chunk):
+            if 4 in chunk:
+                raise RunRegistryUnavailableError("chunk failed")
+            if 7 in chunk:
+                raise requests.Timeout("chunk timed out")
+            return sum(chunk)
+
+        results, failed = fetch_in_chunks(list(range(10)), fetch, 3)
+        assert [3, 9] == results
+        assert [[3, 4, 5], [6, 7, 8]] == failed
+
+    def test_other_errors_are_raised(self):
+        def fetch(chunk):
+            if 4 in chunk:
+                raise ValueError("bug")
+            return chunk
+
+        with pytest.raises(ValueError):
+            fetch_in_chunks(list(range(10)), fetch, 3)
+
+    def test_number_of_workers_is_bounded(self):
+        lock = threading.Lock()
+        running = []
+        maximum = []
+
+        def fetch(chunk):
+            with lock:
+                running.append(chunk)
+                maximum.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(chunk)
+            return chunk
+
+        results, failed = fetch_in_chunks(list(range(20)), fetch, 2, max_workers=3)
+        assert 10 == len(results)
+        assert 1 < max(maximum) <= 3
+
+    def test_empty_list(self):
+        assert ([], []) == fetch_in_chunks([], lambda chunk: chunk, 3)
+
+
+class TestDiffWithRunRegistry:
+    def test_diff(self):
+        run_info = [
+            (1, "Collisions", "Express", "Good"),
+            (1, "Collisions", "Prompt", "Good"),
+            (2, "Cosmics", "Express", "Good"),
+            (3, "Cosmics", "Express", "Bad"),
+        ]
+        run_registry = [
+            (1, "Collisions", "Express", "Good"),
+            (1, "Collisions", "Prompt", "Bad"),
+            (1, "Collisions", "Prompt", "Excluded"),
+            (2, "Cosmics", "Prompt", "Good"),
+        ]
+
+        diff = diff_with_run_registry(run_info, run_registry)
+        assert isinstance(diff, types.GeneratorType)
+        diff = list(diff)
+
+        assert [run for run, corresponding in diff] == run_info[1:]
+        assert sorted(diff[0][1]) == [
+            (1, "Collisions", "Prompt", "Bad"),
+            (1, "Collisions", "Prompt", "Excluded"),
+        ]
+        assert [] == diff[1][1]
+        assert [] == diff[2][1]
+
+    def test_no_differences(self):
+        runs = [(1, "Collisions", "Express", "Good")]
+        assert [] == list(diff_with_run_registry(runs, runs))
@@ -1,10 +1,20 @@
+import gzip
+import json
 import types
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from mixer.backend.django import mixer
 
+from certhelper.models import RunFillNumber, ReportVersion
+from certhelper.utilities.export import RUN_EXPORT_FIELDS
 from certhelper.views import *
 
 pytestmark = pytest.mark.django_db
@@ -48,6 +58,30 @@ def get_view_response(view, req):
     return view.as_view()(req)
 
 
+def count_rendering_queries(view, req):
+    """
+    :return: number of queries needed to create and render the response
+    """
+    with CaptureQueriesContext(connection) as context, patch(
+        "certhelper.views.TrackerRunRegistryClient.is_available", return_value=False
+    ):
+        resp = view(req)
+        if hasattr(resp, "render"):
+            resp.render()
+    assert resp.status_code == 200
+    return len(context.captured_queries)
+
+
+def create_runs(user, number_of_runs, first_run_number):
+    for run_number in range(first_run_number, first_run_number + number_of_runs):
+        mixer.blend(
+            "certhelper.RunInfo",
+            userid=user,
+            run_number=run_number,
+            date="2018-06-13",
+        )
+
+
 def test_authentication():
     assert_view_requires_no_login(listruns)
     assert_view_requires_no_login(logout_status)
@@ -212,6 +246,212 @@ class TestListRuns:
         assert resp.status_code == 200
 
 
+    def test_run_registry_unavailable(self):
+        req = RequestFactory().get("/?date=2018-06-13")
+        req.user = mixer.blend(User)
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=False
+        ), patch(
+            "certhelper.query.RunInfoQuerySet.compare_with_run_registry"
+        ) as compare_with_run_registry:
+            resp = get_view_response(listruns, req)
+        assert resp.status_code == 200
+        assert not compare_with_run_registry.called
+
+
+    @pytest.mark.parametrize("authenticated", [True, False])
+    def test_constant_number_of_queries(self, authenticated):
+        user = mixer.blend(User)
+        req = RequestFactory().get("/?date=2018-06-13")
+        req.user = user if authenticated else AnonymousUser()
+
+        create_runs(user, 2, 300000)
+        count_rendering_queries(listruns, req)  # fills the caches
+        queries = count_rendering_queries(listruns, req)
+        create_runs(user, 10, 300002)
+        assert count_rendering_queries(listruns, req) == queries
+
+
+    def test_stored_run_registry_comparison(self):
+        user = mixer.blend(User)
+        run = mixer.blend(
+            "certhelper.RunInfo", userid=user, run_number=300000, date="2018-06-13"
+        )
+        mixer.blend("certhelper.RunInfo", userid=user, date="2018-06-13")
+        RunRegistryComparison.objects.create(
+            run_info=run, matches=False, checked_at=timezone.now()
+        )
+        req = RequestFactory().get("/?date=2018-06-13")
+        req.user = user
+
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available"
+        ) as is_available, patch(
+            "certhelper.query.RunInfoQuerySet.compare_with_run_registry"
+        ) as compare_with_run_registry:
+            resp = get_view_response(listruns, req)
+
+        assert not is_available.called
+        assert not compare_with_run_registry.called
+        content = resp.content.decode()
+        assert "Please update the following runs" in content
+        assert "<b>300000</b>" in content
+        # the second run has not been compared yet
+        assert "ajax/refresh-run-registry-comparison" in content
+
+    def test_refresh_run_registry_comparison(self):
+        user = mixer.blend(User)
+        mixer.blend("certhelper.RunInfo", userid=user, date="2018-06-13")
+        mixer.blend("certhelper.RunInfo", date="2018-06-13")
+        req = RequestFactory().post("/ajax/refresh-run-registry-comparison/")
+        req.user = user
+
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=True
+        ), patch.object(
+            RunRegistryComparison.objects, "refresh_in_background", return_value=True
+        ) as refresh_in_background:
+            resp = refresh_run_registry_comparison(req)
+
+        assert resp.status_code == 202
+        runs = refresh_in_background.call_args[0][0]
+        assert [user] == [run.userid for run in runs]
+
+
+class TestShiftLeaderView:
+    def test_table_constant_number_of_queries(self):
+        """
+        The summaries next to the table are covered in their own tests
+        """
+        user = mixer.blend(User)
+        req = RequestFactory().get("/shiftleader/?date__gte=2018-06-13")
+        req.user = user
+
+        def count_table_queries():
+            view = ShiftLeaderView(request=req, args=(), kwargs={})
+            view.filterset = view.get_filterset(view.get_filterset_class())
+            view.object_list = view.filterset.qs
+            table = view.get_table()
+            with CaptureQueriesContext(connection) as context:
+                table.as_html(req)
+            return len(context.captured_queries)
+
+        create_runs(user, 2, 300000)
+        queries = count_table_queries()
+        create_runs(user, 10, 300002)
+        assert count_table_queries() == queries
+
+
+class TestShiftLeaderPanels:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        cache.clear()
+        self.user = mixer.blend(User)
+
+    def get_panel(self, panel, query_string="date__gte=2018-06-13"):
+        req = RequestFactory().get(
+            "/shiftleader/panels/{}/?{}".format(panel, query_string)
+        )
+        req.user = self.user
+        return shiftleader_panel_view(req, panel)
+
+    def test_page_does_not_compute_panels(self):
+        req = RequestFactory().get("/shiftleader/?date__gte=2018-06-13")
+        req.user = mixer.blend(User)
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available"
+        ) as is_available, patch("certhelper.views.ShiftLeaderReport") as report:
+            resp = shiftleader_view(req)
+            resp.render()
+        assert resp.status_code == 200
+        assert not is_available.called
+        assert not report.called
+        assert b"shiftleader/panels/report/?date__gte=2018-06-13" in resp.content
+
+    @pytest.mark.parametrize(
+        "panel, content",
+        [
+            ("summary", "Reference Runs"),
+            ("report", "Shift Leader Report"),
+            ("deleted-runs", "List of deleted certified runs"),
+            ("run-registry-comparison", "Run Registry unavailable"),
+        ],
+    )
+    def test_panels(self, panel, content):
+        create_runs(self.user, 2, 300000)
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=False
+        ), patch("certhelper.manager.LHCFillManager.sync_in_background"):
+            resp = self.get_panel(panel)
+        assert resp.status_code == 200
+        assert content in resp.content.decode()
+
+    def test_unknown_panel(self):
+        with pytest.raises(Http404):
+            self.get_panel("unknown")
+
+    def test_cached_until_runs_change(self, django_assert_num_queries):
+        run = mixer.blend("certhelper.RunInfo", run_number=300000, date="2018-06-13")
+        assert "300000" not in self.get_panel("deleted-runs").content.decode()
+
+        # only the version of the certifications is read from the database
+        with django_assert_num_queries(1):
+            self.get_panel("deleted-runs")
+
+        run.delete()
+        assert "300000" in self.get_panel("deleted-runs").content.decode()
+
+    def test_cached_per_filter(self):
+        mixer.blend("certhelper.RunInfo", run_number=300000, date="2018-06-13")
+        with patch("certhelper.manager.LHCFillManager.sync_in_background"):
+            assert "Week 24" in self.get_panel("report").content.decode()
+            html = self.get_panel("report", "date__gte=2018-06-14").content.decode()
+        assert "No runs have been certified" in html
+
+    def test_report_syncs_missing_fills(self):
+        mixer.blend("certhelper.RunInfo", run_number=300000, date="2018-06-13")
+        with patch(
+            "certhelper.manager.LHCFillManager.sync_in_background"
+        ) as sync_in_background:
+            self.get_panel("report")
+        assert sync_in_background.called
+
+        RunFillNumber.objects.create(run_number=300000)
+        cache.clear()
+        with patch(
+            "certhelper.manager.LHCFillManager.sync_in_background"
+        ) as sync_in_background:
+            self.get_panel("report")
+        assert not sync_in_background.called
+
+    def test_run_registry_unavailable_is_not_cached(self):
+        mixer.blend("certhelper.RunInfo", run_number=300000, date="2018-06-13")
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=False
+        ):
+            self.get_panel("run-registry-comparison")
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=True
+        ), patch(
+            "certhelper.query.RunInfoQuerySet.compare_with_run_registry",
+            return_value=([], []),
+        ) as compare_with_run_registry:
+            html = self.get_panel("run-registry-comparison").content.decode()
+        assert compare_with_run_registry.called
+        assert "Run Registry unavailable" not in html
+
+    def test_failed_run_registry_comparison(self):
+        mixer.blend("certhelper.RunInfo", run_number=300000, date="2018-06-13")
+        with patch(
+            "certhelper.views.TrackerRunRegistryClient.is_available", return_value=True
+        ), patch(
+            "certhelper.query.TrackerRunRegistryClient.get_runs_by_list",
+            side_effect=RunRegistryUnavailableError,
+        ):
+            html = self.get_panel("run-registry-comparison").content.decode()
+        assert "Run Registry unavailable" in html
+
+
 class TestSummaryView:
     def test_no_filters(self):
         req = RequestFactory().get("/")
@@ -248,6 +488,84 @@ class TestSummaryView:
         resp = get_view_response(summaryView, req)
         assert resp.status_code == 200
 
+    def test_cached_per_user_and_filter(self):
+        cache.clear()
+        user = mixer.blend(User)
+        other_user = mixer.blend(User)
+        create_runs(user, 2, 316000)
+        create_runs(other_user, 1, 317000)
+
+        def get_summary(user, url="/?date=2018-06-13"):
+            req = RequestFactory().get(url)
+            req.user = user
+            with CaptureQueriesContext(connection) as context:
+                content = summaryView(req).content.decode("utf-8")
+            return content, len(context.captured_queries)
+
+        content, number_of_queries = get_summary(user)
+        assert "316000" in content
+        assert "317000" not in content
+
+        cached_content, cached_number_of_queries = get_summary(user)
+        assert cached_content == content
+        assert cached_number_of_queries < number_of_queries
+
+        content, _ = get_summary(other_user)
+        assert "317000" in content
+        assert "316000" not in content
+
+        content, _ = get_summary(user, "/?date=2018-06-14")
+        assert "316000" not in content
+
+        create_runs(user, 1, 316005)
+        content, _ = get_summary(user)
+        assert "316005" in content
+
+    def test_cache_invalidated_by_other_process(self):
+        cache.clear()
+        user = mixer.blend(User)
+        create_runs(user, 1, 316000)
+        req = RequestFactory().get("/?date=2018-06-13")
+        req.user = user
+        assert "changed by another process" not in summaryView(req).content.decode()
+
+        # another process changes the run and increments the shared version,
+        # the signals of this process do not see the change
+        QuerySet.update(RunInfo.objects.all(), comment="changed by another process")
+        ReportVersion.objects.increment()
+        assert "changed by another process" in summaryView(req).content.decode()
+
+
+class TestComputeLuminosityView:
+    def test_luminosity_tables(self):
+        user = mixer.blend(User)
+        express = mixer.blend("certhelper.Type", runtype="Collisions", reco="Express")
+        for run_number, luminosity, pixel in [
+            (316000, "1.5", "Good"),
+            (316001, "2", "Bad"),
+        ]:
+            mixer.blend(
+                "certhelper.RunInfo",
+                type=express,
+                run_number=run_number,
+                int_luminosity=luminosity,
+                number_of_ls=10,
+                pixel=pixel,
+                sistrip="Good",
+                tracking="Good",
+            )
+
+        req = RequestFactory().get("/?run_number__gte=316000")
+        req.user = user
+        resp = ComputeLuminosityView.as_view()(req)
+        resp.render()
+        content = resp.content.decode("utf-8")
+        assert "Collisions Express" in content
+        assert "Collisions Prompt" not in content
+        assert '<td align="center">20</td>' in content
+        assert '<td align="center">3.5</td>' in content
+        assert '<td align="center">1.5</td>' in content
+
 
 class TestHardDeleteView:
     def test_authentication(self):
@@ -306,3 +624,174 @@ class TestHardDeleteView:
         req.user = mixer.blend(User, is_staff=True)
         with pytest.raises(Http404):
             hard_deleteview(req, 42)
+
+
+def get_streamed_content(resp):
+    content = b"".join(resp.streaming_content)
+    if resp.get("Content-Encoding") == "gzip":
+        content = gzip.decompress(content)
+    return content.decode("utf-8")
+
+
+class TestJsonExports:
+    @pytest.fixture
+    def staff(self):
+        return mixer.blend(User, is_staff=True)
+
+    def get(self, view, user, url="/", **extra):
+        req = RequestFactory().get(url, **extra)
+        req.user = user
+        return view(req)
+
+    def test_runs_json(self, staff):
+        create_runs(staff, 3, 316000)
+        resp = self.get(runs_json, staff)
+        assert resp.streaming
+        assert resp["Content-Type"] == "application/json"
+        runs = json.loads(get_streamed_content(resp))
+        assert sorted(run["run_number"] for run in runs) == [316000, 316001, 316002]
+        assert set(runs[0]) == set(RUN_EXPORT_FIELDS)
+
+    def test_runs_json_empty(self, staff):
+        assert json.loads(get_streamed_content(self.get(runs_json, staff))) == []
+
+    def test_runs_ndjson(self, staff):
+        create_runs(staff, 3, 316000)
+        resp = self.get(runs_json, staff, "/?format=ndjson")
+        assert resp["Content-Type"] == "application/x-ndjson"
+        lines = get_streamed_content(resp).splitlines()
+        run_numbers = sorted(json.loads(line)["run_number"] for line in lines)
+        assert run_numbers == [316000, 316001, 316002]
+
+    def test_gzip(self, staff):
+        create_runs(staff, 3, 316000)
+        resp = self.get(runs_json, staff, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        assert resp["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in resp["Vary"]
+        assert len(json.loads(get_streamed_content(resp))) == 3
+
+        resp = self.get(runs_json, staff)
+        assert not resp.has_header("Content-Encoding")
+        assert "Accept-Encoding" in resp["Vary"]
+
+    def test_problem_runs_json(self, staff):
+        parent = Category.objects.create(name="Pixel", slug="pixel")
+        child = Category.objects.create(name="Noise", slug="noise", parent=parent)
+        other = Category.objects.create(name="Strips", slug="strips")
+        create_runs(staff, 3, 316000)
+        RunInfo.objects.get(run_number=316000).problem_categories.add(child, other)
+        RunInfo.objects.get(run_number=316002).problem_categories.add(parent)
+
+        runs = json.loads(get_streamed_content(self.get(problem_runs_json, staff)))
+        runs.sort(key=lambda run: run["run_number"])
+        assert [run["run_number"] for run in runs] == [316000, 316002]
+        run = runs[0]
+        categories = Category.objects.filter(pk__in=run["problem_ids"])
+        assert sorted(run["problem_names"]) == sorted(str(c) for c in categories)
+        assert "Pixel > Noise" in run["problem_names"]
+        assert runs[1]["problem_names"] == ["Pixel"]
+
+    @pytest.mark.parametrize("view", [runs_json, problem_runs_json])
+    def test_constant_number_of_queries(self, view, staff):
+        category = Category.objects.create(name="Pixel", slug="pixel")
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                get_streamed_content(self.get(view, staff))
+            return len(context.captured_queries)
+
+        create_runs(staff, 2, 316000)
+        for run in RunInfo.objects.all():
+            run.problem_categories.add(category)
+        number_of_queries = count_queries()
+
+        create_runs(staff, 20, 317000)
+        for run in RunInfo.objects.all():
+            run.problem_categories.add(category)
+        assert count_queries() == number_of_queries
+
+
+class TestProblemsJson:
+    @pytest.fixture
+    def staff(self):
+        cache.clear()
+        return mixer.blend(User, is_staff=True)
+
+    def get(self, user, **extra):
+        req = RequestFactory().get("/", **extra)
+        req.user = user
+        return problems_json(req)
+
+    def test_problems_json(self, staff):
+        parent = Category.objects.create(name="Pixel", slug="pixel")
+        child = Category.objects.create(name="Noise", slug="noise", parent=parent)
+        Category.objects.create(name="Strips", slug="strips")
+        create_runs(staff, 3, 316000)
+        for run in RunInfo.objects.filter(run_number__in=[316000, 316002]):
+            run.problem_categories.add(child)
+        RunInfo.objects.get(run_number=316002).delete()
+
+        categories = json.loads(self.get(staff).content.decode("utf-8"))
+        assert len(categories) == 3
+        for category in categories:
+            expected = Category.objects.get(id=category["id"])
+            assert category["full_display_name"] == str(expected)
+            assert category["runs"] == [
+                list(run)
+                for run in expected.runinfo_set.all().values_list(
+                    "run_number", "type__reco"
+                )
+            ]
+        noise = next(c for c in categories if c["id"] == child.id)
+        assert noise["runs"] == [[316000, RunInfo.objects.get(run_number=316000).reco]]
+
+    def test_constant_number_of_queries(self, staff):
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.get(staff)
+            return len(context.captured_queries)
+
+        parent = Category.objects.create(name="Pixel", slug="pixel")
+        create_runs(staff, 2, 316000)
+        number_of_queries = count_queries()
+
+        for index in range(10):
+            category = Category.objects.create(
+                name="Problem {}".format(index), slug="problem-{}".format(index)
+            )
+            Category.objects.create(
+                name="Detail {}".format(index),
+                slug="detail-{}".format(index),
+                parent=category,
+            )
+        create_runs(staff, 10, 317000)
+        for run in RunInfo.objects.all():
+            run.problem_categories.add(parent, category)
+        assert count_queries() == number_of_queries
+
+    def test_etag(self, staff):
+        Category.objects.create(name="Pixel", slug="pixel")
+        resp = self.get(staff)
+        assert resp.status_code == 200
+        etag = resp["ETag"]
+
+        resp = self.get(staff, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == 304
+
+        create_runs(staff, 1, 316000)
+        resp = self.get(staff, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == 200
+        assert resp["ETag"] != etag
+        etag = resp["ETag"]
+
+        Category.objects.create(name="Strips", slug="strips")
+        assert self.get(staff, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_etag_changed_by_other_process(self, staff):
+        etag = self.get(staff)["ETag"]
+        # another process only shares the database, not the cache
+        ReportVersion.objects.increment()
+        cache.clear()
+        resp = self.get(staff, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == 200
+        assert resp["ETag"] != etag
@@ -113,6 +113,25 @@ class TestShiftLeader:
         assert "Weekly Certification" in weekly_report
         assert "Prompt-Reco: total number=" in weekly_report
 
+    def test_weekly_certification_validates_central_certification_list(
+        self, live_server, firefox, shiftleader, wait
+    ):
+        create_recent_run(315539)
+        firefox.get("{}".format(live_server.url))
+        try_to_login_user(firefox, SHIFTLEADER_USERNAME, PASSWORD)
+        wait_until(firefox.find_element_by_link_text, "Shift Leader")
+        firefox.find_element_by_link_text("Shift Leader").click()
+        # the input is part of the report panel, which is loaded after the page
+        wait.until(EC.presence_of_element_located((By.ID, "id-cc-input")))
+        firefox.find_element_by_link_text("Weekly Certification").click()
+
+        firefox.find_element_by_id("id-cc-input").send_keys("315539, 123456")
+        wait.until(EC.text_to_be_present_in_element((By.ID, "id-cc-legend"), "Legend"))
+
+        assert "315539" in firefox.find_element_by_id("id-cc-span").text
+        assert "123456" in firefox.find_element_by_id("id-cc-span").text
+        assert "MISSING" in firefox.find_element_by_id("id-cc-legend").text
+
     def test_shift_leader_report_weekly(
         self, live_server, firefox, shiftleader, wait, runs_for_slr
     ):
@@ -0,0 +1,54 @@
+"""
+Inspects the query plans of querysets to catch queries that fall back to
+sequential scans, e.g. because an index was dropped or a filter changed.
+
+Supports SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (EXPLAIN). PostgreSQL
+prefers sequential scans on small tables, so sequential scans are disabled
+while the plan is created. A sequential scan in the plan then means that no
+usable index exists.
+
+Example:
+>>> sequential_scans(RunInfo.objects.filter(run_number=321177))
+set()
+"""
+import re
+
+from django.db import connections
+
+
+def explain(queryset):
+    """
+    :return: list of the lines of the query plan
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+    raise NotImplementedError(
+        "Query plans are not supported for {}".format(connection.vendor)
+    )
+
+
+def sequential_scans(queryset):
+    """
+    :return: set of the tables that are read with a sequential scan
+    """
+    scans = set()
+    for line in explain(queryset):
+        # SQLite: "SCAN certhelper_runinfo", "SCAN TABLE certhelper_runinfo" or
+        # "SCAN certhelper_runinfo USING INDEX ..." (a full index scan), while
+        # lookups that use an index are reported as "SEARCH ..."
+        match = re.match(r"\s*SCAN (?:TABLE )?(\w+)", line)
+        if match and match.group(1) not in ("SUBQUERY", "CONSTANT"):
+            scans.add(match.group(1))
+        # PostgreSQL: "Seq Scan on certhelper_runinfo  (cost=...)"
+        match = re.search(r"Seq Scan on (\w+)", line)
+        if match:
+            scans.add(match.group(1))
+    return scans
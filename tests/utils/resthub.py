@@ -0,0 +1,269 @@
+"""
+Local stand-in for the resthub server behind the Run Registry
+
+Only implements the small subset of the API that is used by the RunRegistryClient:
+
+GET  /                      connection test
+POST /query?                returns a query id (qid) for the SQL query in the body
+GET  /query/{qid}/data      returns the rows of the query as JSON
+
+Example:
+>>> with FakeResthubServer(rows=[[321177, 7048]]) as server:
+...     client = RunRegistryClient(url=server.url)
+"""
+import hashlib
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class FakeResthubRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is needed, otherwise every response closes the connection
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.resthub.register_connection()
+
+    def log_message(self, format, *args):
+        pass  # keep the test output clean
+
+    def do_GET(self):
+        resthub = self.server.resthub
+        if not resthub.before_request("GET", self.path):
+            return self.respond(500, "Internal Server Error")
+
+        if self.path == "/":
+            return self.respond(200, "resthub")
+
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "query" and parts[2] == "data":
+            query = resthub.queries.get(parts[1])
+            if query is None:
+                return self.respond(404, "Query {} not found".format(parts[1]))
+            data = {"data": resthub.get_rows(query)}
+            return self.respond(200, json.dumps(data), "application/json")
+
+        return self.respond(404, "Not found")
+
+    def do_POST(self):
+        resthub = self.server.resthub
+        length = int(self.headers.get("Content-Length", 0))
+        query = self.rfile.read(length).decode("utf-8")
+        if not resthub.before_request("POST", self.path):
+            return self.respond(500, "Internal Server Error")
+
+        if self.path.startswith("/query"):
+            qid = hashlib.md5(query.encode("utf-8")).hexdigest()[:12]
+            if resthub.remember_queries:
+                resthub.queries[qid] = query
+            return self.respond(200, qid)
+
+        return self.respond(404, "Not found")
+
+    def respond(self, status_code, body, content_type="text/plain"):
+        encoded = body.encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeResthubServer:
+    """
+    Runs a fake resthub server in a background thread on a random local port
+
+    :param rows: list of rows, or function query -> rows, returned for every query
+    :param latency: seconds every request is delayed before it is answered
+    """
+
+    def __init__(self, rows=None, latency=0):
+        self.rows = rows if rows is not None else []
+        self.latency = latency
+        self.failures = 0
+        self.queries = {}
+        # False to answer every query with "404 Not Found", like a broken resthub
+        self.remember_queries = True
+        self.connections = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), FakeResthubRequestHandler)
+        self._server.resthub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def register_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def before_request(self, method, path):
+        """
+        Records the request, applies the latency and decides whether the
+        request should fail
+
+        :return: False if the request should be answered with an error
+        """
+        with self._lock:
+            self.requests.append((method, path))
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        if self.latency:
+            time.sleep(self.latency)
+        return not fail
+
+    def fail_next(self, number_of_requests=1):
+        """
+        Answers the next requests with a "500 Internal Server Error"
+        """
+        with self._lock:
+            self.failures += number_of_requests
+
+    def forget_queries(self):
+        """
+        Drops all known query ids, like resthub does after a restart
+        """
+        self.queries.clear()
+
+    def get_rows(self, query):
+        if callable(self.rows):
+            return self.rows(query)
+        return self.rows
+
+    def count_requests(self, method=None, path_prefix=""):
+        return len(
+            [
+                request
+                for request in self.requests
+                if (method is None or request[0] == method)
+                and request[1].startswith(path_prefix)
+            ]
+        )
+
+
+class FakeTrackerRunRegistry:
+    """
+    Answers the queries of the TrackerRunRegistryClient for a small set of runs,
+    to be used as rows function of the FakeResthubServer
+
+    Example:
+    >>> run_registry = FakeTrackerRunRegistry()
+    >>> run_registry.add_run(321177, fill_number=7048, state="OPEN")
+    >>> server = FakeResthubServer(rows=run_registry)
+    """
+
+    def __init__(self):
+        self.runs = {}
+        self.fill_numbers = {}
+
+    def add_run(
+        self,
+        run_number,
+        fill_number=None,
+        state="COMPLETED",
+        run_class="Collisions18",
+        dataset="/Express/Collisions2018/DQM",
+        pixel="GOOD",
+        sistrip="GOOD",
+        tracking="GOOD",
+        section_count=10,
+    ):
+        """
+        Adds a dataset of the run, call again to add more datasets of the same run
+        """
+        self.fill_numbers[run_number] = fill_number
+        self.runs.setdefault(run_number, []).append(
+            {
+                "run_class": run_class,
+                "dataset": dataset,
+                "state": state,
+                "pixel": pixel,
+                "sistrip": sistrip,
+                "tracking": tracking,
+                "section_count": section_count,
+            }
+        )
+
+    @staticmethod
+    def _matches(query, number):
+        in_list = re.search(r" in \(([^)]*)\)", query)
+        if in_list:
+            return str(number) in re.findall(r"'(\d+)'", in_list.group(1))
+        in_range = re.search(r">= '(\d+)' and \S+ <= '(\d+)'", query)
+        if in_range:
+            return int(in_range.group(1)) <= number <= int(in_range.group(2))
+        return True
+
+    def _datasets(self, query):
+        for run_number in sorted(self.runs):
+            if self._matches(query, run_number):
+                for dataset in self.runs[run_number]:
+                    yield run_number, dataset
+
+    def __call__(self, query):
+        if "max(r.runnumber)" in query:
+            return [[max(self.runs)]] if self.runs else [[None]]
+
+        if "runreg_tracker.runs r" in query:
+            if "r.lhcfill in" in query:
+                return [
+                    [fill_number, run_number]
+                    for run_number, fill_number in sorted(self.fill_numbers.items())
+                    if fill_number is not None and self._matches(query, fill_number)
+                ]
+            return [
+                [run_number, self.fill_numbers[run_number]]
+                for run_number in sorted(self.runs)
+                if self._matches(query, run_number)
+            ]
+
+        if "dataset_lumis l, runreg_tracker.datasets r" in query:
+            return [
+                [run_number, d["run_class"], d["dataset"], d["section_count"], d["state"],
+                 "shifter", d["pixel"], d["sistrip"], d["tracking"], None, None, None]
+                for run_number, d in self._datasets(query)
+            ]
+
+        if "runreg_tracker.dataset_lumis r" in query:
+            return [
+                [run_number, self.fill_numbers[run_number], d["dataset"], 1,
+                 d["section_count"], d["section_count"]] + [1] * 11
+                for run_number, d in self._datasets(query)
+            ]
+
+        if "runreg_tracker.datasets r" in query:
+            return [
+                [run_number, d["run_class"], d["dataset"], d["state"], "shifter",
+                 d["pixel"], d["sistrip"], d["tracking"], None, None, None]
+                for run_number, d in self._datasets(query)
+            ]
+
+        return []